@@ -1,4 +1,212 @@
+import numpy as np
 import pandas as pd
+from profiling import profiled
+
+def _stop_loss_candidates(returns, in_trade, stop_loss):
+    """
+    (starts, ends, limits) of the trades whose running P&L might breach
+    `stop_loss` (a scalar, or one limit per bar), from one cumsum screen.
+    """
+    edges = np.diff(np.concatenate(([0], in_trade.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    limits = np.broadcast_to(np.asarray(stop_loss, dtype=float), returns.shape)[starts]
+    if not len(starts):
+        return starts, ends, limits
+    # Cheap screen: only trades whose running P&L gets near the stop need a closer look
+    cs = np.cumsum(np.where(in_trade, returns, 0.0))
+    base = np.concatenate(([0.0], cs))[starts]
+    trade_min = np.minimum.reduceat(cs, starts) - base
+    tol = 1e-9 * (1 + np.abs(cs).max())
+    candidates = trade_min < limits + tol
+    return starts[candidates], ends[candidates], limits[candidates]
+
+def _step_trades(returns, starts, ends, limits, block=256):
+    """
+    Stop bars of the trades [starts[k], ends[k]): each trade's running P&L from
+    its start, reset after every bar where it drops below limits[k].
+    All trades advance together, up to `block` bars per step: a step accumulates the
+    carried P&L and the next bars of every open trade row by row (np.cumsum adds
+    in order), so the sums, and the bars they hit, are exactly those of a
+    bar-by-bar loop.
+    """
+    stops = np.zeros(len(returns), dtype=bool)
+    pos, ends, limits = starts.copy(), ends.copy(), np.asarray(limits, dtype=float).copy()
+    run = np.zeros(len(pos))
+    while len(pos):
+        # steps sized to the typical open trade, so short trades aren't padded out
+        step = int(min(block, 2 ** np.ceil(np.log2(np.median(ends - pos)))))
+        idx = pos[:, None] + np.arange(step)
+        valid = idx < ends[:, None]
+        sums = np.cumsum(np.concatenate([run[:, None], np.where(valid, returns[np.minimum(idx, len(returns) - 1)], 0.0)],
+                                        axis=1), axis=1)[:, 1:]
+        below = (sums < limits[:, None]) & valid
+        hit = below.any(axis=1)
+        first = below.argmax(axis=1)
+        stops[pos[hit] + first[hit]] = True
+        # a hit restarts the trade's P&L on the next bar; otherwise carry it over the step
+        run = np.where(hit, 0.0, sums[:, -1])
+        pos = np.where(hit, pos + first + 1, pos + step)
+        open_ = pos < ends
+        pos, ends, limits, run = pos[open_], ends[open_], limits[open_], run[open_]
+    return stops
+
+def _stop_loss_bars(returns, in_trade, stop_loss):
+    """
+    Bars where the running P&L of the current trade drops below `stop_loss`.
+    The running P&L resets after each hit and whenever the position is flat.
+    """
+    return _step_trades(returns, *_stop_loss_candidates(returns, in_trade, stop_loss))
+
+def _stop_loss_scan(returns, in_trade, stop_loss):
+    """
+    `_stop_loss_bars` for a 2-D batch (`stop_loss` scalar or one per column).
+    Columns are laid end to end with a flat bar between them, so one cumsum
+    screen covers the whole batch and only the trades it flags are stepped through.
+    """
+    n, k = returns.shape
+    flat = np.zeros((n + 1, k))
+    flat[:n] = returns
+    flat_in_trade = np.zeros((n + 1, k), dtype=bool)
+    flat_in_trade[:n] = in_trade
+    limits = np.repeat(np.broadcast_to(np.asarray(stop_loss, dtype=float), (k,)), n + 1)
+    stops = _stop_loss_bars(flat.ravel(order='F'), flat_in_trade.ravel(order='F'), limits)
+    return stops.reshape((n + 1, k), order='F')[:n]
+
+def backtest_arrays(y, x, position, beta, tc=0.001, stop_loss=-0.05, vol_window=20, vol=None, net_legs=None):
+    """
+    Array engine behind `backtest`; inputs are never modified.
+      - `y`, `x`: 1-D price arrays for the two legs, or 2-D with one column per
+        position column (a different pair per column)
+      - `position`: 1-D array (1, -1 or 0), or 2-D with one column per strategy
+      - `beta`: hedge ratio, scalar or one value per bar (1-D); 2-D for one per column
+        (each column is then sized on the vol of its own spread)
+      - `vol`: optional precomputed rolling spread std used for sizing
+      - `stop_loss`: scalar, or one value per position column for a 2-D batch
+      - `net_legs(pos_y, pos_x)`: optional hook returning per-bar cost multipliers
+        for each leg's trades (see `portfolio_backtest`); stops are still decided
+        on the unscaled costs
+    Returns (`returns`, `position`) with the stop-loss applied, shaped like `position`.
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    position = np.asarray(position)
+    beta = np.asarray(beta, dtype=float)
+    batch = position.ndim == 2
+    col = (lambda a: a[:, None] if a.ndim == 1 else a) if batch else (lambda a: a)
+    if beta.ndim == 1:
+        beta = col(beta)
+
+    # Per-bar inputs shared by every position vector
+    if vol is None:
+        if y.ndim == 2 or (beta.ndim == 2 and beta.shape[1] > 1):
+            # a β per column gives every column its own spread, so its own sizing vol
+            spread = col(y) - beta * col(x)
+            vol = np.ascontiguousarray(pd.DataFrame(spread).rolling(vol_window).std().to_numpy())
+        else:
+            spread = y - (beta[:, 0] if beta.ndim == 2 else beta) * x
+            vol = pd.Series(spread).rolling(vol_window).std().to_numpy()
+    inv_vol = col(1 / vol)  # Inverse volatility for sizing
+    ret_y, ret_x = np.full_like(y, np.nan), np.full_like(x, np.nan)
+    ret_y[1:] = y[1:] / y[:-1] - 1
+    ret_x[1:] = x[1:] / x[:-1] - 1
+    y, x, ret_y, ret_x = col(y), col(x), col(ret_y), col(ret_x)
+
+    def pnl(pos, net_legs=None):
+        pos_y = pos * inv_vol
+        pos_x = -beta * pos_y
+        gross = np.full(pos_y.shape, np.nan)
+        cost = np.full(pos_y.shape, np.nan)
+        gross[1:] = pos_y[:-1] * ret_y[1:] + pos_x[:-1] * ret_x[1:]
+        trade_y, trade_x = np.abs(np.diff(pos_y, axis=0)), np.abs(np.diff(pos_x, axis=0))
+        if net_legs is None:
+            cost[1:] = (trade_y * y[1:] + trade_x * x[1:]) * tc
+        else:
+            scale_y, scale_x = net_legs(pos_y, pos_x)
+            cost[1:] = (trade_y * y[1:] * scale_y + trade_x * x[1:] * scale_x) * tc
+        net = gross - cost
+        return np.where(np.isnan(net), 0.0, net)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = pnl(position)
+        # Stop-loss: flatten the bars where the trade's running P&L breaches the limit
+        in_trade = position != 0
+        if batch:
+            stops = _stop_loss_scan(returns, in_trade, stop_loss)
+        else:
+            stops = _stop_loss_bars(returns, in_trade, stop_loss)
+        if stops.any():
+            position = np.where(stops, 0, position)
+        if stops.any() or net_legs is not None:
+            returns = pnl(position, net_legs)
+    return returns, position
+
+@profiled('backtest', rows=lambda out: len(out[0]))
+def run_backtest(prices, position, beta, tc=0.001, stop_loss=-0.05):
+    """
+    Same as `backtest` but takes the position Series directly and also returns
+    the position after stop-loss exits: (`returns`, `cum_returns`, `position`).
+    """
+    returns, pos = backtest_arrays(
+        prices.iloc[:, 0].to_numpy(),
+        prices.iloc[:, 1].to_numpy(),
+        np.asarray(position),
+        beta,
+        tc=tc,
+        stop_loss=stop_loss
+    )
+    returns = pd.Series(returns, index=prices.index)
+    return returns, returns.cumsum(), pd.Series(pos, index=prices.index, name='position')
+
+@profiled('backtest', rows=lambda out: out[0].size)
+def portfolio_backtest(prices, pairs, position, beta, tc=0.001, stop_loss=-0.05, vol_window=20):
+    """
+    Backtest many pairs at once on one aligned price frame:
+      - `prices`: DataFrame of closes, one column per ticker
+      - `pairs`: list of (y, x) tickers, one per position column
+      - `position`: (bars, pairs) raw positions (1, -1 or 0)
+      - `beta`: one hedge ratio per pair, or a (bars, pairs) array
+      - `stop_loss`: one limit for every pair, or one per pair
+    Each pair is sized and stopped out on its own P&L, as in `backtest_arrays`.
+    Legs are then netted per ticker before costs, so trades in the same ticker on
+    the same bar (e.g. XOM in several pairs) only pay for the net change. The
+    netted cost is split over the pairs in proportion to what each traded, so
+    pairs that share no tickers get exactly their standalone returns.
+    Returns (`pair_returns` DataFrame, `portfolio_returns` Series, `position` DataFrame).
+    """
+    tickers = {t: k for k, t in enumerate(prices.columns)}
+    iy = np.array([tickers[t] for t, _ in pairs], dtype=int)
+    ix = np.array([tickers[t] for _, t in pairs], dtype=int)
+    values = prices.to_numpy(dtype=float)
+    y, x = values[:, iy], values[:, ix]
+    beta = np.asarray(beta, dtype=float)
+    if beta.ndim < 2:
+        beta = np.broadcast_to(beta, (1, len(pairs)))
+
+    # legs sorted by ticker, so per-ticker sums are one reduceat over columns
+    legs = np.concatenate([iy, ix])
+    order = np.argsort(legs, kind='stable')
+    used, starts = np.unique(legs[order], return_index=True)
+    back = np.searchsorted(used, legs)
+
+    def net_legs(pos_y, pos_x):
+        # unsized (NaN) legs hold nothing
+        pos = np.nan_to_num(np.hstack([pos_y, pos_x]))[:, order]
+        traded = np.add.reduceat(np.abs(np.diff(pos, axis=0)), starts, axis=1)
+        net = np.abs(np.diff(np.add.reduceat(pos, starts, axis=1), axis=0))
+        # share of each ticker's traded volume that survives netting
+        ratio = np.where(traded > 0, net / traded, 1.0)[:, back]
+        return ratio[:, :len(pairs)], ratio[:, len(pairs):]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # pandas hands back column-major blocks; row-major keeps the passes below fast
+        vol = np.ascontiguousarray(pd.DataFrame(y - beta * x).rolling(vol_window).std().to_numpy())
+    returns, position = backtest_arrays(y, x, np.asarray(position), beta, tc=tc, stop_loss=stop_loss,
+                                        vol=vol, net_legs=net_legs)
+
+    names = [f"{t1},{t2}" for t1, t2 in pairs]
+    pair_returns = pd.DataFrame(returns, index=prices.index, columns=names)
+    portfolio = pd.Series(returns.sum(axis=1), index=prices.index, name='portfolio')
+    return pair_returns, portfolio, pd.DataFrame(position, index=prices.index, columns=names)
 
 def backtest(prices, signals, beta, tc=0.001, stop_loss=-0.05):
     """
@@ -8,56 +216,17 @@ def backtest(prices, signals, beta, tc=0.001, stop_loss=-0.05):
       - `beta`: hedge ratio for sizing the second leg
       - `tc`: transaction cost per traded dollar volume
       - `stop_loss`: exit if trade P&L drops below this threshold
+    `signals` is left untouched; use `run_backtest` to get the stopped-out position.
     Returns:
       - `returns`: Series of period P&L after costs
       - `cum_returns`: Series of cumulative P&L
     """
-    # Compute spread volatility for position sizing
-    spread = prices.iloc[:,0] - beta * prices.iloc[:,1]
-    vol = spread.rolling(20).std()
-    inv_vol = 1 / vol  # Inverse volatility for sizing
-    pos_y = signals['position'] * inv_vol
-    pos_x = -beta * pos_y
-
-    # Gross returns
-    ret_y = pos_y.shift(1) * prices.iloc[:,0].pct_change()
-    ret_x = pos_x.shift(1) * prices.iloc[:,1].pct_change()
-    gross = ret_y + ret_x
-
-    # Transaction costs
-    trade_y = (pos_y.diff().abs() * prices.iloc[:,0])
-    trade_x = (pos_x.diff().abs() * prices.iloc[:,1])
-    cost = (trade_y + trade_x) * tc
-
-    # Net returns
-    returns = (gross - cost).fillna(0)
-    
-    # Apply stop-loss
-    cum_trade = 0
-    for i, r in returns.items():
-        if signals['position'][i] != 0:
-            cum_trade += r
-            if cum_trade < stop_loss:
-                signals.at[i, 'position'] = 0  # Exit trade
-                cum_trade = 0
-        else:
-            cum_trade = 0
-    # Recalculate after stop-loss
-    pos_y = signals['position'] * inv_vol
-    pos_x = -beta * pos_y
-    ret_y = pos_y.shift(1) * prices.iloc[:,0].pct_change()
-    ret_x = pos_x.shift(1) * prices.iloc[:,1].pct_change()
-    gross = ret_y + ret_x
-    trade_y = (pos_y.diff().abs() * prices.iloc[:,0])
-    trade_x = (pos_x.diff().abs() * prices.iloc[:,1])
-    cost = (trade_y + trade_x) * tc
-    returns = (gross - cost).fillna(0)
-    cum_returns = returns.cumsum()
+    returns, cum_returns, _ = run_backtest(prices, signals['position'], beta, tc, stop_loss)
     return returns, cum_returns
 
 if __name__ == '__main__':
     import yaml
-    from strat import generate_signals
+    from strat import generate_signals, build_position, fit_hedge, hedge_kwargs
     from data_fetch import fetch_prices
 
     cfg = yaml.safe_load(open('config.yml'))
@@ -67,18 +236,10 @@ if __name__ == '__main__':
         prices,
         lookback=cfg['strategy']['lookback'],
         z_enter=cfg['strategy']['z_enter'],
-        z_exit=cfg['strategy']['z_exit']
+        z_exit=cfg['strategy']['z_exit'],
+        beta=fit_hedge(prices, **hedge_kwargs(cfg))
     )
-    pos, current = [], 0
-    for _, row in signals.iterrows():
-        if row['long']:
-            current = 1
-        elif row['short']:
-            current = -1
-        elif row['exit']:
-            current = 0
-        pos.append(current)
-    signals['position'] = pos
+    signals['position'] = build_position(signals['long'], signals['short'], signals['exit'])
     returns, cum_returns = backtest(prices, signals, beta, tc=cfg['backtest']['tc_per_trade'])
     cum_returns.to_csv('cum_returns.csv')
     print(f"Final cumulative P&L: {cum_returns.iloc[-1]:.2f}")
\ No newline at end of file
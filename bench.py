@@ -0,0 +1,348 @@
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from price_store import FIELDS, PriceStore, set_default_store
+
+# Sizes each stage is timed at: bars for single-pair stages, tickers for screening
+DEFAULT_SCALES = {
+    'signals': [1_000, 100_000, 1_000_000],
+    'backtest': [1_000, 100_000, 1_000_000],
+    'find_pairs': [10, 100, 500],
+    'walk_forward': [1_000, 2_500, 5_000],
+    'chunked': [100_000, 1_000_000],
+    'cold_start': ['fetch', 'report'],
+}
+DEFAULT_BASELINE = 'bench_baseline.json'
+
+
+def ar1(shocks, phi, block=256):
+    """
+    s[t] = phi * s[t-1] + shocks[t] along axis 0 (s[-1] = 0), every column at once.
+    Each block of `block` bars is one matrix product with the lower-triangular
+    phi^(i-k) kernel plus the decayed carry from the previous block.
+    """
+    shocks = np.asarray(shocks, dtype=float)
+    out = np.empty_like(shocks)
+    j = np.arange(block)
+    lag = j[:, None] - j[None, :]
+    kernel = np.where(lag >= 0, phi ** np.maximum(lag, 0), 0.0)
+    decay = phi ** (j + 1)
+    carry = np.zeros(shocks.shape[1:])
+    for s in range(0, len(shocks), block):
+        e = shocks[s:s + block]
+        m = len(e)
+        out[s:s + m] = kernel[:m, :m] @ e + np.multiply.outer(decay[:m], carry)
+        carry = out[s + m - 1]
+    return out
+
+
+def synthetic_prices(n_tickers=10, n_bars=1000, freq='B', seed=0, start='2020-01-01',
+                     half_life=10.0, spread_vol=0.01, market_vol=0.01):
+    """
+    Seeded OHLCV bars for a synthetic universe, as {ticker: DataFrame[FIELDS]}.
+    Tickers come in cointegrated pairs (SYN000/SYN001, SYN002/SYN003, ...):
+      - the first leg is a geometric random walk
+      - the second is β × the first plus an Ornstein-Uhlenbeck spread with
+        the given `half_life` (in bars)
+    An odd ticker out is a plain random walk. `freq` is any pandas frequency
+    ('B' for daily, '1min' for intraday bars).
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n_bars, freq=freq, name='Date')
+    n_pairs = n_tickers // 2
+    log_px = np.empty((n_bars, n_tickers))
+    log_px[:] = np.log(rng.uniform(20, 200, n_tickers))
+    log_px += np.cumsum(rng.normal(0, market_vol, (n_bars, n_tickers)), axis=0)
+    # OU spread: s[t] = φ s[t-1] + ε, run for all pairs at once
+    phi = 0.5 ** (1 / half_life)
+    shocks = rng.normal(0, spread_vol, (n_bars, n_pairs))
+    spread = ar1(shocks, phi)
+    beta = rng.uniform(0.5, 2.0, n_pairs)
+    lead = np.exp(log_px[:, 0:2 * n_pairs:2])
+    log_px[:, 1:2 * n_pairs:2] = np.log(beta * lead + lead[0] * spread + lead[0] * 0.5)
+    close = np.exp(log_px)
+    volume = rng.lognormal(np.log(2e6), 0.3, (n_bars, n_tickers)).round()
+    noise = np.abs(rng.normal(0, 0.002, (n_bars, n_tickers)))
+    out = {}
+    for k in range(n_tickers):
+        c = close[:, k]
+        out[f"SYN{k:03d}"] = pd.DataFrame({
+            'Open': c * (1 + noise[:, k] / 2), 'High': c * (1 + noise[:, k]),
+            'Low': c * (1 - noise[:, k]), 'Close': c, 'Adj Close': c,
+            'Volume': volume[:, k],
+        }, index=index)[FIELDS]
+    return out
+
+
+class SyntheticBackend:
+    """
+    PriceStore backend serving `synthetic_prices` instead of the network, so
+    `fetch_prices`, `find_pairs` and `test_timeframes` run offline and repeatably.
+    """
+
+    def __init__(self, n_tickers=10, n_bars=1000, freq='B', seed=0, **kwargs):
+        self.bars = synthetic_prices(n_tickers, n_bars, freq, seed, **kwargs)
+        self.tickers = list(self.bars)
+
+    def download(self, tickers, start, end, interval):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        return {t: self.bars[t].loc[(self.bars[t].index >= start) & (self.bars[t].index < end)]
+                for t in tickers if t in self.bars}
+
+    def store(self):
+        """In-memory PriceStore over this backend."""
+        return PriceStore(root=None, backend=self)
+
+    def span(self):
+        """(start, end) covering every bar, end exclusive."""
+        index = next(iter(self.bars.values())).index
+        return index[0], index[-1] + pd.Timedelta(days=1)
+
+
+# -- stages ------------------------------------------------------------------
+# Each takes a scale and cfg, does its setup, and returns (run, rows) where
+# `run()` is the timed call and `rows` the units it processes.
+
+def _pair_prices(n_bars, freq, seed):
+    backend = SyntheticBackend(2, n_bars, freq, seed)
+    return pd.DataFrame({t: df['Adj Close'] for t, df in backend.bars.items()})
+
+
+def stage_signals(n_bars, cfg, seed=0):
+    from strat import generate_signals, build_position
+    prices = _pair_prices(n_bars, '1min', seed)
+    st = cfg['strategy']
+
+    def run():
+        signals, _ = generate_signals(prices, st['lookback'], st['z_enter'], st['z_exit'])
+        build_position(signals['long'], signals['short'], signals['exit'], st['max_holding'])
+    return run, n_bars
+
+
+def stage_backtest(n_bars, cfg, seed=0):
+    from strat import generate_signals, build_position
+    from backtest import run_backtest
+    prices = _pair_prices(n_bars, '1min', seed)
+    st = cfg['strategy']
+    signals, beta = generate_signals(prices, st['lookback'], st['z_enter'], st['z_exit'])
+    position = build_position(signals['long'], signals['short'], signals['exit'], st['max_holding'])
+
+    def run():
+        run_backtest(prices, position, beta, cfg['backtest']['tc_per_trade'], cfg['backtest']['stop_loss'])
+    return run, n_bars
+
+
+def stage_find_pairs(n_tickers, cfg, seed=0, n_bars=1000):
+    from pair_selection import find_pairs
+    backend = SyntheticBackend(n_tickers, n_bars, 'B', seed)
+    store = backend.store()
+    start, end = backend.span()
+    prices = store.load(backend.tickers, start, end)['Adj Close'].dropna(axis=1)
+    ps = cfg['pair_selection']
+
+    def run():
+        find_pairs(prices, ps['p_thresh'], ps['corr_thresh'], ps['vol_thresh'], store=store,
+                   workers=ps.get('workers', 1))
+    return run, n_tickers * (n_tickers - 1) // 2
+
+
+def stage_walk_forward(n_bars, cfg, seed=0):
+    from main import test_timeframes
+    backend = SyntheticBackend(2, n_bars, 'B', seed)
+    store = backend.store()
+    start, end = backend.span()
+
+    def run():
+        previous = set_default_store(store)
+        try:
+            test_timeframes(backend.tickers, start, end, '1d', cfg)
+        finally:
+            set_default_store(previous)
+    return run, n_bars
+
+
+def stage_chunked(n_bars, cfg, seed=0):
+    from chunked import run_chunked
+    backend = SyntheticBackend(2, n_bars, '1min', seed)
+    store = backend.store()
+    start, end = backend.span()
+    store.prefetch(backend.tickers, start, end, '1m')
+
+    def run():
+        run_chunked(backend.tickers, start, end, '1m', cfg['strategy'], cfg, store=store)
+    return run, n_bars
+
+
+def stage_cold_start(command, cfg, seed=0, n_rows=100_000):
+    """
+    A `cli.py` command run in a fresh interpreter, so import time counts: offline
+    prices from `prices.csv` and a results store of `n_rows` synthetic rows.
+    """
+    import subprocess
+    import tempfile
+    import yaml
+    from results_store import ResultsStore
+    from sweep import GRID_COLUMNS, METRIC_COLUMNS
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.TemporaryDirectory()
+    pair = list(pd.read_csv(os.path.join(here, 'prices.csv'), index_col=0, nrows=0).columns)
+    run_cfg = {**cfg, 'tickers': {'universe': pair, 'pair': pair},
+               'data': {**cfg['data'], 'source': 'csv', 'offline_path': os.path.join(here, 'prices.csv')},
+               'results': {'path': os.path.join(tmp.name, 'results')}}
+    rng = np.random.default_rng(seed)
+    rows = pd.DataFrame({name: rng.integers(5, 50, n_rows) for name in GRID_COLUMNS})
+    rows = rows.assign(**{name: rng.normal(0, 1, n_rows) for name in METRIC_COLUMNS},
+                       start=pd.Timestamp('2020-01-01'), end=pd.Timestamp('2021-01-01'))
+    with ResultsStore(run_cfg['results']['path']) as store:
+        store.append(tuple(pair), rows)
+    path = os.path.join(tmp.name, 'config.yml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(run_cfg, f)
+    argv = [sys.executable, os.path.join(here, 'cli.py'), '--config', path, command]
+
+    def run():
+        # `tmp` lives as long as this closure
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL, cwd=tmp.name)
+    return run, 1
+
+
+STAGES = {
+    'signals': stage_signals,
+    'backtest': stage_backtest,
+    'find_pairs': stage_find_pairs,
+    'walk_forward': stage_walk_forward,
+    'chunked': stage_chunked,
+    'cold_start': stage_cold_start,
+}
+
+
+def measure(run, repeats=3, slow=1.0):
+    """
+    Best-of-`repeats` wall time, then one extra traced call for peak memory (bytes).
+    The first call warms up imports and caches; calls slower than `slow`
+    seconds aren't repeated.
+    """
+    t0 = time.perf_counter()
+    run()
+    times = [time.perf_counter() - t0]
+    if times[0] < slow:
+        times = []
+    for _ in range(repeats if not times else 0):
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    # tracing slows Python code down, so it's kept out of the timed calls
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run_benchmarks(cfg, scales=None, stages=None, seed=0, repeats=3, verbose=True):
+    """
+    Time every stage at every scale.
+    Returns {'stage@scale': {'seconds', 'rows', 'rows_per_sec', 'peak_mb'}}.
+    """
+    scales = scales or DEFAULT_SCALES
+    results = {}
+    for name in stages or STAGES:
+        for scale in scales.get(name, []):
+            run, rows = STAGES[name](scale, cfg, seed=seed)
+            seconds, peak = measure(run, repeats)
+            key = f"{name}@{scale}"
+            results[key] = {
+                'seconds': seconds,
+                'rows': rows,
+                'rows_per_sec': rows / seconds if seconds else float('inf'),
+                'peak_mb': peak / 2 ** 20,
+            }
+            if verbose:
+                r = results[key]
+                print(f"{key:<22} {r['seconds']:9.4f}s {r['rows_per_sec']:14,.0f} rows/s {r['peak_mb']:9.1f} MB")
+    return results
+
+
+def compare(results, baseline, threshold=0.25, min_seconds=0.005):
+    """
+    List regressions of `results` against `baseline`: any stage slower, or with a
+    higher peak memory, by more than `threshold` (a fraction). Timings under
+    `min_seconds` are too noisy to judge and only the memory check applies.
+    """
+    failures = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None:
+            continue
+        if max(r['seconds'], b['seconds']) >= min_seconds and r['seconds'] > b['seconds'] * (1 + threshold):
+            failures.append(f"{key}: {r['seconds']:.4f}s vs baseline {b['seconds']:.4f}s")
+        if r['peak_mb'] > b['peak_mb'] * (1 + threshold) + 1:
+            failures.append(f"{key}: peak {r['peak_mb']:.1f} MB vs baseline {b['peak_mb']:.1f} MB")
+    return failures
+
+
+def over_budget(results, budget):
+    """`cold_start` commands slower than `budget` seconds."""
+    return [f"{key}: {r['seconds']:.2f}s vs cold-start budget {budget:.2f}s"
+            for key, r in results.items() if key.startswith('cold_start@') and r['seconds'] > budget]
+
+
+def save_baseline(results, path=DEFAULT_BASELINE):
+    payload = {
+        'machine': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                    'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+
+
+def load_baseline(path=DEFAULT_BASELINE):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+if __name__ == '__main__':
+    import argparse
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument('--save', action='store_true', help="overwrite the baseline with this run")
+    parser.add_argument('--quick', action='store_true', help="skip the largest scale of every stage")
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help="only run these stages")
+    args = parser.parse_args()
+
+    cfg = yaml.safe_load(open('config.yml'))
+    bench = cfg.get('bench', {})
+    path = bench.get('baseline', DEFAULT_BASELINE)
+    scales = {k: v[:-1] if args.quick else v for k, v in bench.get('scales', DEFAULT_SCALES).items()}
+    results = run_benchmarks(cfg, scales, args.stage, seed=bench.get('seed', 0), repeats=bench.get('repeats', 3))
+
+    # the start-up budget is absolute, so it's checked even when saving a baseline
+    failures = over_budget(results, bench.get('cold_start_budget', 1.5))
+    saving = args.save or not os.path.exists(path)
+    if saving:
+        # stages left out of this run keep their old baseline
+        baseline = load_baseline(path) if os.path.exists(path) else {}
+        baseline.update(results)
+        save_baseline(baseline, path)
+        print(f"\nBaseline written to {path}")
+    else:
+        failures += compare(results, load_baseline(path), bench.get('threshold', 0.25))
+    if failures:
+        print("\nRegressions:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    if not saving:
+        print(f"\nNo regressions against {path}")
@@ -0,0 +1,275 @@
+import numpy as np
+
+from backtest import _stop_loss_bars
+from performance import periods_per_year
+from price_store import FIELDS, default_store
+from profiling import stage
+
+DEFAULT_CHUNK_ROWS = 250_000
+
+
+def rolling_moments(values, window, tail=()):
+    """
+    Rolling mean/std (ddof=1) of `values` over `window` bars, continuing from `tail`,
+    the bars just before `values` (NaN until a full window is available).
+    Every window is summed on its own, so the result is the same however the
+    series is split into blocks.
+    """
+    values = np.asarray(values, dtype=float)
+    ext = np.concatenate((np.asarray(tail, dtype=float)[len(tail) - window + 1:] if window > 1 else [], values))
+    n, m = len(values), len(ext)
+    mean, std = np.full(n, np.nan), np.full(n, np.nan)
+    full = m - window + 1  # complete windows in `ext`
+    if full <= 0:
+        return mean, std
+    total = np.zeros(full)
+    for k in range(window):
+        total += ext[k:k + full]
+    mu = total / window
+    ssq = np.zeros(full)
+    for k in range(window):
+        ssq += (ext[k:k + full] - mu) ** 2
+    # window ending at ext[j] -> values[j - (m - n)]
+    first = window - 1 - (m - n)
+    skip = max(-first, 0)
+    mean[max(first, 0):] = mu[skip:]
+    if window > 1:
+        std[max(first, 0):] = np.sqrt(ssq[skip:] / (window - 1))
+    return mean, std
+
+
+class ChunkedPairBacktest:
+    """
+    Block-by-block version of generate_signals -> build_position -> backtest for one
+    pair, for histories too long to hold at once (years of minute bars).
+    Each `update(y, x)` block is vectorized; between blocks it carries:
+      - the last bars of the spread, for the rolling z-score and sizing vol
+      - the running position and bars since the last entry (max holding)
+      - the previous bar's prices and sizing, and the open trade's P&L (stop-loss)
+      - running sums for total return, Sharpe and drawdown
+    Peak memory is set by the block size, whatever the history length.
+    Per-bar output is float32 returns and int8 positions.
+    `beta` is fixed (see `streaming_hedge_ratio`); `freq` is bars per year.
+    """
+
+    def __init__(self, beta, lookback, z_enter, z_exit, max_holding=None,
+                 tc=0.001, stop_loss=-0.05, min_vol=None, vol_window=20, freq=252):
+        self.beta = beta
+        self.lookback, self.vol_window = lookback, vol_window
+        self.z_enter, self.z_exit = z_enter, z_exit
+        self.max_holding = max_holding
+        self.tc, self.stop_loss, self.min_vol = tc, stop_loss, min_vol
+        self.freq = freq
+        self._tail = np.empty(0)
+        self._raw = 0
+        self._since_entry = None  # bars from the last entry to the end of the last block
+        self._prev = (np.nan, np.nan, np.nan, 0, 0)  # y, x, 1/vol, raw and final position
+        self._run = 0.0  # running P&L of the open trade
+        self.bars = 0
+        self.total_return = 0.0
+        self._mean = self._m2 = 0.0
+        self._peak = -np.inf
+        self._cum_min, self._cum_max = np.inf, -np.inf
+        self._max_dd = 0.0
+
+    def update(self, y, x):
+        """Consume a block of bars; returns (float32 returns, int8 positions) for it."""
+        y, x = np.asarray(y, dtype=float), np.asarray(x, dtype=float)
+        n = len(y)
+        if not n:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int8)
+        spread = y - self.beta * x
+        mu, sigma = rolling_moments(spread, self.lookback, self._tail)
+        _, vol = rolling_moments(spread, self.vol_window, self._tail)
+        keep = max(self.lookback, self.vol_window) - 1
+        self._tail = np.concatenate((self._tail, spread))[-keep:] if keep else np.empty(0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (spread - mu) / sigma
+            inv_vol = 1 / vol
+        long, short, exit = z < -self.z_enter, z > self.z_enter, np.abs(z) < self.z_exit
+        if self.min_vol is not None:
+            # Mute signals while the spread is too quiet to trade
+            active = np.where(np.isnan(sigma) | (sigma == 0), 0.0001, sigma) >= self.min_vol
+            long, short, exit = long & active, short & active, exit & active
+        raw = self._position(long, short, exit)
+
+        py, px, p_inv, p_raw, p_final = self._prev
+        ye, xe = np.concatenate(([py], y)), np.concatenate(([px], x))
+        inv_e = np.concatenate(([p_inv], inv_vol))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret_y, ret_x = ye[1:] / ye[:-1] - 1, xe[1:] / xe[:-1] - 1
+            returns = self._pnl(ye, xe, ret_y, ret_x, inv_e, np.concatenate(([p_raw], raw)))
+            # Stop-loss: the open trade's P&L so far goes in front as one bar
+            in_trade = raw != 0
+            stops = _stop_loss_bars(np.concatenate(([self._run], returns)),
+                                    np.concatenate(([p_raw != 0], in_trade)), self.stop_loss)[1:]
+            position = np.where(stops, 0, raw)
+            first_pass = returns
+            if stops.any() or p_final != p_raw:
+                returns = self._pnl(ye, xe, ret_y, ret_x, inv_e, np.concatenate(([p_final], position)))
+
+        # running P&L of a trade still open at the end of the block, summed in order
+        carried, self._run = self._run, 0.0
+        if in_trade[-1]:
+            resets = np.flatnonzero(stops | ~in_trade)
+            tail = first_pass[resets[-1] + 1:] if len(resets) else np.concatenate(([carried], first_pass))
+            run = 0.0
+            for r in tail.tolist():
+                run += r
+            self._run = run
+        self._prev = (y[-1], x[-1], inv_vol[-1], raw[-1], position[-1])
+        self._update_metrics(returns)
+        return returns.astype(np.float32), position.astype(np.int8)
+
+    def _position(self, long, short, exit):
+        n = len(long)
+        rows = np.arange(n)
+        entry = long | short
+        if self.max_holding is not None:
+            none = np.iinfo(np.int64).min
+            last_entry = np.where(entry, rows, -self._since_entry if self._since_entry is not None else none)
+            np.maximum.accumulate(last_entry, out=last_entry)
+            found = last_entry != none
+            exit = exit | (found & (rows - last_entry == max(self.max_holding, 1)))
+            self._since_entry = int(n - last_entry[-1]) if found[-1] else None
+        # state on signal bars, carried forward (and in from the last block)
+        state = np.where(long, 1, np.where(short, -1, 0))
+        last_signal = np.where(entry | exit, rows, -1)
+        np.maximum.accumulate(last_signal, out=last_signal)
+        position = np.where(last_signal >= 0, state[np.maximum(last_signal, 0)], self._raw)
+        self._raw = int(position[-1])
+        return position
+
+    def _pnl(self, y, x, ret_y, ret_x, inv_vol, pos):
+        # same operation order as backtest_arrays, with the previous bar in front
+        pos_y = pos * inv_vol
+        pos_x = -self.beta * pos_y
+        gross = pos_y[:-1] * ret_y + pos_x[:-1] * ret_x
+        cost = (np.abs(np.diff(pos_y)) * y[1:] + np.abs(np.diff(pos_x)) * x[1:]) * self.tc
+        net = gross - cost
+        return np.where(np.isnan(net), 0.0, net)
+
+    def _update_metrics(self, returns):
+        n = len(returns)
+        # block mean/variance combined with the running ones (Chan et al.)
+        mean = returns.sum() / n
+        m2 = ((returns - mean) ** 2).sum()
+        total = self.bars + n
+        delta = mean - self._mean
+        self._mean += delta * n / total
+        self._m2 += m2 + delta ** 2 * self.bars * n / total
+        cum = self.total_return + np.cumsum(returns)
+        peak = np.maximum(np.maximum.accumulate(cum), self._peak)
+        drawdown = (cum - peak) / np.where(peak == 0, 1e-10, peak)
+        self._max_dd = min(self._max_dd, drawdown.min())
+        self._peak = peak[-1]
+        self._cum_min, self._cum_max = min(self._cum_min, cum.min()), max(self._cum_max, cum.max())
+        self.total_return = cum[-1]
+        self.bars = total
+
+    def summary(self):
+        """total_return, sharpe (annualized with `freq`), max_dd and bars so far."""
+        std = np.sqrt(self._m2 / (self.bars - 1)) if self.bars > 1 else np.nan
+        sharpe = np.sqrt(self.freq) * self._mean / std if std and not np.isnan(std) else np.nan
+        flat = self._cum_min == self._cum_max
+        return {'total_return': self.total_return, 'sharpe': sharpe,
+                'max_dd': 0.0 if flat or not self.bars else self._max_dd, 'bars': self.bars}
+
+
+def _bounds(index, lo, hi):
+    """Row range of a sorted timestamp array within [lo, hi); None is open-ended."""
+    return (np.searchsorted(index, lo) if lo is not None else 0,
+            np.searchsorted(index, hi) if hi is not None else len(index))
+
+
+def iter_blocks(pair, start, end, interval='1d', rows=DEFAULT_CHUNK_ROWS, min_vol=100000, store=None):
+    """
+    Yield (index, y, x) blocks of a pair's adjusted closes over [start, end), about
+    `rows` bars of the longer leg at a time, read straight from the price store's
+    mapped arrays. Tickers are sorted and dates outer-joined like `fetch_prices`,
+    and the same volume and extreme-move filters are applied (returns against the
+    last close of each leg, padded across gaps and carried across blocks, like
+    `pct_change`), so the blocks put together equal `fetch_prices(pair, ...)`.
+    """
+    store = store if store is not None else default_store()
+    tickers = sorted(set(pair))
+    store.prefetch(tickers, start, end, interval)
+    legs = [store.arrays(t, start, end, interval) for t in tickers]
+    close, volume = FIELDS.index('Adj Close'), FIELDS.index('Volume')
+    # offline files without volume skip the volume filter, as in fetch_prices
+    has_volume = any(not np.isnan(values[k:k + rows, volume]).all()
+                     for _, values in legs for k in range(0, len(values), rows))
+    lead = max((index for index, _ in legs), key=len)
+    cuts = [lead[k] for k in range(rows, len(lead), rows)]
+    last = np.full(2, np.nan)  # last close of each leg that passed the volume filter
+    for lo, hi in zip([None] + cuts, cuts + [None]):
+        parts = [(index[i0:i1], values[i0:i1]) for index, values in legs for i0, i1 in [_bounds(index, lo, hi)]]
+        ts = np.union1d(parts[0][0], parts[1][0])
+        bars = np.full((len(ts), 2, len(FIELDS)), np.nan)
+        for k, (index, values) in enumerate(parts):
+            bars[np.searchsorted(ts, index), k] = values
+        # `load` drops rows where neither leg has any field
+        present = ~np.isnan(bars).all(axis=(1, 2))
+        ts, px, vol = ts[present], bars[present, :, close], bars[present, :, volume]
+        if has_volume:
+            ok = (vol >= min_vol).all(axis=1)
+            ts, px = ts[ok], px[ok]
+        # extreme (>50%) moves against each leg's last close, which may be in an earlier block
+        ext = np.vstack((last, px))
+        filled = np.take_along_axis(
+            ext, np.maximum.accumulate(np.where(np.isnan(ext), 0, np.arange(len(ext))[:, None]), axis=0), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ok = (np.abs(filled[1:] / filled[:-1] - 1) < 0.5).all(axis=1)
+        last = filled[-1]
+        ok &= ~np.isnan(px).any(axis=1)
+        if ok.any():
+            yield store.to_index(tickers[0], ts[ok], interval), px[ok, 0], px[ok, 1]
+
+
+def streaming_hedge_ratio(blocks):
+    """Static β of y ~ x (no intercept, like `strat.hedge_ratio`) from running sums over blocks."""
+    sxy = sxx = 0.0
+    for _, y, x in blocks:
+        sxy += np.dot(x, y)
+        sxx += np.dot(x, x)
+    return sxy / sxx
+
+
+def run_chunked(pair, start, end, interval, params, cfg, beta=None, rows=None, store=None, on_block=None):
+    """
+    Backtest one pair over [start, end) in blocks of `rows` bars (`data.chunk_rows`),
+    with the Sharpe ratio annualized for `interval`.
+    `beta` defaults to the static β, fitted in a first streaming pass.
+    `on_block(index, returns, position)` receives every block's float32 returns
+    and int8 positions, e.g. to write them out. Returns the summary dict.
+    """
+    rows = rows or cfg['data'].get('chunk_rows', DEFAULT_CHUNK_ROWS)
+    min_vol = cfg['data'].get('min_vol', 100000)
+
+    def blocks():
+        return iter_blocks(pair, start, end, interval, rows, min_vol, store)
+    if beta is None:
+        beta = streaming_hedge_ratio(blocks())
+    engine = ChunkedPairBacktest(
+        beta, int(params['lookback']), params['z_enter'], params['z_exit'], int(params['max_holding']),
+        tc=cfg['backtest']['tc_per_trade'], stop_loss=cfg['backtest']['stop_loss'],
+        min_vol=cfg['strategy']['min_vol'], freq=periods_per_year(interval))
+    for index, y, x in blocks():
+        with stage('backtest', rows=len(y)):
+            returns, position = engine.update(y, x)
+        if on_block is not None:
+            on_block(index, returns, position)
+    return dict(engine.summary(), beta=beta)
+
+
+if __name__ == '__main__':
+    import yaml
+    from price_store import PriceStore, set_default_store
+
+    cfg = yaml.safe_load(open('config.yml'))
+    set_default_store(PriceStore.from_config(cfg))
+    summary = run_chunked(cfg['tickers']['pair'], cfg['data']['start'], cfg['data']['end'],
+                          cfg['data']['interval'], cfg['strategy'], cfg)
+    for key, value in summary.items():
+        print(f"{key + ':':<14}{value:.4f}" if isinstance(value, float) else f"{key + ':':<14}{value}")
@@ -0,0 +1,210 @@
+"""
+Single entry point for the pipeline stages:
+
+    python cli.py [--config config.yml] <command> [options]
+
+  - fetch:    download / refresh cached bars for the universe (or --tickers)
+  - screen:   cointegration screen of the universe
+  - signals:  entry/exit events for a pair
+  - backtest: backtest a pair with the strategy settings and report it
+  - sweep:    walk-forward grid sweep (or adaptive search), streamed into the results store
+  - report:   top rows / parameter sets from the results store
+
+Stage modules are imported inside each command, so `fetch` and `report` never
+load statsmodels or matplotlib, and `backtest --no-plot` (or `report.plot: false`)
+reports without a plotting backend. `bench.py --stage cold_start` checks the
+start-up time of the cheap commands against `bench.cold_start_budget`.
+"""
+import argparse
+import sys
+
+
+def load_cfg(path='config.yml'):
+    import yaml
+    return yaml.safe_load(open(path))
+
+
+def _setup(cfg):
+    """Resolve `data.end` and point the default price store at config.yml's source."""
+    from incremental import resolve_end
+    from price_store import PriceStore, set_default_store
+    cfg['data']['end'] = resolve_end(cfg['data']['end'])
+    return set_default_store(PriceStore.from_config(cfg))
+
+
+def _pair(args, cfg):
+    # fetch_prices orders columns alphabetically, so y is the first ticker of the sorted pair
+    return sorted(args.pair or cfg['tickers']['pair'])
+
+
+def cmd_fetch(args, cfg):
+    store = _setup(cfg)
+    tickers = args.tickers or sorted(set(cfg['tickers']['universe']) | set(cfg['tickers']['pair']))
+    data = store.load(tickers, cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+    close = data['Adj Close']
+    for t in close.columns:
+        bars = close[t].dropna()
+        span = f"{bars.index[0]:%Y-%m-%d} to {bars.index[-1]:%Y-%m-%d}" if len(bars) else "-"
+        print(f"{t:<8} {len(bars):>8} bars  {span}")
+
+
+def cmd_screen(args, cfg):
+    import pandas as pd
+    from pair_selection import find_pairs
+    from stats_cache import StatsCache
+    from universe import load_universe
+    _setup(cfg)
+    ps = cfg['pair_selection']
+    uni = load_universe(cfg['tickers']['universe'], cfg['data']['start'], cfg['data']['end'])
+    if uni.empty:
+        print("Error: No data fetched for universe.")
+        return 1
+    pairs, scores = find_pairs(uni, ps['p_thresh'], ps['corr_thresh'], ps['vol_thresh'],
+                               workers=ps.get('workers', 1), cache=StatsCache.from_config(cfg))
+    if not pairs:
+        print("No cointegrated pairs found.")
+        return
+    df = pd.DataFrame(
+        [{'pair': f"{x},{y}", 'p_value': p, 'spread_vol': vol, 'half_life': hl, 'score': s}
+         for (x, y), (p, vol, hl, s) in scores.items()]
+    )
+    print(df.sort_values('score', ascending=False).reset_index(drop=True).to_markdown())
+
+
+def _signals(args, cfg):
+    from data_fetch import fetch_prices
+    from strat import generate_signals, build_position, fit_hedge, hedge_kwargs
+    _setup(cfg)
+    prices = fetch_prices(_pair(args, cfg), cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+    if prices.empty or prices.isna().all().any():
+        return prices, None, None
+    st = {**cfg['strategy'], **{k: v for k, v in vars(args).items() if k in cfg['strategy'] and v is not None}}
+    signals, beta = generate_signals(prices, lookback=st['lookback'], z_enter=st['z_enter'], z_exit=st['z_exit'],
+                                     beta=fit_hedge(prices, **hedge_kwargs(cfg)))
+    signals['position'] = build_position(signals['long'], signals['short'], signals['exit'], st['max_holding'])
+    return prices, signals, beta
+
+
+def cmd_signals(args, cfg):
+    prices, signals, _ = _signals(args, cfg)
+    if signals is None:
+        print("Error: No valid price data.")
+        return 1
+    events = signals[signals['position'].diff().fillna(0) != 0]
+    print(events[['long', 'short', 'exit', 'position']].tail(args.rows).to_markdown())
+
+
+def cmd_backtest(args, cfg):
+    from backtest import run_backtest
+    from performance import report_performance, periods_per_year
+    prices, signals, beta = _signals(args, cfg)
+    if signals is None:
+        print("Error: No valid price data.")
+        return 1
+    returns, cum_returns, signals['position'] = run_backtest(prices, signals['position'], beta,
+                                                             tc=cfg['backtest']['tc_per_trade'],
+                                                             stop_loss=cfg['backtest']['stop_loss'])
+    plot = cfg.get('report', {}).get('plot', True) if args.plot is None else args.plot
+    report_performance(returns, cum_returns, signals, freq=periods_per_year(cfg['data']['interval']), plot=plot)
+
+
+def cmd_sweep(args, cfg):
+    from results_store import ResultsStore
+    _setup(cfg)
+    pairs = [tuple(sorted(p.split(','))) for p in args.pairs] if args.pairs else [tuple(sorted(cfg['tickers']['pair']))]
+    sink = ResultsStore.from_config(cfg)
+    if sink is not None and not args.append:
+        sink.clear()
+    span = (cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+    on_result = sink.append if sink is not None else None
+    if (args.method or cfg.get('search', {}).get('method', 'grid')) != 'grid':
+        from search import run_search
+        if args.method:
+            cfg['search'] = {**cfg.get('search', {}), 'method': args.method}
+        rungs = {}
+        results = run_search(pairs, *span, cfg, on_result=on_result, report=rungs, workers=args.workers)
+        for label, log in rungs.items():
+            print(f"Parameter search for {label}:")
+            print(log.to_markdown(index=False))
+    else:
+        from scheduler import run_walk_forward
+        results = run_walk_forward(pairs, *span, cfg, workers=args.workers, on_result=on_result)
+    if results.empty:
+        print("Error: No valid results from timeframes.")
+        return 1
+    if sink is not None:
+        sink.flush()
+        print(f"{len(sink)} result rows saved to '{sink.path}'.")
+    print(results.head(args.rows).to_markdown())
+
+
+def cmd_report(args, cfg):
+    from results_store import ResultsStore
+    store = ResultsStore.from_config(cfg) or ResultsStore()
+    if not len(store):
+        print(f"No results in '{store.path}', run `cli.py sweep` first.")
+        return
+    pair = args.pair and ','.join(sorted(args.pair))
+    if args.aggregate:
+        table = store.aggregate([args.by], pair=pair)
+        table = table.sort_values((args.by, 'mean'), ascending=False).head(args.rows)
+    else:
+        table = store.top(args.rows, by=args.by, pair=pair)
+    print(table.to_markdown())
+
+
+def _plot_arg(value):
+    return {'on': True, 'off': False}.get(value, value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Pairs-trading pipeline stages.")
+    parser.add_argument('--config', default='config.yml', help="config file (default: config.yml)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('fetch', help="download / refresh cached bars")
+    p.add_argument('--tickers', nargs='+', help="default: tickers.universe and tickers.pair")
+    p.set_defaults(run=cmd_fetch)
+
+    p = sub.add_parser('screen', help="cointegration screen of tickers.universe")
+    p.set_defaults(run=cmd_screen)
+
+    for name, run, text in (('signals', cmd_signals, "trade events for a pair"),
+                            ('backtest', cmd_backtest, "backtest and report a pair")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument('--pair', nargs=2, metavar='TICKER', help="default: tickers.pair")
+        p.add_argument('--lookback', type=int)
+        p.add_argument('--z-enter', dest='z_enter', type=float)
+        p.add_argument('--z-exit', dest='z_exit', type=float)
+        p.add_argument('--max-holding', dest='max_holding', type=int)
+        p.add_argument('--rows', type=int, default=20, help="events shown (signals)")
+        p.set_defaults(run=run)
+    # backtest only
+    p.add_argument('--plot', type=_plot_arg, metavar='on|off|PATH',
+                   help="show the equity curve, skip it, or save it to PATH (default: report.plot)")
+    p.add_argument('--no-plot', dest='plot', action='store_const', const=False, help="same as --plot off")
+
+    p = sub.add_parser('sweep', help="walk-forward grid sweep into the results store")
+    p.add_argument('pairs', nargs='*', metavar='T1,T2', help="default: tickers.pair")
+    p.add_argument('--workers', type=int, help="default: sweep.workers")
+    p.add_argument('--method', choices=['grid', 'halving', 'random'], help="default: search.method")
+    p.add_argument('--append', action='store_true', help="keep rows already in the store")
+    p.add_argument('--rows', type=int, default=20)
+    p.set_defaults(run=cmd_sweep)
+
+    p = sub.add_parser('report', help="query the results store")
+    p.add_argument('--pair', nargs=2, metavar='TICKER')
+    p.add_argument('--by', default='total_return', choices=['total_return', 'sharpe', 'max_dd'])
+    p.add_argument('--aggregate', action='store_true', help="parameter sets across windows instead of rows")
+    p.add_argument('--rows', type=int, default=20)
+    p.set_defaults(run=cmd_report)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.run(args, load_cfg(args.config))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
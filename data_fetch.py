@@ -1,28 +1,25 @@
-import yfinance as yf
 import pandas as pd
+from price_store import default_store
+from profiling import profiled
 
-def fetch_prices(tickers, start, end, interval='1d', min_vol=100000):
+@profiled('fetch', rows=len)
+def fetch_prices(tickers, start, end, interval='1d', min_vol=100000, store=None):
     """
     Download the adjusted price series for your selected pair.
     Filters out extreme returns and low-volume days.
+    Bars come from the local price store, which only hits the network for
+    date ranges it hasn't cached yet.
     """
-    data = yf.download(
-        tickers,
-        start=start,
-        end=end,
-        interval=interval,
-        progress=False,
-        auto_adjust=False
-    )
-    if 'Adj Close' in data.columns:
-        prices = data['Adj Close']
-    else:
-        prices = data['Close']
-    # Fetch volume
-    vol = yf.download(tickers, start=start, end=end, interval=interval, progress=False, auto_adjust=False)['Volume']
-    # Filter low volume days
-    vol_mask = (vol >= min_vol).all(axis=1)
-    prices = prices[vol_mask]
+    store = store if store is not None else default_store()
+    data = store.load(tickers, start, end, interval)
+    return filter_prices(data['Adj Close'], data['Volume'], min_vol)
+
+def filter_prices(prices, vol, min_vol=100000):
+    """Drop low-volume days and extreme (>50%) moves from a price frame."""
+    # Filter low volume days (offline files without volume skip this)
+    if not vol.isna().all().all():
+        vol_mask = (vol >= min_vol).all(axis=1)
+        prices = prices[vol_mask]
     # Filter extreme returns (>50%)
     returns = prices.pct_change()
     extreme_mask = (returns.abs() < 0.5).all(axis=1)
@@ -31,7 +28,9 @@ def fetch_prices(tickers, start, end, interval='1d', min_vol=100000):
 
 if __name__ == '__main__':
     import yaml
+    from price_store import PriceStore, set_default_store
     cfg = yaml.safe_load(open('config.yml'))
+    set_default_store(PriceStore.from_config(cfg))
     tickers = cfg['tickers']['pair']
     start = cfg['data']['start']
     end = cfg['data']['end']
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from price_store import default_store
+from scheduler import stream_walk_forward
+from sweep import DEFAULT_GRID, GRID_COLUMNS, walk_forward_windows, merge_windows
+
+DEFAULT_STATE_DIR = '.pipeline_state'
+
+
+def _hash(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def resolve_end(end):
+    """`data.end` as a date string; None or 'today' means today."""
+    if end is None or str(end).lower() == 'today':
+        return pd.Timestamp.today().strftime('%Y-%m-%d')
+    return end
+
+
+class PipelineState:
+    """
+    State persisted between runs of `main.py` so a rerun only does new work:
+      - `screen.json`: the last `find_pairs` result, reused for `rescreen_days`
+        as long as the universe and thresholds are unchanged
+      - `windows/<pair>.pkl`: grid results per walk-forward window, keyed by a hash
+        of the window's raw bars and the strategy/backtest/grid settings, so a
+        window is only rerun when its data or the config changes
+      - `positions.pkl`: a `live.LiveSignalEngine` per traded pair (rolling
+        windows, open position, running P&L) and the last bar it has seen
+    """
+
+    def __init__(self, root=DEFAULT_STATE_DIR, rescreen_days=7):
+        self.root = root
+        self.rescreen_days = rescreen_days
+        os.makedirs(os.path.join(root, 'windows'), exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg):
+        """State from the `incremental` section of config.yml, or None when it's off."""
+        opts = cfg.get('incremental', {}) or {}
+        if not opts.get('enabled', False):
+            return None
+        return cls(opts.get('state_dir', DEFAULT_STATE_DIR), opts.get('rescreen_days', 7))
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _load(self, path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _save(self, path, obj):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(obj, f)
+        os.replace(tmp, path)
+
+    # -- screening ---------------------------------------------------------
+
+    def screen(self, run, universe, start, end, params):
+        """
+        Pairs from the last screen if it's recent enough, otherwise `run()`
+        (returning `find_pairs` output) and store it.
+        `params` are the screening settings; any change forces a rescreen.
+        """
+        path = self._path('screen.json')
+        key = _hash(sorted(universe), str(start), params)
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            age = (pd.Timestamp(end) - pd.Timestamp(saved['end'])).days
+            if saved['key'] == key and 0 <= age < self.rescreen_days:
+                return [tuple(p) for p in saved['pairs']], {tuple(k.split(',')): tuple(v)
+                                                            for k, v in saved['scores'].items()}
+        pairs, scores = run()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'end': str(end), 'pairs': pairs,
+                       'scores': {f"{x},{y}": list(v) for (x, y), v in scores.items()}}, f)
+        os.replace(tmp, path)
+        return pairs, scores
+
+    # -- walk-forward ------------------------------------------------------
+
+    def window_key(self, pair, w_start, w_end, interval, cfg, store=None):
+        """Hash of a window's raw bars and every setting its grid results depend on."""
+        store = store if store is not None else default_store()
+        data = store.load(list(pair), w_start, w_end, interval)
+        bars = data[['Adj Close', 'Volume']]
+        settings = [cfg['strategy'], cfg['backtest'], DEFAULT_GRID, interval]
+        return _hash(bars.index.asi8, bars.to_numpy(dtype=float), list(bars.columns), settings)
+
+    def walk_forward(self, pairs, start, end, interval, cfg, workers=None, on_result=None):
+        """
+        `scheduler.run_walk_forward`, but windows already computed for the same
+        data and settings are read back instead of rerun. New windows (and any
+        whose bars changed) are computed and appended to the stored results.
+        `on_result(pair, results)` sees every window, stored ones first.
+        """
+        windows = walk_forward_windows(start, end)
+        stored, keys, only = [], {}, set()
+        for p, (t1, t2) in enumerate(pairs):
+            saved = self._load(self._path('windows', f"{t1}_{t2}.pkl"), {})
+            stored.append(saved)
+            for w, (w_start, w_end) in enumerate(windows):
+                keys[p, w] = self.window_key((t1, t2), w_start, w_end, interval, cfg)
+                if keys[p, w] not in saved:
+                    only.add((p, w))
+                elif on_result is not None and saved[keys[p, w]] is not None:
+                    on_result((t1, t2), saved[keys[p, w]])
+        if only:
+            for p, w, results in stream_walk_forward(pairs, start, end, interval, cfg, workers, only):
+                stored[p][keys[p, w]] = results
+                if on_result is not None and results is not None:
+                    on_result(pairs[p], results)
+            for p in sorted({p for p, _ in only}):
+                t1, t2 = pairs[p]
+                # keep only the current windows, older ones have rolled out of the range
+                current = {keys[p, w]: stored[p][keys[p, w]] for w in range(len(windows))}
+                self._save(self._path('windows', f"{t1}_{t2}.pkl"), current)
+
+        all_results = []
+        for p, (t1, t2) in enumerate(pairs):
+            results = merge_windows([stored[p][keys[p, w]] for w in range(len(windows))])
+            if not results.empty:
+                results['pair'] = f"{t1},{t2}"
+                all_results.append(results)
+        self.last_run = {'windows': len(windows) * len(pairs), 'computed': len(only)}
+        if not all_results:
+            return pd.DataFrame()
+        all_results = pd.concat(all_results, ignore_index=True)
+        return all_results.sort_values('total_return', ascending=False, kind='stable')
+
+    # -- open positions ----------------------------------------------------
+
+    def advance_position(self, pair, prices, params, cfg):
+        """
+        Feed bars of `prices` newer than the last one seen into the pair's stored
+        live engine and return (engine, ticks). `params` is the pair's parameter
+        row (GRID_COLUMNS, plus stop_loss/min_vol when searched; config values
+        otherwise). The engine is rebuilt from the first bar when those
+        parameters or the cost/hedge settings change. The hedge ratio comes from
+        `strat.fit_hedge`; a rolling or Kalman β is applied bar by bar. A static β
+        is frozen at its fit on the bars available when the engine was built:
+        the bars added by later runs don't refit it (that would change the hedge
+        under an open position), only a rebuild does.
+        """
+        from live import LiveSignalEngine
+        from strat import fit_hedge, hedge_kwargs
+
+        path = self._path('positions.pkl')
+        positions = self._load(path, {})
+        label = f"{pair[0]},{pair[1]}"
+        params = {**{'stop_loss': cfg['backtest']['stop_loss'], 'min_vol': cfg['strategy']['min_vol']},
+                  **{c: params[c] for c in GRID_COLUMNS + ['stop_loss', 'min_vol'] if c in params}}
+        params = {c: float(v) for c, v in params.items()}
+        settings = _hash(params, cfg['backtest']['tc_per_trade'], hedge_kwargs(cfg))
+        beta = fit_hedge(prices, **hedge_kwargs(cfg))
+        entry = positions.get(label)
+        if entry is None or entry['settings'] != settings:
+            engine = LiveSignalEngine(
+                beta if np.ndim(beta) == 0 else np.nan, int(params['lookback']), params['z_enter'],
+                params['z_exit'], int(params['max_holding']), tc=cfg['backtest']['tc_per_trade'],
+                stop_loss=params['stop_loss'], min_vol=params['min_vol'], pair=tuple(pair))
+            entry = {'settings': settings, 'engine': engine, 'last': None}
+        new = prices if entry['last'] is None else prices[prices.index > entry['last']]
+        engine = entry['engine']
+        ticks = []
+        for ts, y, x in new.iloc[:, :2].itertuples():
+            if np.ndim(beta):
+                # bars before the first fitted β would leave NaN in the engine's windows for good
+                if np.isnan(beta[ts]):
+                    continue
+                engine.beta = beta[ts]
+            ticks.append(engine.update(ts, y, x))
+        if len(new):
+            entry['last'] = new.index[-1]
+        positions[label] = entry
+        self._save(path, positions)
+        return engine, ticks
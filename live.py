@@ -0,0 +1,285 @@
+import asyncio
+import math
+from collections import deque, namedtuple
+
+import pandas as pd
+
+Bar = namedtuple('Bar', ['pair', 'time', 'y', 'x'])
+Tick = namedtuple('Tick', ['pair', 'time', 'spread', 'z', 'position', 'pnl', 'cum_pnl', 'events'])
+
+
+class RollingWindow:
+    """
+    O(1)-per-bar rolling mean/std over the last `size` values.
+    Uses the same compensated add/remove updates as pandas' rolling mean/var,
+    so results are bit-identical to `Series.rolling(size).mean()/.std()`.
+    That holds for the pandas 2.x range pinned in pyproject.toml;
+    tests/test_live.py checks it bar for bar.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.window = deque()
+        # mean state
+        self._sum = self._add_c = self._rem_c = 0.0
+        self._neg = 0
+        self._same = 0
+        self._prev = None
+        # variance state
+        self._mean = self._ssq = self._vadd_c = self._vrem_c = 0.0
+
+    def push(self, val):
+        """Add a value (dropping the oldest once full) and return (mean, std)."""
+        if len(self.window) == self.size:
+            self._remove(self.window.popleft())
+        self.window.append(val)
+        self._add(val)
+        n = len(self.window)
+        if n < self.size:
+            return math.nan, math.nan
+        mean = self._sum / n
+        if self._same >= n:
+            mean = self._prev
+        elif self._neg == 0 and mean < 0:
+            mean = 0.0
+        elif self._neg == n and mean > 0:
+            mean = 0.0
+        if n < 2:
+            return mean, math.nan
+        var = 0.0 if self._same >= n else self._ssq / (n - 1)
+        return mean, math.sqrt(var) if var >= 0 else 0.0
+
+    def _add(self, val):
+        n = len(self.window)
+        y = val - self._add_c
+        t = self._sum + y
+        self._add_c = t - self._sum - y
+        self._sum = t
+        if math.copysign(1, val) < 0:
+            self._neg += 1
+        self._same = self._same + 1 if val == self._prev else 1
+        self._prev = val
+        prev_mean = self._mean - self._vadd_c
+        y = val - self._vadd_c
+        t = y - self._mean
+        self._vadd_c = t + self._mean - y
+        self._mean += t / n
+        self._ssq += (val - prev_mean) * (val - self._mean)
+
+    def _remove(self, val):
+        n = len(self.window)  # already popped
+        y = -val - self._rem_c
+        t = self._sum + y
+        self._rem_c = t - self._sum - y
+        self._sum = t
+        if math.copysign(1, val) < 0:
+            self._neg -= 1
+        if n:
+            prev_mean = self._mean - self._vrem_c
+            y = val - self._vrem_c
+            t = y - self._mean
+            self._vrem_c = t + self._mean - y
+            self._mean -= t / n
+            self._ssq -= (val - prev_mean) * (val - self._mean)
+        else:
+            self._mean = self._ssq = 0.0
+
+
+def _div(a, b):
+    # NumPy semantics for the odd zero/NaN case instead of ZeroDivisionError
+    if b == 0:
+        return math.nan if a == 0 or a != a else math.copysign(math.inf, a)
+    return a / b
+
+
+def _nan_to_zero(v):
+    return 0.0 if v != v else v
+
+
+class LiveSignalEngine:
+    """
+    Bar-by-bar version of generate_signals -> build_position -> backtest for one pair.
+    Holds O(lookback) state and does O(1) work per bar:
+      - spread, rolling z-score and (optionally) the low-vol mask
+      - long/short/exit signals, max-holding exits and the running position
+      - inverse-vol sizing, costs, stop-loss and P&L
+    `beta` is fixed (fit it on history, e.g. with `strat.hedge_ratio`).
+    """
+
+    def __init__(self, beta, lookback, z_enter, z_exit, max_holding=None,
+                 tc=0.001, stop_loss=-0.05, min_vol=None, vol_window=20, pair=None):
+        self.beta = beta
+        self.z_enter, self.z_exit = z_enter, z_exit
+        self.max_holding = max_holding
+        self.tc, self.stop_loss, self.min_vol = tc, stop_loss, min_vol
+        self.pair = pair
+        self._z_window = RollingWindow(lookback)
+        self._vol_window = RollingWindow(vol_window)
+        self._bars = 0
+        self._last_entry = None
+        self._raw_position = 0
+        self._prev = None  # (y, x, raw pos_y, raw pos_x, pos_y, pos_x)
+        self._cum_trade = 0.0
+        self.position = 0
+        self.cum_pnl = 0.0
+
+    def update(self, time, y, x):
+        """Consume one bar and return a `Tick` with the new state and any events."""
+        beta = self.beta
+        spread = y - beta * x
+        mu, sigma = self._z_window.push(spread)
+        _, vol = self._vol_window.push(spread)
+        z = _div(spread - mu, sigma)
+
+        long, short, exit = z < -self.z_enter, z > self.z_enter, abs(z) < self.z_exit
+        if self.min_vol is not None:
+            quiet = 0.0001 if (sigma != sigma or sigma == 0) else sigma
+            if quiet < self.min_vol:
+                long = short = exit = False
+
+        events = []
+        i = self._bars
+        self._bars += 1
+        if long or short:
+            self._last_entry = i
+        elif (self.max_holding is not None and self._last_entry is not None
+              and i - self._last_entry == max(self.max_holding, 1)):
+            exit = True
+            if self._raw_position != 0:
+                events.append('max_holding')
+        if long:
+            raw = 1
+        elif short:
+            raw = -1
+        elif exit:
+            raw = 0
+        else:
+            raw = self._raw_position
+        self._raw_position = raw
+
+        # Sizing and P&L, with the same operation order as backtest_arrays
+        inv_vol = _div(1.0, vol)
+        raw_y = raw * inv_vol
+        raw_x = -beta * raw_y
+        first = self._prev is None
+        r_raw = 0.0 if first else self._pnl(y, x, raw_y, raw_x, self._prev[2], self._prev[3])
+
+        # Stop-loss on the running trade P&L
+        position = raw
+        if raw != 0:
+            self._cum_trade += r_raw
+            if self._cum_trade < self.stop_loss:
+                position = 0
+                self._cum_trade = 0.0
+                events.append('stop_loss')
+        else:
+            self._cum_trade = 0.0
+
+        if position == raw:
+            pos_y, pos_x = raw_y, raw_x
+        else:
+            pos_y = position * inv_vol
+            pos_x = -beta * pos_y
+        pnl = 0.0 if first else self._pnl(y, x, pos_y, pos_x, self._prev[4], self._prev[5])
+        self._prev = (y, x, raw_y, raw_x, pos_y, pos_x)
+
+        if position != self.position:
+            events.append({1: 'enter_long', -1: 'enter_short', 0: 'exit'}[position])
+        self.position = position
+        self.cum_pnl += pnl
+        return Tick(self.pair, time, spread, z, position, pnl, self.cum_pnl, events)
+
+    def _pnl(self, y, x, pos_y, pos_x, prev_y, prev_x):
+        y0, x0 = self._prev[0], self._prev[1]
+        ret_y, ret_x = _div(y, y0) - 1, _div(x, x0) - 1
+        gross = prev_y * ret_y + prev_x * ret_x
+        cost = (abs(pos_y - prev_y) * y + abs(pos_x - prev_x) * x) * self.tc
+        return _nan_to_zero(gross - cost)
+
+
+class CSVReplaySource:
+    """Replay a wide price CSV (Date, y, x) as a stream of bars, optionally paced by `delay` seconds."""
+
+    def __init__(self, path, delay=0.0):
+        self.path = path
+        self.delay = delay
+
+    async def __aiter__(self):
+        prices = pd.read_csv(self.path, index_col=0, parse_dates=True)
+        pair = tuple(prices.columns[:2])
+        for ts, y, x in prices.iloc[:, :2].itertuples():
+            yield Bar(pair, ts, float(y), float(x))
+            await asyncio.sleep(self.delay)
+
+
+class SocketSource:
+    """Read bars from a TCP socket, one `pair_y,pair_x,timestamp,y,x` line per bar."""
+
+    def __init__(self, host='127.0.0.1', port=9009):
+        self.host, self.port = host, port
+
+    async def __aiter__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while line := await reader.readline():
+                ty, tx, ts, y, x = line.decode().strip().split(',')
+                yield Bar((ty, tx), pd.Timestamp(ts), float(y), float(x))
+        finally:
+            writer.close()
+
+
+async def run_live(source, engines, on_tick=None):
+    """
+    Drive one engine per pair from an async bar source.
+    `engines` maps pair -> LiveSignalEngine; `on_tick(tick)` is called as soon as
+    a bar produces events. Returns those ticks in arrival order.
+    """
+    ticks = []
+    async for bar in source:
+        engine = engines.get(bar.pair)
+        if engine is None:
+            continue
+        tick = engine.update(bar.time, bar.y, bar.x)
+        if tick.events:
+            ticks.append(tick)
+            if on_tick is not None:
+                on_tick(tick)
+    return ticks
+
+
+def replay_matches_batch(prices, lookback, z_enter, z_exit, max_holding=None, tc=0.001, stop_loss=-0.05):
+    """
+    Replay `prices` through the live engine and compare with the batch path
+    (generate_signals -> build_position -> run_backtest). Returns (positions_equal, pnl_equal).
+    """
+    from strat import generate_signals, build_position
+    from backtest import run_backtest
+
+    signals, beta = generate_signals(prices, lookback, z_enter, z_exit)
+    raw = build_position(signals['long'], signals['short'], signals['exit'], max_holding)
+    returns, _, position = run_backtest(prices, raw, beta, tc=tc, stop_loss=stop_loss)
+
+    engine = LiveSignalEngine(beta, lookback, z_enter, z_exit, max_holding, tc, stop_loss)
+    ticks = [engine.update(ts, y, x) for ts, y, x in prices.iloc[:, :2].itertuples()]
+    live_pos = [t.position for t in ticks]
+    live_pnl = [t.pnl for t in ticks]
+    return live_pos == position.tolist(), live_pnl == returns.tolist()
+
+
+if __name__ == '__main__':
+    import yaml
+    from strat import hedge_ratio
+
+    cfg = yaml.safe_load(open('config.yml'))
+    prices = pd.read_csv('prices.csv', index_col=0, parse_dates=True)
+    st = cfg['strategy']
+    beta = hedge_ratio(prices.iloc[:, 0], prices.iloc[:, 1])
+    pair = tuple(prices.columns[:2])
+    engine = LiveSignalEngine(beta, st['lookback'], st['z_enter'], st['z_exit'], st['max_holding'],
+                              tc=cfg['backtest']['tc_per_trade'], stop_loss=cfg['backtest']['stop_loss'], pair=pair)
+    ticks = asyncio.run(run_live(CSVReplaySource('prices.csv'), {pair: engine}))
+    print(pd.DataFrame(ticks).drop(columns='pair').tail(20).to_markdown())
+    same_pos, same_pnl = replay_matches_batch(
+        prices, st['lookback'], st['z_enter'], st['z_exit'], st['max_holding'],
+        tc=cfg['backtest']['tc_per_trade'], stop_loss=cfg['backtest']['stop_loss'])
+    print(f"\nReplay matches batch: positions={same_pos}, P&L={same_pnl}")
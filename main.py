@@ -1,87 +1,110 @@
-import yaml
 from data_fetch import fetch_prices
-from pair_selection import fetch_universe, find_pairs
-from strat import generate_signals
-from backtest import backtest
-from performance import report_performance, sharpe, max_drawdown
+from pair_selection import find_pairs
+from strat import generate_signals, build_position, fit_hedge, hedge_kwargs, pair_positions
+from backtest import run_backtest, portfolio_backtest
+from performance import report_performance, sharpe, max_drawdown, periods_per_year
+from price_store import PriceStore, set_default_store
+from sweep import DEFAULT_GRID, GRID_COLUMNS, walk_forward_windows, window_moments, evaluate_window, merge_windows, walk_forward_oos
+from scheduler import run_walk_forward
+from profiling import Profiler, set_profiler, stage
+from stats_cache import StatsCache
+from incremental import PipelineState, resolve_end
+from results_store import ResultsStore
+from search import search_options, run_search
+from universe import load_universe
 import pandas as pd
-from itertools import product
 
 def load_cfg(path='config.yml'):
+    import yaml
     return yaml.safe_load(open(path))
 
 def test_timeframes(tickers, start, end, interval, cfg):
-    from pandas import to_datetime
-    start, end = to_datetime(start), to_datetime(end)
-    window = pd.Timedelta(days=365)
+    # Download the full range once; every window below is served from the cache
+    history = fetch_prices(tickers, start, end, interval)
     results = []
-    lookbacks = [10, 20, 30]
-    z_enters = [1.5, 2.0, 2.5]
-    z_exits = [0.5, 1.0]
-    max_holdings = [5, 10, 20]
-    
-    current_start = start
-    while current_start + window <= end:
-        current_end = current_start + window
+    for current_start, current_end in walk_forward_windows(start, end):
         prices = fetch_prices(tickers, current_start.strftime('%Y-%m-%d'), current_end.strftime('%Y-%m-%d'), interval)
         if prices.empty or prices.isna().all().any():
-            current_start += pd.Timedelta(days=30)
             continue
-        for lb, ze, zx, mh in product(lookbacks, z_enters, z_exits, max_holdings):
-            signals, beta = generate_signals(prices, lookback=lb, z_enter=ze, z_exit=zx)
-            if signals.empty:
-                continue
-            spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
-            vol = spread.rolling(lb).std()
-            # Replace NaN or zero volatility with a small positive value to avoid division issues
-            vol = vol.fillna(0.0001).replace(0, 0.0001)
-            low_vol_mask = vol < cfg['strategy']['min_vol']
-            signals.loc[low_vol_mask, ['long', 'short', 'exit']] = 0
-            hold_days = 0
-            for date, row in signals.iterrows():
-                if row['long'] == 1 or row['short'] == 1:
-                    hold_days = 1
-                elif hold_days > 0:
-                    hold_days += 1
-                    if hold_days > mh:
-                        signals.at[date, 'exit'] = 1
-                        hold_days = 0
-                else:
-                    hold_days = 0
-            pos, current = [], 0
-            for _, row in signals.iterrows():
-                if row['long']:
-                    current = 1
-                elif row['short']:
-                    current = -1
-                elif row['exit']:
-                    current = 0
-                pos.append(current)
-            signals['position'] = pos
-            returns, cum_returns = backtest(prices, signals, beta, tc=cfg['backtest']['tc_per_trade'])
-            if not returns.empty and not cum_returns.empty:
-                total_return = cum_returns.iloc[-1]
-                results.append({
-                    'start': current_start,
-                    'end': current_end,
-                    'lookback': lb,
-                    'z_enter': ze,
-                    'z_exit': zx,
-                    'max_holding': mh,
-                    'total_return': total_return,
-                    'sharpe': sharpe(returns),
-                    'max_dd': max_drawdown(cum_returns)
-                })
-        current_start += pd.Timedelta(days=30)
-    results_df = pd.DataFrame(results)
-    if not results_df.empty:
-        results_df = results_df.sort_values('total_return', ascending=False)
-    return results_df
+        # overlapping windows slice one set of rolling moments instead of recomputing them
+        moments = window_moments(tuple(tickers), history, prices, DEFAULT_GRID['lookback'])
+        results.append(evaluate_window(prices, current_start, current_end, cfg, moments=moments))
+    return merge_windows(results)
+
+def run_portfolio(pairs, results, cfg):
+    """
+    Trade `pairs` together over the full date range, each with its best
+    parameter row in `results`. Returns (pair_returns, portfolio_returns).
+    """
+    params = [results[results['pair'] == f"{t1},{t2}"].iloc[0] for t1, t2 in pairs]
+    # fetch_prices orders columns alphabetically, so y is the first ticker of the sorted pair
+    pairs = [tuple(sorted(p)) for p in pairs]
+    tickers = sorted({t for p in pairs for t in p})
+    prices = fetch_prices(tickers, cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+    position, beta = pair_positions(prices, pairs, params, cfg)
+    # searched rows carry their own stop-loss, grid rows use the config's
+    stop_loss = [p.get('stop_loss', cfg['backtest']['stop_loss']) for p in params]
+    pair_returns, portfolio, _ = portfolio_backtest(prices, pairs, position, beta,
+                                                    tc=cfg['backtest']['tc_per_trade'],
+                                                    stop_loss=stop_loss)
+    return pair_returns, portfolio
+
+def report_best_window(best, t1, t2, cfg):
+    """Backtest and report the best in-sample row on its own window."""
+    prices = fetch_prices([t1, t2], best['start'].strftime('%Y-%m-%d'), best['end'].strftime('%Y-%m-%d'), cfg['data']['interval'])
+    if prices.empty or prices.isna().all().any():
+        print("Error: No valid price data for backtest.")
+        return
+    signals, beta = generate_signals(prices, lookback=best['lookback'], z_enter=best['z_enter'], z_exit=best['z_exit'],
+                                     beta=fit_hedge(prices, **hedge_kwargs(cfg)))
+    spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
+    vol = spread.rolling(best['lookback']).std()
+    vol = vol.fillna(0.0001).replace(0, 0.0001)
+    low_vol_mask = vol < best.get('min_vol', cfg['strategy']['min_vol'])
+    signals.loc[low_vol_mask, ['long', 'short', 'exit']] = 0
+    position = build_position(signals['long'], signals['short'], signals['exit'], best['max_holding'])
+    returns, cum_returns, signals['position'] = run_backtest(prices, position, beta, tc=cfg['backtest']['tc_per_trade'],
+                                                             stop_loss=best.get('stop_loss', cfg['backtest']['stop_loss']))
+    if not returns.empty and not cum_returns.empty:
+        report_performance(returns, cum_returns, signals, freq=periods_per_year(cfg['data']['interval']),
+                           plot=cfg.get('report', {}).get('plot', True))
+    else:
+        print("Error: Backtest returned empty results.")
+
+def run_oos(pairs, results, cfg):
+    """
+    Walk-forward out-of-sample test of each pair: parameters are picked on every
+    sweep window in `results` and traded on the `walk_forward.test_days` after it.
+    Returns {"T1,T2": (oos, selections)} as from `sweep.walk_forward_oos`.
+    """
+    wf = cfg.get('walk_forward', {})
+    out = {}
+    for t1, t2 in pairs:
+        label = f"{t1},{t2}"
+        prices = fetch_prices([t1, t2], cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+        out[label] = walk_forward_oos(
+            prices, cfg,
+            train_days=wf.get('train_days', 365),
+            test_days=wf.get('test_days', 30),
+            select=wf.get('select', 'sharpe'),
+            train_results=results[results['pair'] == label],
+            prune_after=wf.get('prune_after', 0),
+            prune_quantile=wf.get('prune_quantile', 0.5),
+            start=cfg['data']['start'],
+            end=cfg['data']['end']
+        )
+    return out
 
 def main():
     cfg = load_cfg()
+    cfg['data']['end'] = resolve_end(cfg['data']['end'])
+    # With `incremental.enabled`, screens, window results and positions carry over between runs
+    state = PipelineState.from_config(cfg)
+    set_default_store(PriceStore.from_config(cfg))
+    profiler = set_profiler(Profiler.from_config(cfg)).start()
     try:
-        uni = fetch_universe(cfg['tickers']['universe'],
+        # one (dates, tickers) matrix of closes and volumes feeds every screening stage
+        uni = load_universe(cfg['tickers']['universe'],
                             cfg['data']['start'],
                             cfg['data']['end'])
         if uni.empty:
@@ -90,80 +113,110 @@ def main():
         p_thresh = cfg['pair_selection']['p_thresh']
         corr_thresh = cfg['pair_selection']['corr_thresh']
         vol_thresh = cfg['pair_selection']['vol_thresh']
-        pairs, _ = find_pairs(uni, p_thresh, corr_thresh, vol_thresh)
+        def screen():
+            return find_pairs(uni, p_thresh, corr_thresh, vol_thresh,
+                              workers=cfg['pair_selection'].get('workers', 1),
+                              cache=StatsCache.from_config(cfg))
+        if state is not None:
+            pairs, _ = state.screen(screen, uni.tickers, cfg['data']['start'], cfg['data']['end'],
+                                    [p_thresh, corr_thresh, vol_thresh])
+        else:
+            pairs, _ = screen()
+        oos = {}
         if not pairs:
             print("Warning: No cointegrated pairs found. Using default pair.")
             t1, t2 = cfg['tickers']['pair']
+            # no sweep ran: trade the configured strategy over the whole range
+            best = pd.Series({**{c: cfg['strategy'][c] for c in GRID_COLUMNS},
+                              'min_vol': cfg['strategy']['min_vol'], 'stop_loss': cfg['backtest']['stop_loss'],
+                              'start': pd.Timestamp(cfg['data']['start']), 'end': pd.Timestamp(cfg['data']['end'])})
         else:
             top_pairs = pairs[:3] if len(pairs) >= 3 else pairs
-            all_results = []
-            for t1, t2 in top_pairs:
-                results = test_timeframes(
-                    [t1, t2],
+            # every finished window streams into the results store
+            sink = ResultsStore.from_config(cfg)
+            if sink is not None:
+                sink.clear()
+            rungs = {}
+            if search_options(cfg)['method'] != 'grid':
+                # sampled parameter sets, weak ones dropped after a few windows
+                all_results = run_search(top_pairs, cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'],
+                                         cfg, on_result=sink.append if sink is not None else None, report=rungs)
+            else:
+                # (pair, window) tasks fan out over `sweep.workers` processes
+                walk_forward = state.walk_forward if state is not None else run_walk_forward
+                all_results = walk_forward(
+                    top_pairs,
                     cfg['data']['start'],
                     cfg['data']['end'],
                     cfg['data']['interval'],
-                    cfg
+                    cfg,
+                    on_result=sink.append if sink is not None else None
                 )
-                if not results.empty:
-                    results['pair'] = f"{t1},{t2}"
-                    all_results.append(results)
-            if not all_results:
+            for label, log in rungs.items():
+                print(f"\nParameter search for {label} (best mean score per rung):")
+                print(log.to_markdown(index=False))
+            if all_results.empty:
                 print("Error: No valid results from timeframes.")
                 return
-            all_results = pd.concat(all_results, ignore_index=True)
-            all_results = all_results.sort_values('total_return', ascending=False)
-            # Write results to file instead of printing to terminal
-            with open('results.txt', 'w') as f:
-                f.write("\nTimeframe & Parameter Performance (sorted by total return):\n")
-                f.write(all_results.to_markdown())
+            if sink is not None:
+                sink.flush()
+                print(f"{len(sink)} result rows saved to '{sink.path}' (query with results_store.ResultsStore).")
+            # Only the top rows go to the text summary; the full sweep lives in the store
+            summary_rows = cfg.get('results', {}).get('markdown_top', 20)
+            with stage('report', rows=len(all_results)), open('results.txt', 'w') as f:
+                if summary_rows:
+                    order = 'total return' if 'rank' not in all_results else 'search rank, then mean score'
+                    f.write(f"\nTop {summary_rows} Timeframes & Parameters (sorted by {order}):\n")
+                    f.write(all_results.head(summary_rows).to_markdown())
                 best = all_results.iloc[0]
                 f.write(f"\n\nBest Timeframe: {best['start']} to {best['end']}\n")
                 f.write(f"Best Pair: {best['pair']}\n")
                 f.write(f"Best Parameters: lookback={best['lookback']}, z_enter={best['z_enter']}, "
                         f"z_exit={best['z_exit']}, max_holding={best['max_holding']}\n")
                 f.write(f"Total Return: {best['total_return']:.2f}\n")
-            print("Results have been saved to 'results.txt'. Please check the file for details.")
+            print("Summary has been saved to 'results.txt'.")
+            if len(top_pairs) > 1:
+                pair_returns, portfolio = run_portfolio(top_pairs, all_results, cfg)
+                print("\nPortfolio of top pairs (legs netted before costs):")
+                print(pair_returns.sum().to_frame('total_return').to_markdown())
+                print(f"Portfolio Total Return: {portfolio.sum():.2f}, "
+                      f"Sharpe: {sharpe(portfolio, periods_per_year(cfg['data']['interval'])):.2f}, Max Drawdown: {max_drawdown(portfolio.cumsum()):.2%}")
+            oos = run_oos(top_pairs, all_results, cfg) if cfg.get('walk_forward', {}).get('enabled', False) else {}
+            if oos:
+                freq = periods_per_year(cfg['data']['interval'])
+                summary = pd.DataFrame({
+                    label: {'total_return': o['returns'].sum(), 'sharpe': sharpe(o['returns'], freq),
+                            'max_dd': max_drawdown(o['returns'].cumsum()), 'windows': len(sel)}
+                    for label, (o, sel) in oos.items() if len(o)
+                }).T
+                print("\nWalk-forward out-of-sample (parameters picked per window, traded on the next segment):")
+                print(summary.to_markdown())
             t1, t2 = best['pair'].split(',')
-        prices = fetch_prices([t1, t2], best['start'].strftime('%Y-%m-%d'), best['end'].strftime('%Y-%m-%d'), cfg['data']['interval'])
-        if prices.empty or prices.isna().all().any():
-            print("Error: No valid price data for backtest.")
-            return
-        signals, beta = generate_signals(prices, lookback=best['lookback'], z_enter=best['z_enter'], z_exit=best['z_exit'])
-        spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
-        vol = spread.rolling(best['lookback']).std()
-        vol = vol.fillna(0.0001).replace(0, 0.0001)
-        low_vol_mask = vol < cfg['strategy']['min_vol']
-        signals.loc[low_vol_mask, ['long', 'short', 'exit']] = 0
-        max_h = best['max_holding']
-        hold_days = 0
-        for date, row in signals.iterrows():
-            if row['long'] == 1 or row['short'] == 1:
-                hold_days = 1
-            elif hold_days > 0:
-                hold_days += 1
-                if hold_days > max_h:
-                    signals.at[date, 'exit'] = 1
-                    hold_days = 0
-            else:
-                hold_days = 0
-        pos, current = [], 0
-        for _, row in signals.iterrows():
-            if row['long']:
-                current = 1
-            elif row['short']:
-                current = -1
-            elif row['exit']:
-                current = 0
-            pos.append(current)
-        signals['position'] = pos
-        returns, cum_returns = backtest(prices, signals, beta, tc=cfg['backtest']['tc_per_trade'])
-        if not returns.empty and not cum_returns.empty:
-            report_performance(returns, cum_returns, signals)
+        if oos and not summary.empty:
+            # report the pair's stitched out-of-sample record, not the best in-sample window
+            label = summary['sharpe'].astype(float).fillna(-float('inf')).idxmax()
+            returns = oos[label][0]['returns']
+            print(f"\nOut-of-sample performance of {label}:")
+            report_performance(returns, returns.cumsum(), oos[label][0][['position']],
+                               freq=periods_per_year(cfg['data']['interval']),
+                               plot=cfg.get('report', {}).get('plot', True))
         else:
-            print("Error: Backtest returned empty results.")
+            report_best_window(best, t1, t2, cfg)
+        if state is not None:
+            # carry the best pair's live position forward over the bars since the last run
+            history = fetch_prices([t1, t2], cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+            engine, ticks = state.advance_position(tuple(history.columns[:2]), history, best, cfg)
+            print(f"\nPosition in {t1},{t2}: {engine.position} after {len(ticks)} new bars, "
+                  f"cumulative P&L {engine.cum_pnl:.4f}")
     except Exception as e:
         print(f"Error in main: {e}")
+    finally:
+        profiler.stop()
+        print("\nStage profile:")
+        print(profiler.format())
+        output = cfg.get('profiling', {}).get('output')
+        if output:
+            profiler.write(output)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,34 +1,28 @@
-import yaml
-import yfinance as yf
 import pandas as pd
-from statsmodels.tsa.stattools import coint, adfuller
-from statsmodels.regression.linear_model import OLS
 from strat import hedge_ratio
+from price_store import default_store
+from profiling import profiled, add_rows
+from stats_cache import StatsCache, series_key
+from universe import Universe
 import numpy as np
 
 def load_cfg(path='config.yml'):
+    import yaml
     return yaml.safe_load(open(path))
 
-def fetch_universe(tickers, start, end):
+@profiled('fetch', rows=len)
+def fetch_universe(tickers, start, end, store=None):
     """
-    Download price series for your universe.
-    If 'Adj Close' exists, use it; otherwise fall back to the adjusted 'Close'.
+    Download adjusted price series for your universe.
+    Reads through the local price store, so reruns only download new dates.
     """
-    data = yf.download(
-        tickers,
-        start=start,
-        end=end,
-        auto_adjust=True,
-        progress=False
-    )
-    if 'Adj Close' in data.columns:
-        prices = data['Adj Close']
-    else:
-        prices = data['Close']
-    return prices.dropna(axis=1)
+    store = store if store is not None else default_store()
+    data = store.load(tickers, start, end)
+    return data['Adj Close'].dropna(axis=1)
 
 def spread_half_life(spread):
     """Estimate half-life of mean reversion for a spread."""
+    from statsmodels.regression.linear_model import OLS
     spread_lag = spread.shift(1)
     spread_diff = spread - spread_lag
     spread_lag = spread_lag - spread_lag.mean()  # Center the lagged spread
@@ -39,45 +33,235 @@ def spread_half_life(spread):
         return half_life if half_life > 0 else np.inf
     return np.inf
 
-def find_pairs(prices, p_thresh, corr_thresh, vol_thresh):
+def engle_granger_pvalues(y0, y1, chunk=256):
+    """
+    Batched NumPy version of `statsmodels.tsa.stattools.coint` (constant trend,
+    AIC lag selection). `y0`, `y1` are (n, pairs) arrays; returns one p-value per column.
+    """
+    from statsmodels.tsa.adfvalues import mackinnonp
+    y0 = np.asarray(y0, dtype=float)
+    y1 = np.asarray(y1, dtype=float)
+    n, n_pairs = y0.shape
+    maxlag = min(n // 2 - 1, int(np.ceil(12.0 * np.power(n / 100.0, 1 / 4.0))))
+    tstats = np.empty(n_pairs)
+    for c0 in range(0, n_pairs, chunk):
+        a, b = y0[:, c0:c0 + chunk], y1[:, c0:c0 + chunk]
+        # Step 1: cointegrating regression y0 ~ y1 + const
+        bm, am = b - b.mean(axis=0), a - a.mean(axis=0)
+        slope = (bm * am).sum(axis=0) / (bm * bm).sum(axis=0)
+        resid = am - slope * bm
+        r2 = 1 - (resid ** 2).sum(axis=0) / (am ** 2).sum(axis=0)
+        # Step 2: ADF (no trend) on the residuals
+        t = _adf_tstats(resid, maxlag)
+        t[r2 >= 1 - 100 * np.sqrt(np.finfo(float).eps)] = -np.inf  # (almost) colinear
+        tstats[c0:c0 + chunk] = t
+    return np.array([mackinnonp(t, regression='c', N=2) for t in tstats])
+
+def _lagged(e, lags):
+    """Design matrices [level, Δe_{t-1}..Δe_{t-lags}] and targets Δe_t, shape (pairs, nobs, ...)."""
+    d = np.diff(e, axis=0)
+    nobs = d.shape[0] - lags
+    cols = [e[lags:lags + nobs]] + [d[lags - j:lags - j + nobs] for j in range(1, lags + 1)]
+    X = np.stack(cols, axis=-1).transpose(1, 0, 2)
+    return X, d[lags:].T
+
+def _adf_tstats(e, maxlag):
+    X, y = _lagged(e, maxlag)
+    nobs = y.shape[1]
+    G = np.einsum('pni,pnj->pij', X, X)
+    g = np.einsum('pni,pn->pi', X, y)
+    yy = (y * y).sum(axis=1)
+    # AIC on a common sample for 1..maxlag+1 regressors; ties go to fewer lags
+    best_aic = np.full(e.shape[1], np.inf)
+    best = np.zeros(e.shape[1], dtype=int)
+    for k in range(1, maxlag + 2):
+        beta = np.linalg.solve(G[:, :k, :k], g[:, :k, None])[..., 0]
+        ssr = yy - (beta * g[:, :k]).sum(axis=1)
+        aic = nobs * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1) + 2 * k
+        better = aic < best_aic
+        best_aic[better], best[better] = aic[better], k - 1
+    # Re-fit each column with its chosen lag on the longest available sample
+    tstats = np.empty(e.shape[1])
+    for lags in np.unique(best):
+        cols = np.flatnonzero(best == lags)
+        X, y = _lagged(e[:, cols], lags)
+        G = np.einsum('pni,pnj->pij', X, X)
+        g = np.einsum('pni,pn->pi', X, y)
+        Ginv = np.linalg.inv(G)
+        beta = np.einsum('pij,pj->pi', Ginv, g)
+        ssr = (y * y).sum(axis=1) - (beta * g).sum(axis=1)
+        s2 = ssr / (y.shape[1] - lags - 1)
+        tstats[cols] = beta[:, 0] / np.sqrt(s2 * Ginv[:, 0, 0])
+    return tstats
+
+def _spread_stats(px, py):
+    """ADF p-value, average spread vol and half-life of the y - βx spread of one pair."""
+    # imported here rather than at module level: statsmodels is slow to load and
+    # only the spread stage (and its worker processes) needs it
+    from statsmodels.tsa.stattools import adfuller
+    beta = hedge_ratio(py, px)
+    spread = py - beta * px
+    adf_p = adfuller(spread.dropna())[1]
+    spread_vol = spread.rolling(20).std().mean()  # Avg spread volatility
+    half_life = spread_half_life(spread.dropna())
+    return adf_p, spread_vol, half_life
+
+def _column(universe, ticker, dates):
+    return pd.Series(universe.series(ticker), index=dates, name=ticker)
+
+def _shared_spread_stats(args):
+    """`_spread_stats` in a worker process, both legs read from the shared universe."""
+    desc, x, y = args
+    universe = Universe.attach(desc)
+    dates = universe.dates
+    return _spread_stats(_column(universe, x, dates), _column(universe, y, dates))
+
+def _digests(universe, tickers):
+    dates = universe.dates
+    return {c: series_key(_column(universe, c, dates)) for c in tickers}
+
+def _coint_pvalues(universe, ii, jj, cache=None, chunk=4096):
+    """
+    Engle-Granger p-values of the (ii[k], jj[k]) column pairs of `universe`,
+    from `engle_granger_pvalues` in chunks of `chunk` pairs. With a `StatsCache`
+    only pairs whose prices it hasn't seen are tested.
+    """
+    p = np.full(len(ii), np.nan)
+    todo = np.arange(len(ii))
+    if cache is not None and len(ii):
+        cols = universe.tickers
+        digest = _digests(universe, {cols[i] for i in ii} | {cols[j] for j in jj})
+        keys = [StatsCache.key('coint', (digest[cols[i]], digest[cols[j]])) for i, j in zip(ii, jj)]
+        known = cache.get_many(keys)
+        p[:] = [np.nan if v is None else v for v in known]
+        todo = np.flatnonzero(np.isnan(p))
+    values = universe.prices
+    for k in range(0, len(todo), chunk):
+        rows = todo[k:k + chunk]
+        p[rows] = engle_granger_pvalues(values[:, ii[rows]], values[:, jj[rows]])
+    if cache is not None and len(todo):
+        cache.put_many([(keys[k], float(p[k])) for k in todo])
+    return p
+
+def _exact_stats(universe, xs, ys, workers=1, cache=None):
+    """
+    `_spread_stats` for every (xs[k], ys[k]) pair of `universe` tickers, across
+    `workers` processes. Workers map the universe from shared memory, so only
+    ticker names are sent per task.
+    With a `StatsCache`, results are memoized by content hash: a pair's spread
+    is only refitted when its prices change.
+    """
+    if cache is not None:
+        digest = _digests(universe, set(xs) | set(ys))
+        keys = [StatsCache.key('spread', (digest[x], digest[y]), window=20) for x, y in zip(xs, ys)]
+        stats = cache.get_many(keys)
+    else:
+        stats = [None] * len(xs)
+    todo = [k for k, v in enumerate(stats) if v is None]
+
+    if workers != 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        desc = universe.share()
+        try:
+            tasks = [(desc, xs[k], ys[k]) for k in todo]
+            with ProcessPoolExecutor(max_workers=workers or None) as pool:
+                computed = list(pool.map(_shared_spread_stats, tasks,
+                                         chunksize=max(1, len(tasks) // (4 * (workers or 4)))))
+        finally:
+            universe.close()
+    else:
+        dates = universe.dates
+        computed = [_spread_stats(_column(universe, xs[k], dates), _column(universe, ys[k], dates)) for k in todo]
+    for k, result in zip(todo, computed):
+        stats[k] = result
+
+    if cache is not None and todo:
+        cache.put_many([(keys[k], [float(v) for v in stats[k]]) for k in todo])
+    return [tuple(v) for v in stats]
+
+@profiled('screen')
+def find_pairs(prices, p_thresh, corr_thresh, vol_thresh, store=None, workers=1, report=None, cache=None):
     """
     Test every unique pair of columns in `prices` for cointegration.
+    `prices` is a DataFrame of closes or a `universe.Universe`; a universe's
+    volume matrix replaces the store lookup in the liquidity stage.
+    Screening runs in stages, cheapest first, and each stage only sees the
+    survivors of the previous one:
+      1. liquidity: average volume of both legs above `vol_thresh`
+      2. correlation: one correlation matrix for the whole universe
+      3. cointegration: batched NumPy Engle-Granger test, the same statistic and
+         MacKinnon p-value as `statsmodels.tsa.stattools.coint` (to ~1e-13),
+         for all survivors at once instead of one `coint` call per pair
+      4. ADF and half-life of the y - βx spread (across `workers` processes)
+    Stages 3 and 4 reuse results memoized in `cache` (a `stats_cache.StatsCache`) when given.
+    If `report` is a dict it's filled with the number of pairs each stage eliminated.
     Returns:
       - pairs: list of (x, y) tuples ranked by composite score
       - scores: dict mapping (x, y) -> (p-value, spread_vol, half_life, score)
     """
     pairs, scores = [], {}
-    cols = prices.columns
-    vol_data = yf.download(cols, start=prices.index[0], end=prices.index[-1], progress=False, auto_adjust=True)['Volume']
-    for i, x in enumerate(cols):
-        for y in cols[i+1:]:
-            # Cointegration test
-            _, p, _ = coint(prices[x], prices[y])
-            if p < p_thresh:
-                # Correlation check
-                corr = prices[x].corr(prices[y])
-                # Liquidity check
-                avg_vol_x = vol_data[x].mean()
-                avg_vol_y = vol_data[y].mean()
-                # Stationarity and spread stats
-                beta = hedge_ratio(prices[y], prices[x])
-                spread = prices[y] - beta * prices[x]
-                adf_p = adfuller(spread.dropna())[1]
-                spread_vol = spread.rolling(20).std().mean()  # Avg spread volatility
-                half_life = spread_half_life(spread.dropna())
-                if (corr > corr_thresh and avg_vol_x > vol_thresh and 
-                    avg_vol_y > vol_thresh and adf_p < 0.05):
-                    # Composite score: lower p-value, higher vol, faster reversion
-                    score = (1 - p / p_thresh) + (spread_vol / 0.05) - (half_life / 20)
-                    pairs.append((x, y))
-                    scores[(x, y)] = (p, spread_vol, half_life, score)
+    universe = prices if isinstance(prices, Universe) else Universe.from_frame(prices)
+    prices = universe.frame()
+    cols = universe.tickers
+    ii, jj = np.triu_indices(len(cols), k=1)
+    counts = {'candidates': len(ii)}
+    add_rows('screen', len(ii))
+
+    # Stage 1: liquidity check
+    if universe.volume is not None:
+        avg_vol = universe.frame(volume=True).mean().to_numpy()
+    else:
+        store = store if store is not None else default_store()
+        vol_data = store.load(cols, prices.index[0], prices.index[-1])['Volume']
+        avg_vol = vol_data.mean().reindex(cols).to_numpy()
+    keep = (avg_vol[ii] > vol_thresh) & (avg_vol[jj] > vol_thresh)
+    counts['volume'] = int((~keep).sum())
+    ii, jj = ii[keep], jj[keep]
+
+    # Stage 2: correlation check; the tolerance leaves borderline pairs to the exact Series.corr
+    values = universe.prices
+    if len(ii):
+        corr = np.corrcoef(values, rowvar=False)
+        keep = corr[ii, jj] > corr_thresh - 1e-9
+        keep[keep] = [prices[cols[i]].corr(prices[cols[j]]) > corr_thresh
+                      for i, j in zip(ii[keep], jj[keep])]
+    else:
+        keep = np.zeros(0, dtype=bool)
+    counts['correlation'] = int((~keep).sum())
+    ii, jj = ii[keep], jj[keep]
+
+    # Stage 3: batched Engle-Granger test
+    p_values = _coint_pvalues(universe, ii, jj, cache)
+    keep = p_values < p_thresh
+    counts['coint'] = int((~keep).sum())
+    ii, jj, p_values = ii[keep], jj[keep], p_values[keep]
+
+    # Stage 4: spread statistics for the cointegrated pairs
+    stats = _exact_stats(universe, [cols[i] for i in ii], [cols[j] for j in jj], workers, cache)
+    counts['adf'] = 0
+    for i, j, p, (adf_p, spread_vol, half_life) in zip(ii, jj, p_values, stats):
+        x, y = cols[i], cols[j]
+        if adf_p >= 0.05:
+            counts['adf'] += 1
+        else:
+            # Composite score: lower p-value, higher vol, faster reversion
+            score = (1 - p / p_thresh) + (spread_vol / 0.05) - (half_life / 20)
+            pairs.append((x, y))
+            scores[(x, y)] = (float(p), spread_vol, half_life, score)
+    counts['selected'] = len(pairs)
+    if cache is not None:
+        cache.flush()
+    if report is not None:
+        report.update(counts)
     # Sort by composite score (higher is better)
     pairs.sort(key=lambda pair: scores[pair][3], reverse=True)
     return pairs, scores
 
 if __name__ == '__main__':
+    from price_store import PriceStore, set_default_store
     cfg = load_cfg()
-    uni = fetch_universe(
+    set_default_store(PriceStore.from_config(cfg))
+    uni = Universe.from_store(
         cfg['tickers']['universe'],
         cfg['data']['start'],
         cfg['data']['end']
@@ -85,7 +269,12 @@ if __name__ == '__main__':
     p_thresh = cfg['pair_selection']['p_thresh']
     corr_thresh = cfg['pair_selection']['corr_thresh']
     vol_thresh = cfg['pair_selection']['vol_thresh']
-    pairs, scores = find_pairs(uni, p_thresh=p_thresh, corr_thresh=corr_thresh, vol_thresh=vol_thresh)
+    report = {}
+    pairs, scores = find_pairs(uni, p_thresh=p_thresh, corr_thresh=corr_thresh, vol_thresh=vol_thresh,
+                               workers=cfg['pair_selection'].get('workers', 1), report=report,
+                               cache=StatsCache.from_config(cfg))
+    print("Screening stages (pairs eliminated):")
+    print(pd.Series(report).to_markdown())
     df = pd.DataFrame(
         [{'pair': f"{x},{y}", 'p_value': p, 'spread_vol': vol, 'half_life': hl, 'score': s}
          for (x, y), (p, vol, hl, s) in scores.items()]
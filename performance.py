@@ -1,7 +1,32 @@
+import math
+import re
+
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 
+from profiling import stage
+
+
+# Trading periods per year by interval unit (US equities: 252 sessions of 390 minutes)
+_SESSION_MINUTES = 390
+_PER_YEAR = {'d': 252, 'wk': 52, 'mo': 12}
+
+
+def periods_per_year(interval='1d'):
+    """
+    Annualization factor for bars of a yfinance-style `interval`
+    ('1m', '5m', '1h', '1d', '1wk', '1mo', ...). Intraday intervals count the
+    bars in a session, including a short last one (7 hourly bars a day).
+    """
+    match = re.fullmatch(r'(\d+)(m|h|d|wk|mo)', str(interval))
+    if match is None:
+        raise ValueError(f"Unknown interval: {interval}")
+    n, unit = int(match[1]), match[2]
+    if unit in ('m', 'h'):
+        minutes = n * (60 if unit == 'h' else 1)
+        return 252 * math.ceil(_SESSION_MINUTES / minutes)
+    return _PER_YEAR[unit] / n
+
 
 def sharpe(returns, freq=252):
     """Annualized Sharpe ratio of daily return Series"""
@@ -21,6 +46,81 @@ def max_drawdown(cum_returns):
     return drawdown.min()
 
 
+def sharpe_batch(returns, freq=252):
+    """Annualized Sharpe ratio of every column of a 2-D return array"""
+    returns = np.asfortranarray(returns)  # contiguous columns sum like a Series
+    n = returns.shape[0]
+    mean = returns.sum(axis=0) / n
+    std = np.sqrt(((returns - mean) ** 2).sum(axis=0) / (n - 1)) if n > 1 else np.full(mean.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.sqrt(freq) * mean / std
+    return np.where((std == 0) | np.isnan(std), np.nan, out)
+
+
+def max_drawdown_batch(cum_returns):
+    """Worst peak-to-trough drawdown of every column of a 2-D cumulative P&L array"""
+    cum_returns = np.asfortranarray(cum_returns)
+    n = cum_returns.shape[0]
+    if n == 0:
+        return np.zeros(cum_returns.shape[1])
+    mean = cum_returns.sum(axis=0) / n
+    std = np.sqrt(((cum_returns - mean) ** 2).sum(axis=0) / (n - 1)) if n > 1 else np.full(mean.shape, np.nan)
+    peak = np.maximum.accumulate(cum_returns, axis=0)
+    drawdown = (cum_returns - peak) / np.where(peak == 0, 1e-10, peak)  # Avoid division by zero
+    return np.where(std == 0, 0.0, drawdown.min(axis=0))
+
+
+def _as_2d(a):
+    a = np.asarray(a, dtype=float)
+    return a[:, None] if a.ndim == 1 else a
+
+
+def trade_segments(position):
+    """
+    Run-length encode the trades in a position array: a trade is a run of
+    consecutive non-zero bars (a flip from long to short without going flat
+    stays one trade).
+    `position` is 1-D or 2-D (one column per backtest).
+    Returns (start, end, column) int arrays, `end` exclusive, ordered by column then start.
+    """
+    in_trade = np.asarray(position) != 0
+    if in_trade.ndim == 1:
+        in_trade = in_trade[:, None]
+    # pad every column with a flat bar so runs can't join across columns
+    flat = np.vstack([in_trade, np.zeros((1, in_trade.shape[1]), dtype=bool)]).ravel(order='F')
+    edges = np.diff(np.concatenate(([False], flat)).astype(np.int8))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    rows = in_trade.shape[0] + 1
+    column = starts // rows
+    return starts - column * rows, ends - column * rows, column
+
+
+def trade_stats_batch(returns, position):
+    """
+    Per-column trade statistics of 2-D `returns`/`position` arrays:
+      - number of trades
+      - win rate
+      - average P&L per trade
+    Returns three arrays with one value per column (NaN where a column never trades).
+    """
+    returns = _as_2d(returns)
+    n_rows, n_cols = returns.shape
+    start, end, column = trade_segments(position)
+    flat = np.vstack([returns, np.zeros((1, n_cols))]).ravel(order='F')
+    offset = column * (n_rows + 1)
+    if len(start):
+        pnl = np.add.reduceat(flat, np.column_stack([start, end]).ravel() + np.repeat(offset, 2))[::2]
+    else:
+        pnl = np.zeros(0)
+    num_trades = np.bincount(column, minlength=n_cols)
+    wins = np.bincount(column, weights=pnl > 0, minlength=n_cols)
+    total = np.bincount(column, weights=pnl, minlength=n_cols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_rate = np.where(num_trades > 0, wins / num_trades, np.nan)
+        avg_pnl = np.where(num_trades > 0, total / num_trades, np.nan)
+    return num_trades, win_rate, avg_pnl
+
+
 def trade_stats(returns, signals):
     """
     Compute basic per-trade statistics:
@@ -28,49 +128,118 @@ def trade_stats(returns, signals):
       - win rate
       - average P&L per trade
     """
-    df = pd.DataFrame({'returns': returns, 'position': signals['position']})
-    # identify periods in trade
-    df['in_trade'] = df['position'] != 0
-    # mark new trades when in_trade starts
-    shifted = df['in_trade'].shift(1)
-    shifted = (~shifted.isna() & shifted).astype(bool)
-    df['trade_id'] = (df['in_trade'] & ~shifted).cumsum()
-    # filter only periods within trades
-    trade_returns = df[df['in_trade']].groupby('trade_id')['returns'].sum()
-    num_trades = trade_returns.shape[0]
-    win_rate = (trade_returns > 0).mean() if num_trades > 0 else np.nan
-    avg_pnl = trade_returns.mean() if num_trades > 0 else np.nan
-    return num_trades, win_rate, avg_pnl
+    num_trades, win_rate, avg_pnl = trade_stats_batch(np.asarray(returns), np.asarray(signals['position']))
+    return int(num_trades[0]), win_rate[0], avg_pnl[0]
+
+
+def rolling_sharpe(returns, window, freq=252):
+    """
+    Annualized Sharpe ratio over a trailing `window` of bars, for every column
+    of a 1-D/2-D return array. The first window - 1 rows are NaN, as are
+    windows with (numerically) zero volatility.
+    """
+    r = _as_2d(returns)
+    # centre each column first so the running sums don't cancel
+    centre = r.mean(axis=0) if len(r) else np.zeros(r.shape[1])
+    d = r - centre
+    s1 = np.cumsum(d, axis=0)
+    s2 = np.cumsum(d * d, axis=0)
+    s1[window:] -= s1[:-window].copy()
+    s2[window:] -= s2[:-window].copy()
+    mean = s1 / window
+    std = np.sqrt(np.maximum(s2 - s1 * mean, 0) / (window - 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.sqrt(freq) * (mean + centre) / std
+    out[std <= 1e-7 * np.abs(mean)] = np.nan
+    out[:window - 1] = np.nan
+    return out[:, 0] if np.ndim(returns) == 1 else out
+
+
+def rolling_drawdown(cum_returns, window=None):
+    """
+    Drawdown of every bar from the running peak (over all history, or the last
+    `window` bars), on the same relative scale as `max_drawdown`.
+    """
+    c = _as_2d(cum_returns)
+    if window is None:
+        peak = np.maximum.accumulate(c, axis=0)
+    else:
+        peak = pd.DataFrame(c).rolling(window, min_periods=1).max().to_numpy()
+    out = (c - peak) / np.where(peak == 0, 1e-10, peak)
+    return out[:, 0] if np.ndim(cum_returns) == 1 else out
 
 
-def report_performance(returns, cum_returns, signals=None):
+def metrics_batch(returns, position=None, freq=252):
+    """
+    Score a whole batch of backtests at once. `returns` is (bars, n), one column
+    per backtest; pass the matching `position` array for trade statistics.
+    Returns a DataFrame with one row per column: total_return, sharpe, max_dd
+    and, with `position`, num_trades, win_rate, avg_pnl.
+    """
+    returns = _as_2d(returns)
+    cum_returns = np.cumsum(returns, axis=0)
+    out = pd.DataFrame({
+        'total_return': cum_returns[-1] if len(returns) else np.zeros(returns.shape[1]),
+        'sharpe': sharpe_batch(returns, freq),
+        'max_dd': max_drawdown_batch(cum_returns),
+    })
+    if position is not None:
+        out['num_trades'], out['win_rate'], out['avg_pnl'] = trade_stats_batch(returns, position)
+    return out
+
+
+def report_performance(returns, cum_returns, signals=None, freq=252, plot=True):
     """
     Print key performance metrics and plot equity curve.
     If `signals` is provided, also prints trade-level stats.
+    `freq` is bars per year (see `periods_per_year`).
+    `plot`: True shows the curve, a file path saves it without a display,
+    False skips it (matplotlib is never imported).
     """
-    print(f"Total Return:     {cum_returns.iloc[-1]:.2f}")
-    print(f"Sharpe Ratio:     {sharpe(returns):.2f}")
-    print(f"Max Drawdown:    {max_drawdown(cum_returns):.2%}")
-
-    # trade-level stats
-    if signals is not None and 'position' in signals:
-        num_trades, win_rate, avg_pnl = trade_stats(returns, signals)
-        print(f"Number of trades: {num_trades}")
-        print(f"Win rate:         {win_rate:.2%}")
-        print(f"Avg P&L/trade:    {avg_pnl:.2f}")
-
-    # plot equity curve
-    plt.figure()
-    plt.plot(cum_returns)
-    plt.title("Cumulative P&L")
-    plt.xlabel("Date")
-    plt.ylabel("P&L")
-    plt.show()
+    with stage('metrics', rows=len(returns)):
+        print(f"Total Return:     {cum_returns.iloc[-1]:.2f}")
+        print(f"Sharpe Ratio:     {sharpe(returns, freq):.2f}")
+        print(f"Max Drawdown:    {max_drawdown(cum_returns):.2%}")
+
+        # trade-level stats
+        if signals is not None and 'position' in signals:
+            num_trades, win_rate, avg_pnl = trade_stats(returns, signals)
+            print(f"Number of trades: {num_trades}")
+            print(f"Win rate:         {win_rate:.2%}")
+            print(f"Avg P&L/trade:    {avg_pnl:.2f}")
+
+    if plot:
+        with stage('report', rows=len(cum_returns)):
+            plot_equity(cum_returns, None if plot is True else plot)
+
+
+def plot_equity(cum_returns, path=None):
+    """
+    Plot the equity curve: shown with pyplot, or written to `path` through a bare
+    Figure so no GUI backend is loaded (works on headless machines).
+    """
+    if path is None:
+        import matplotlib.pyplot as plt
+        plt.figure()
+        plt.plot(cum_returns)
+        plt.title("Cumulative P&L")
+        plt.xlabel("Date")
+        plt.ylabel("P&L")
+        plt.show()
+        return
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(cum_returns)
+    ax.set_title("Cumulative P&L")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("P&L")
+    fig.savefig(path)
 
 if __name__ == '__main__':
     import yaml
-    from backtest import backtest
-    from strat import generate_signals
+    from backtest import run_backtest
+    from strat import generate_signals, build_position, fit_hedge, hedge_kwargs
     from data_fetch import fetch_prices
 
     # load config
@@ -82,27 +251,18 @@ if __name__ == '__main__':
         prices,
         lookback=cfg['strategy']['lookback'],
         z_enter=cfg['strategy']['z_enter'],
-        z_exit=cfg['strategy']['z_exit']
+        z_exit=cfg['strategy']['z_exit'],
+        beta=fit_hedge(prices, **hedge_kwargs(cfg))
     )
     # build position
-    pos = []
-    current = 0
-    for _, row in signals.iterrows():
-        if row['long']:
-            current =  1
-        elif row['short']:
-            current = -1
-        elif row['exit']:
-            current =  0
-        pos.append(current)
-    signals['position'] = pos
-
-    # backtest
-    returns, cum_returns = backtest(
+    position = build_position(signals['long'], signals['short'], signals['exit'])
+
+    # backtest (trade stats use the position after stop-loss exits)
+    returns, cum_returns, signals['position'] = run_backtest(
         prices,
-        signals,
+        position,
         beta,
         tc=cfg['backtest']['tc_per_trade']
     )
     # report performance including trade stats
-    report_performance(returns, cum_returns, signals)
+    report_performance(returns, cum_returns, signals, freq=periods_per_year(cfg['data'].get('interval', '1d')))
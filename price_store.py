@@ -0,0 +1,411 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# Columns kept for every ticker, in the same order yfinance returns them
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+DEFAULT_CACHE_DIR = '.price_cache'
+
+
+class YFinanceBackend:
+    """
+    Download raw (unadjusted + Adj Close) OHLCV bars from Yahoo Finance.
+    `yf.download` keeps its results in module-level state, so calls are
+    serialized; each call already fetches its tickers on yfinance's own threads.
+    yfinance only logs failed tickers (leaving them empty), so they're raised
+    here: the store retries the request and leaves the range uncovered instead
+    of caching it as empty for good.
+    """
+
+    _lock = threading.Lock()
+
+    def download(self, tickers, start, end, interval):
+        import yfinance as yf
+        with self._lock:
+            data = yf.download(
+                list(tickers),
+                start=start,
+                end=end,
+                interval=interval,
+                progress=False,
+                auto_adjust=False,
+                group_by='column'
+            )
+            failed = sorted(set(tickers) & set(getattr(yf.shared, '_ERRORS', None) or {}))
+        if failed:
+            raise ConnectionError(f"yfinance failed for {', '.join(failed)}")
+        return split_by_ticker(data, tickers)
+
+
+class CSVBackend:
+    """
+    Offline backend reading local files instead of the network.
+    `path` is either:
+      - a wide CSV like `prices.csv` (Date index, one close column per ticker), or
+      - a directory of `<TICKER>.csv` files with OHLCV columns.
+    Wide files carry no volume, so `Volume` comes back as NaN.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._wide = None
+
+    def _read_ticker(self, ticker):
+        if os.path.isdir(self.path):
+            fname = os.path.join(self.path, f"{ticker}.csv")
+            if not os.path.exists(fname):
+                return None
+            df = pd.read_csv(fname, index_col=0, parse_dates=True)
+            if 'Adj Close' not in df.columns and 'Close' in df.columns:
+                df['Adj Close'] = df['Close']
+            return df.reindex(columns=FIELDS)
+        if self._wide is None:
+            self._wide = pd.read_csv(self.path, index_col=0, parse_dates=True)
+        if ticker not in self._wide.columns:
+            return None
+        close = self._wide[ticker]
+        df = pd.DataFrame(np.nan, index=close.index, columns=FIELDS)
+        df['Close'] = close
+        df['Adj Close'] = close
+        return df
+
+    def download(self, tickers, start, end, interval):
+        out = {}
+        for t in tickers:
+            df = self._read_ticker(t)
+            if df is None:
+                continue
+            out[t] = df.loc[(df.index >= start) & (df.index < end)].dropna(how='all')
+        return out
+
+
+class MockBackend:
+    """
+    Wraps another backend (e.g. `bench.SyntheticBackend`) with injected latency
+    and failures, for testing the fetch layer without the network.
+      - `latency`: seconds slept per call
+      - `failure_rate`: chance a call raises ConnectionError
+      - `fail_first`: the first N calls always fail
+    Every call is logged in `calls` as (tickers, start, end, interval).
+    """
+
+    def __init__(self, backend, latency=0.0, failure_rate=0.0, fail_first=0, seed=0):
+        self.backend = backend
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fail_first = fail_first
+        self.calls = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def download(self, tickers, start, end, interval):
+        with self._lock:
+            self.calls.append((tuple(tickers), start, end, interval))
+            fail = len(self.calls) <= self.fail_first or self._rng.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise ConnectionError(f"mock failure for {len(tickers)} tickers")
+        return self.backend.download(tickers, start, end, interval)
+
+
+def split_by_ticker(data, tickers):
+    """Turn a yf.download frame into {ticker: DataFrame[FIELDS]}, dropping empty rows."""
+    out = {}
+    if data is None or data.empty:
+        return out
+    if not isinstance(data.columns, pd.MultiIndex):
+        # single ticker download without the ticker level
+        data = pd.concat({tickers[0]: data}, axis=1).swaplevel(0, 1, axis=1)
+    for t in tickers:
+        if t not in data.columns.get_level_values(1):
+            continue
+        df = data.xs(t, axis=1, level=1).reindex(columns=FIELDS).dropna(how='all')
+        if not df.empty:
+            out[t] = df
+    return out
+
+
+def _missing_ranges(covered, start, end):
+    """Parts of [start, end) not already inside one of the `covered` intervals."""
+    gaps, cursor = [], start
+    for s, e in sorted(covered):
+        if e <= cursor:
+            continue
+        if s >= end:
+            break
+        if s > cursor:
+            gaps.append((cursor, min(s, end)))
+        cursor = max(cursor, e)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _merge_ranges(covered):
+    merged = []
+    for s, e in sorted(covered):
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+class PriceStore:
+    """
+    Persistent OHLCV cache keyed by (ticker, interval).
+    Each key is stored as memory-mapped NumPy arrays:
+      - `index.npy`: int64 nanosecond timestamps (UTC for tz-aware data)
+      - `values.npy`: float64 matrix with one column per field in FIELDS
+      - `meta.json`: date ranges already requested from the backend
+    Only ranges not yet covered are downloaded; windows are served as slices
+    of the mapped arrays. With `root=None` everything stays in memory.
+    Downloads are batched: every ticker missing the same range shares one
+    request (at most `batch_size` tickers), and requests run on `workers`
+    threads, each retried `retries` times with exponential backoff.
+    The last `frames` loaded frames are kept and handed back to later calls
+    for the same tickers and dates, so treat them as read-only.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, backend=None, workers=4, batch_size=100,
+                 retries=3, backoff=1.0, frames=8):
+        self.root = root
+        self.backend = backend if backend is not None else YFinanceBackend()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_frames = frames
+        self._mem = {}
+        self._frames = OrderedDict()
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Build a store from the `data` section of config.yml."""
+        data = cfg.get('data', {})
+        source = data.get('source', 'yfinance')
+        fetch = {'workers': data.get('fetch_workers', 4), 'batch_size': data.get('fetch_batch', 100),
+                 'retries': data.get('fetch_retries', 3), 'backoff': data.get('fetch_backoff', 1.0)}
+        if source == 'csv':
+            # offline files are already local, so keep them out of the on-disk cache
+            return cls(root=None, backend=CSVBackend(data.get('offline_path', 'prices.csv')), **fetch)
+        if source != 'yfinance':
+            raise ValueError(f"Unknown data source: {source}")
+        return cls(root=data.get('cache_dir', DEFAULT_CACHE_DIR), backend=YFinanceBackend(), **fetch)
+
+    # -- storage -----------------------------------------------------------
+
+    def _dir(self, ticker, interval):
+        return os.path.join(self.root, interval, ticker)
+
+    def _read(self, ticker, interval):
+        key = (ticker, interval)
+        if key in self._mem:
+            return self._mem[key]
+        if self.root is None:
+            return None
+        d = self._dir(ticker, interval)
+        if not os.path.exists(os.path.join(d, 'meta.json')):
+            return None
+        with open(os.path.join(d, 'meta.json')) as f:
+            meta = json.load(f)
+        entry = {
+            'index': np.load(os.path.join(d, 'index.npy'), mmap_mode='r'),
+            'values': np.load(os.path.join(d, 'values.npy'), mmap_mode='r'),
+            'covered': [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in meta['covered']],
+            'tz': meta.get('tz'),
+        }
+        self._mem[key] = entry
+        return entry
+
+    def _write(self, ticker, interval, index, values, covered, tz):
+        key = (ticker, interval)
+        for k in [k for k in self._frames if k[3] == interval and ticker in k[0]]:
+            del self._frames[k]
+        if self.root is None:
+            self._mem[key] = {'index': index, 'values': values, 'covered': covered, 'tz': tz}
+            return
+        d = self._dir(ticker, interval)
+        os.makedirs(d, exist_ok=True)
+        # write to temp files and swap in so concurrent readers never see a partial key
+        for name, arr in (('index', index), ('values', values)):
+            tmp = os.path.join(d, f'{name}.tmp.npy')
+            np.save(tmp, arr)
+            os.replace(tmp, os.path.join(d, f'{name}.npy'))
+        meta = {'covered': [[s.isoformat(), e.isoformat()] for s, e in covered], 'tz': tz}
+        tmp = os.path.join(d, 'meta.tmp.json')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, 'meta.json'))
+        self._mem.pop(key, None)
+
+    # -- public API --------------------------------------------------------
+
+    def prefetch(self, tickers, start, end, interval='1d'):
+        """Make sure [start, end) is cached for every ticker, downloading only the gaps."""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        # never mark bars that may still change (today / the future) as covered
+        end_covered = min(end, pd.Timestamp.now().normalize())
+        gaps = {}
+        for t in tickers:
+            entry = self._read(t, interval)
+            covered = entry['covered'] if entry else []
+            for gap in _missing_ranges(covered, start, end):
+                gaps.setdefault(gap, []).append(t)
+        # one batched download per distinct gap, shared by every ticker missing it
+        requests = [(group[k:k + self.batch_size], g_start, g_end)
+                    for (g_start, g_end), group in gaps.items()
+                    for k in range(0, len(group), self.batch_size)]
+        if not requests:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(requests)))) as pool:
+            futures = {pool.submit(self._download, group, g_start, g_end, interval): (group, g_start, g_end)
+                       for group, g_start, g_end in requests}
+            # results are merged on this thread as they arrive, so the store is never written concurrently
+            for fut in as_completed(futures):
+                group, g_start, g_end = futures[fut]
+                try:
+                    fetched = fut.result()
+                except Exception as e:
+                    # leave the range uncovered so the next call tries again
+                    print(f"Warning: download of {len(group)} tickers for {g_start:%Y-%m-%d}..{g_end:%Y-%m-%d} "
+                          f"failed: {e}")
+                    continue
+                for t in group:
+                    self._merge(t, interval, fetched.get(t), (g_start, min(g_end, end_covered)))
+
+    def _download(self, tickers, start, end, interval):
+        """One backend request, retried with exponential backoff and jitter."""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.backend.download(tickers, start, end, interval)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random() / 2))
+
+    def _merge(self, ticker, interval, df, new_range):
+        entry = self._read(ticker, interval)
+        tz = entry['tz'] if entry else None
+        if df is not None and not df.empty:
+            idx = df.index
+            if idx.tz is not None:
+                tz = str(idx.tz)
+                idx = idx.tz_convert('UTC').tz_localize(None)
+            new = pd.DataFrame(df[FIELDS].to_numpy(dtype='float64'), index=idx, columns=FIELDS)
+        else:
+            new = pd.DataFrame(columns=FIELDS, dtype='float64')
+        if entry is not None and len(entry['index']):
+            old = pd.DataFrame(np.asarray(entry['values']),
+                               index=pd.DatetimeIndex(np.asarray(entry['index'])), columns=FIELDS)
+            new = new.combine_first(old) if not new.empty else old
+        new = new[~new.index.duplicated(keep='first')].sort_index()
+        covered = list(entry['covered']) if entry else []
+        if new_range[0] < new_range[1]:
+            covered.append(new_range)
+        index = new.index.asi8.astype('int64') if len(new) else np.empty(0, dtype='int64')
+        values = np.ascontiguousarray(new.to_numpy(dtype='float64')).reshape(-1, len(FIELDS))
+        self._write(ticker, interval, index, values, _merge_ranges(covered), tz)
+
+    def arrays(self, ticker, start, end, interval='1d'):
+        """
+        Raw zero-copy slices of cached bars in [start, end): (int64 UTC nanosecond
+        timestamps, values matrix). Nothing is converted, so it's cheap for any
+        history length; `chunked.py` reads minute bars through it block by block.
+        """
+        entry = self._read(ticker, interval)
+        if entry is None or not len(entry['index']):
+            return np.empty(0, dtype='int64'), np.empty((0, len(FIELDS)))
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if entry['tz']:
+            start = start.tz_localize(entry['tz']) if start.tz is None else start
+            end = end.tz_localize(entry['tz']) if end.tz is None else end
+            start, end = start.tz_convert('UTC').tz_localize(None), end.tz_convert('UTC').tz_localize(None)
+        i0, i1 = np.searchsorted(entry['index'], [start.value, end.value], side='left')
+        return entry['index'][i0:i1], entry['values'][i0:i1]
+
+    def to_index(self, ticker, timestamps, interval='1d'):
+        """DatetimeIndex for int64 timestamps from `arrays`, in the ticker's timezone."""
+        idx = pd.DatetimeIndex(timestamps)
+        entry = self._read(ticker, interval)
+        if entry is not None and entry['tz']:
+            idx = idx.tz_localize('UTC').tz_convert(entry['tz'])
+        return idx
+
+    def window(self, ticker, start, end, interval='1d'):
+        """
+        Zero-copy view of cached bars in [start, end).
+        Returns (DatetimeIndex, values) where `values` is a slice of the stored matrix.
+        """
+        index, values = self.arrays(ticker, start, end, interval)
+        if not len(index):
+            return pd.DatetimeIndex([]), values
+        return self.to_index(ticker, index, interval), values
+
+    def _shared_frame(self, tickers, start, end, interval):
+        """A kept frame covering the request, sliced down to it; None if there's none."""
+        key = (tuple(tickers), start, end, interval)
+        if key in self._frames:
+            self._frames.move_to_end(key)
+            return self._frames[key]
+        for (k_tickers, k_start, k_end, k_interval), data in reversed(self._frames.items()):
+            if (k_interval != interval or k_start > start or k_end < end or not set(tickers) <= set(k_tickers)
+                    or data.index.tz is not None):
+                continue
+            rows = (data.index >= start) & (data.index < end)
+            cols = data.columns.get_level_values(1).isin(tickers)
+            return data.loc[rows, cols].dropna(how='all')
+        return None
+
+    def load(self, tickers, start, end, interval='1d'):
+        """
+        Return bars for `tickers` shaped like `yf.download(..., auto_adjust=False)`:
+        columns are a (field, ticker) MultiIndex, tickers sorted, dates outer-joined.
+        Repeated requests get the kept frame (or a slice of a wider one).
+        """
+        tickers = sorted(set(tickers))
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        self.prefetch(tickers, start, end, interval)
+        data = self._shared_frame(tickers, start, end, interval)
+        if data is not None:
+            return data
+        frames = {}
+        for t in tickers:
+            idx, values = self.window(t, start, end, interval)
+            frames[t] = pd.DataFrame(values, index=idx, columns=FIELDS, copy=False)
+        data = pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+        data = data.swaplevel(0, 1, axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+        data.index.name = 'Date'
+        data = data.dropna(how='all')
+        if self.max_frames:
+            self._frames[tuple(tickers), start, end, interval] = data
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return data
+
+
+_default_store = None
+
+
+def default_store():
+    """Process-wide store used when callers don't pass one explicitly."""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
+
+
+def set_default_store(store):
+    """Swap the process-wide store, e.g. for an offline backend."""
+    global _default_store
+    _default_store = store
+    return store
@@ -0,0 +1,218 @@
+import cProfile
+import functools
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Pipeline stages, in the order the summary lists them
+STAGES = ['fetch', 'screen', 'signal', 'backtest', 'metrics', 'report']
+
+
+def _rss_mb():
+    """Peak resident set size of this process since it started (ru_maxrss), in MB."""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class Profiler:
+    """
+    Per-stage counters for a pipeline run:
+      - wall time, call count and rows processed per stage
+      - the process's peak RSS as of the stage's last exit (`process_peak_rss_mb`):
+        a lifetime high-water mark, so it never falls and says nothing about the
+        stage itself beyond "the process had reached this by then"
+      - with `trace_memory`, the peak Python/NumPy allocation inside the stage (tracemalloc)
+      - with `cprofile`, a whole-run cProfile whose top functions go in the summary
+    Stages nest: an outer stage's time includes its inner ones, and re-entering a
+    stage that's already running (e.g. `backtest` calling `run_backtest`) is
+    counted once.
+    """
+
+    def __init__(self, cprofile=False, trace_memory=False):
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.stats = {}
+        self._active = {}
+        self._peaks = []
+        self._profile = None
+        self._started = None
+        self._wall = 0.0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Build a profiler from the `profiling` section of config.yml."""
+        opts = cfg.get('profiling', {}) or {}
+        return cls(cprofile=opts.get('cprofile', False), trace_memory=opts.get('tracemalloc', False))
+
+    def _entry(self, name):
+        entry = self.stats.get(name)
+        if entry is None:
+            entry = self.stats[name] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'process_peak_rss_mb': 0.0}
+            if self.trace_memory:
+                entry['peak_traced_mb'] = 0.0
+        return entry
+
+    def start(self):
+        """Begin the run: starts cProfile/tracemalloc if they were asked for."""
+        self._started = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def stop(self):
+        """End the run and stop any tracing started by `start`."""
+        if self._profile is not None:
+            self._profile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if self._started is not None:
+            self._wall += time.perf_counter() - self._started
+            self._started = None
+        return self
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        """Time a block as one call of `name`; add rows with `add_rows` or `rows=`."""
+        entry = self._entry(name)
+        if self._active.get(name):
+            # already inside this stage: count rows, not time
+            entry['rows'] += rows
+            yield entry
+            return
+        self._active[name] = True
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # tracemalloc has one peak counter: bank the enclosing stage's peak
+            # so far, then reset the counter for this stage
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            self._peaks.append(0)
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['seconds'] += time.perf_counter() - t0
+            entry['calls'] += 1
+            entry['rows'] += rows
+            entry['process_peak_rss_mb'] = max(entry['process_peak_rss_mb'], _rss_mb())
+            if tracing:
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0)
+                entry['peak_traced_mb'] = max(entry['peak_traced_mb'], peak / 2 ** 20)
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self._active[name] = False
+
+    def add_rows(self, name, rows):
+        """Add rows processed to a stage without timing anything."""
+        self._entry(name)['rows'] += rows
+
+    def merge(self, stats):
+        """Fold stage stats from another profiler (e.g. a worker process) into this one."""
+        for name, other in stats.items():
+            entry = self._entry(name)
+            for key, value in other.items():
+                if 'peak' in key:
+                    entry[key] = max(entry.get(key, 0.0), value)
+                else:
+                    entry[key] = entry.get(key, 0) + value
+
+    def hotspots(self, limit=20):
+        """Top cProfile functions by own time, or [] when cProfile is off."""
+        if self._profile is None:
+            return []
+        rows = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in pstats.Stats(self._profile).stats.items():
+            rows.append({'function': f"{filename}:{line}({func})", 'calls': nc,
+                         'tottime': tt, 'cumtime': ct})
+        rows.sort(key=lambda r: r['tottime'], reverse=True)
+        return rows[:limit]
+
+    def summary(self):
+        """
+        Structured summary of the run: {'wall_seconds', 'stages', 'hotspots'}.
+        `stages` maps each stage to its counters, pipeline stages first.
+        """
+        wall = self._wall + (time.perf_counter() - self._started if self._started is not None else 0.0)
+        order = [s for s in STAGES if s in self.stats] + [s for s in self.stats if s not in STAGES]
+        stages = {}
+        for name in order:
+            entry = dict(self.stats[name])
+            entry['rows_per_sec'] = entry['rows'] / entry['seconds'] if entry['seconds'] else 0.0
+            stages[name] = entry
+        return {'wall_seconds': wall, 'stages': stages, 'hotspots': self.hotspots()}
+
+    def format(self):
+        """Summary as a plain-text table."""
+        summary = self.summary()
+        # per-stage allocation peak when tracing, else the process high-water mark
+        memory = 'traced MB' if self.trace_memory else 'proc MB'
+        lines = [f"{'stage':<10} {'calls':>8} {'seconds':>10} {'rows':>12} {'rows/s':>14} {memory:>9}"]
+        for name, s in summary['stages'].items():
+            peak = s.get('peak_traced_mb', s['process_peak_rss_mb'])
+            lines.append(f"{name:<10} {s['calls']:>8} {s['seconds']:>10.3f} {s['rows']:>12,} "
+                         f"{s['rows_per_sec']:>14,.0f} {peak:>9.1f}")
+        lines.append(f"wall time: {summary['wall_seconds']:.3f}s")
+        for h in summary['hotspots'][:10]:
+            lines.append(f"  {h['tottime']:8.3f}s {h['calls']:>9} {h['function']}")
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Write the summary as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+_profiler = Profiler()
+
+
+def get_profiler():
+    """Process-wide profiler the pipeline stages report to."""
+    return _profiler
+
+
+def set_profiler(profiler):
+    """Swap the process-wide profiler, e.g. for one built from config.yml."""
+    global _profiler
+    _profiler = profiler
+    return profiler
+
+
+def stage(name, rows=0):
+    """Context manager timing a block as stage `name` on the current profiler."""
+    return _profiler.stage(name, rows)
+
+
+def add_rows(name, rows):
+    _profiler.add_rows(name, rows)
+
+
+def profiled(name, rows=None):
+    """
+    Decorator timing every call of a function as stage `name`.
+    `rows(result)` can return how many rows the call processed.
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with _profiler.stage(name) as entry:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    entry['rows'] += rows(result)
+                return result
+        return inner
+    return wrap
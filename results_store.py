@@ -0,0 +1,220 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sweep import GRID_COLUMNS, METRIC_COLUMNS
+
+DEFAULT_RESULTS_PATH = 'results'
+# Column -> on-disk dtype. `pair` is a code into the stored pair names,
+# `start`/`end` are days since the epoch (date32).
+SCHEMA = {
+    'pair': 'int16',
+    'start': 'int32',
+    'end': 'int32',
+    'lookback': 'int16',
+    'z_enter': 'float32',
+    'z_exit': 'float32',
+    'max_holding': 'int16',
+    'total_return': 'float32',
+    'sharpe': 'float32',
+    'max_dd': 'float32',
+    'stop_loss': 'float32',
+    'min_vol': 'float32',
+}
+# Only rows from an adaptive search (`search.py`) set these; frames leave them
+# out when no row has them
+OPTIONAL = ('stop_loss', 'min_vol')
+
+
+class ResultsStore:
+    """
+    Append-only columnar store for walk-forward sweep results.
+    Every column is a flat binary file under `path` (memory-mapped for reads)
+    with the compact dtypes in SCHEMA; `meta.json` holds the pair names and the
+    committed row count, so a run that dies mid-write leaves the store readable.
+    Rows are buffered and written every `chunk_rows`, so results can be streamed
+    in as tasks finish (`append` fits `run_walk_forward`'s `on_result`).
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_PATH, chunk_rows=65_536):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._buffer = []
+        self._buffered = 0
+        os.makedirs(path, exist_ok=True)
+        meta = self._meta_path()
+        if os.path.exists(meta):
+            with open(meta) as f:
+                self._meta = json.load(f)
+        else:
+            self._meta = {'rows': 0, 'pairs': [], 'schema': SCHEMA}
+        self._codes = {name: code for code, name in enumerate(self._meta['pairs'])}
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Store at `results.path` in config.yml, or None when it's disabled."""
+        path = cfg.get('results', {}).get('path', DEFAULT_RESULTS_PATH)
+        return cls(path) if path else None
+
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def __len__(self):
+        return self._meta['rows'] + self._buffered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    # -- writing -----------------------------------------------------------
+
+    def append(self, pair, results):
+        """
+        Buffer one frame of `evaluate_window` rows for `pair` ("T1,T2" or a tuple).
+        A frame that already has a `pair` column can pass `pair=None`.
+        """
+        if results is None or results.empty:
+            return
+        if pair is None:
+            names = results['pair'].astype(str).to_numpy()
+        else:
+            names = np.full(len(results), pair if isinstance(pair, str) else ','.join(pair))
+        uniques, inverse = np.unique(names, return_inverse=True)
+        lookup = np.array([self._code(name) for name in uniques], dtype=SCHEMA['pair'])
+        columns = {'pair': lookup[inverse]}
+        for name in ('start', 'end'):
+            days = pd.to_datetime(results[name]).to_numpy().astype('datetime64[D]')
+            columns[name] = days.astype(SCHEMA[name])
+        for name in GRID_COLUMNS + METRIC_COLUMNS + list(OPTIONAL):
+            values = results[name].to_numpy() if name in results else np.full(len(results), np.nan)
+            columns[name] = values.astype(SCHEMA[name])
+        self._buffer.append(columns)
+        self._buffered += len(results)
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._meta['pairs'])
+            self._meta['pairs'].append(name)
+        return code
+
+    def flush(self):
+        """Write buffered rows to the column files and commit the new row count."""
+        if not self._buffer:
+            return
+        rows = self._meta['rows']
+        for name, dtype in SCHEMA.items():
+            chunk = np.concatenate([b[name] for b in self._buffer])
+            if not os.path.exists(self._column_path(name)):
+                # a column added after the store was created: earlier rows are NaN
+                np.full(rows, np.nan, dtype=dtype).tofile(self._column_path(name))
+            with open(self._column_path(name), 'r+b') as f:
+                # anything past the committed rows is a torn write from an earlier run
+                f.seek(rows * np.dtype(dtype).itemsize)
+                f.truncate()
+                f.write(chunk.tobytes())
+        self._meta['rows'] = rows + self._buffered
+        tmp = self._meta_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp, self._meta_path())
+        self._buffer, self._buffered = [], 0
+
+    def clear(self):
+        """
+        Drop every stored row. Only the store's own files (the SCHEMA column
+        files and meta.json) are deleted; anything else under `path` is left alone.
+        """
+        self._buffer, self._buffered = [], 0
+        for path in [self._column_path(name) for name in SCHEMA] + [self._meta_path(), self._meta_path() + '.tmp']:
+            if os.path.exists(path):
+                os.remove(path)
+        self._meta = {'rows': 0, 'pairs': [], 'schema': SCHEMA}
+        self._codes = {}
+
+    # -- reading -----------------------------------------------------------
+
+    def column(self, name):
+        """Committed values of one column as a read-only memmap (raw on-disk dtype)."""
+        rows = self._meta['rows']
+        if not rows:
+            return np.empty(0, dtype=SCHEMA[name])
+        if not os.path.exists(self._column_path(name)):
+            return np.full(rows, np.nan, dtype=SCHEMA[name])
+        return np.memmap(self._column_path(name), dtype=SCHEMA[name], mode='r', shape=(rows,))
+
+    def _mask(self, pair=None, **params):
+        """Row mask for `pair` and parameter filters; values may be scalars or lists."""
+        self.flush()
+        mask = np.ones(self._meta['rows'], dtype=bool)
+        if pair is not None:
+            names = [pair] if isinstance(pair, (str, tuple)) else pair
+            codes = [self._codes.get(n if isinstance(n, str) else ','.join(n), -1) for n in names]
+            mask &= np.isin(self.column('pair'), codes)
+        for name, value in params.items():
+            if name in ('start', 'end'):
+                value = np.atleast_1d(pd.to_datetime(value).to_numpy()).astype('datetime64[D]').astype(SCHEMA[name])
+            mask &= np.isin(self.column(name), np.atleast_1d(value).astype(SCHEMA[name]))
+        return mask
+
+    def frame(self, rows=None, columns=None):
+        """
+        Stored rows (all, or a boolean mask / index array) as a DataFrame:
+        categorical `pair`, datetime `start`/`end`, float32 metrics.
+        """
+        self.flush()
+        data = {}
+        for name in columns or SCHEMA:
+            values = self.column(name)
+            values = np.asarray(values[rows] if rows is not None else values)
+            if name == 'pair':
+                values = pd.Categorical.from_codes(values, categories=self._meta['pairs'])
+            elif name in ('start', 'end'):
+                values = values.astype('datetime64[D]').astype('datetime64[ns]')
+            if name in OPTIONAL and columns is None and np.isnan(values).all():
+                continue
+            data[name] = values
+        return pd.DataFrame(data)
+
+    def select(self, pair=None, **params):
+        """Rows for a pair (or list of pairs) and any exact parameter/window values."""
+        return self.frame(np.flatnonzero(self._mask(pair, **params)))
+
+    def top(self, n=10, by='total_return', ascending=False, pair=None, **params):
+        """Best `n` rows by a metric, optionally within a filter."""
+        rows = np.flatnonzero(self._mask(pair, **params))
+        values = np.asarray(self.column(by)[rows], dtype=float)
+        values = np.where(np.isnan(values), np.inf if ascending else -np.inf, values)
+        # NaNs last, ties keep insertion order
+        order = np.argsort(values if ascending else -values, kind='stable')[:n]
+        return self.frame(rows[order])
+
+    def aggregate(self, metrics=METRIC_COLUMNS, by=('pair',) + tuple(GRID_COLUMNS),
+                  how=('mean', 'std', 'min', 'max', 'count'), pair=None, **params):
+        """Metric statistics across windows for every parameter set (or any grouping in `by`)."""
+        rows = np.flatnonzero(self._mask(pair, **params))
+        df = self.frame(rows, columns=list(by) + list(metrics))
+        return df.groupby(list(by), observed=True)[list(metrics)].agg(list(how))
+
+    def markdown(self, n=20, by='total_return'):
+        """Markdown table of the top `n` rows by `by`."""
+        return self.top(n, by).to_markdown()
+
+
+if __name__ == '__main__':
+    import yaml
+    cfg = yaml.safe_load(open('config.yml'))
+    store = ResultsStore.from_config(cfg) or ResultsStore()
+    print(f"{len(store)} rows, pairs: {', '.join(store._meta['pairs'])}")
+    print(store.top(10).to_markdown())
+    print(store.aggregate(['total_return']).sort_values(('total_return', 'mean'), ascending=False)
+          .head(10).to_markdown())
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RollingMoments:
+    """
+    Rolling means and (co)variances of one or more series for several lookbacks,
+    computed from one shared set of running sums.
+      - `values`: (n,) or (n, m) array, e.g. the two legs [y, x] of a pair
+      - `lookbacks`: window lengths that will be requested
+    Rows are split into blocks of twice the longest lookback. Each block keeps running
+    sums of its values shifted by the block mean, so the sums stay small and
+    don't cancel. A window spans at most two blocks, and the two parts are merged
+    with the pairwise (Chan/Welford) update. Results match `Series.rolling` to
+    rounding error.
+    Because pair moments are kept per leg, the spread y - βx can be summarised
+    for any β (see `spread`) without another pass over the data.
+    """
+
+    def __init__(self, values, lookbacks):
+        values = np.asarray(values, dtype=float)
+        self.values = values if values.ndim == 2 else values[:, None]
+        self.lookbacks = sorted(set(int(lb) for lb in lookbacks))
+        n, m = self.values.shape
+        # at most half of the windows straddle two blocks
+        self.block = 2 * max(self.lookbacks + [1])
+        block_id = np.arange(n) // self.block
+        starts = np.arange(0, n, self.block)
+        shift = np.add.reduceat(self.values, starts, axis=0) / np.diff(np.append(starts, n))[:, None] if n else np.zeros((0, m))
+        d = self.values - shift[block_id]
+        dd = d[:, :, None] * d[:, None, :]
+        # running sums restart at every block boundary
+        self._shift = shift
+        self._s1 = _block_cumsum(d, starts)
+        self._s2 = _block_cumsum(dd, starts)
+        self._cache = {}
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def _moments(self, lookback):
+        """Full-length (mean, co-moment) arrays for one lookback, memoized."""
+        if lookback in self._cache:
+            return self._cache[lookback]
+        n, m = self.values.shape
+        B, L = self.block, lookback
+        pos = np.arange(n) % B
+        # part inside the current block: the whole window, or its rows since the block start
+        inside = pos >= L
+        s1, s2 = self._s1.copy(), self._s2.copy()
+        s1[L:][inside[L:]] -= self._s1[:-L][inside[L:]]
+        s2[L:][inside[L:]] -= self._s2[:-L][inside[L:]]
+        count = np.where(inside, L, pos + 1).astype(float)
+        mean = s1 / count[:, None]
+        m2 = s2 - s1[:, :, None] * s1[:, None, :] / count[:, None, None]
+        mean += self._shift[np.arange(n) // B]
+        # rows whose window spills into the previous block: merge that part in
+        rows = np.flatnonzero(~inside & (np.arange(n) >= L - 1) & (pos + 1 < L))
+        if len(rows):
+            first = rows - L + 1
+            end_a = rows - pos[rows] - 1
+            n_a = (end_a - first + 1).astype(float)
+            s1_a = self._s1[end_a] - np.where((pos[first] > 0)[:, None], self._s1[first - 1], 0.0)
+            s2_a = self._s2[end_a] - np.where((pos[first] > 0)[:, None, None], self._s2[first - 1], 0.0)
+            mean_a = s1_a / n_a[:, None] + self._shift[end_a // B]
+            m2_a = s2_a - s1_a[:, :, None] * s1_a[:, None, :] / n_a[:, None, None]
+            n_b = count[rows]
+            delta = mean[rows] - mean_a
+            total = n_a + n_b
+            m2[rows] = m2_a + m2[rows] + (n_a * n_b / total)[:, None, None] * delta[:, :, None] * delta[:, None, :]
+            mean[rows] = (n_a[:, None] * mean_a + n_b[:, None] * mean[rows]) / total[:, None]
+        mean[:L - 1] = np.nan
+        m2[:L - 1] = np.nan
+        self._cache[lookback] = (mean, m2)
+        return mean, m2
+
+    def _slice(self, arr, lookback, start, stop):
+        # rows before `start` don't exist for this window, so the first
+        # lookback - 1 rows have no full window, as if computed from scratch
+        out = np.array(arr[start:stop], dtype=float)
+        out[:lookback - 1] = np.nan
+        return out
+
+    def mean(self, lookback, col=0, start=0, stop=None):
+        """Rolling mean of column `col` over rows [start, stop)."""
+        mean, _ = self._moments(lookback)
+        return self._slice(mean[:, col], lookback, start, stop)
+
+    def std(self, lookback, col=0, start=0, stop=None):
+        """Rolling sample standard deviation (ddof=1) of column `col`."""
+        _, m2 = self._moments(lookback)
+        var = np.maximum(m2[:, col, col], 0) / (lookback - 1)
+        return self._slice(np.sqrt(var), lookback, start, stop)
+
+    def spread(self, beta, lookback, start=0, stop=None):
+        """Rolling (mean, std) of column 0 - beta * column 1 over rows [start, stop)."""
+        mean, m2 = self._moments(lookback)
+        mu = mean[:, 0] - beta * mean[:, 1]
+        var = (m2[:, 0, 0] - 2 * beta * m2[:, 0, 1] + beta * beta * m2[:, 1, 1]) / (lookback - 1)
+        return (self._slice(mu, lookback, start, stop),
+                self._slice(np.sqrt(np.maximum(var, 0)), lookback, start, stop))
+
+
+def _block_cumsum(a, starts):
+    """Cumulative sum along axis 0 that restarts at every index in `starts`."""
+    out = np.cumsum(a, axis=0)
+    if len(starts) > 1:
+        offsets = out[starts[1:] - 1]
+        offsets = np.concatenate([np.zeros((1,) + a.shape[1:]), offsets], axis=0)
+        out -= np.repeat(offsets, np.diff(np.append(starts, len(a))), axis=0)
+    return out
+
+
+class MomentsCache:
+    """
+    LRU cache of spread moments keyed by (pair, β, lookback).
+    Holds one `RollingMoments` per pair over its full history; the moments of a
+    walk-forward window are slices of those, so overlapping windows (or repeat
+    evaluations of the same window) never redo a rolling pass.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._pairs = {}
+        self._entries = OrderedDict()
+
+    def register(self, pair, prices, lookbacks):
+        """Build (or reuse) the running sums for a pair's two-column price history."""
+        prices = np.asarray(prices, dtype=float)
+        rm = self._pairs.get(pair)
+        if rm is None or not set(lookbacks) <= set(rm.lookbacks) or not np.array_equal(rm.values, prices):
+            rm = self._pairs[pair] = RollingMoments(prices, lookbacks)
+            # anything cached from an older history of this pair is stale
+            for key in [k for k in self._entries if k[0] == pair]:
+                del self._entries[key]
+        return rm
+
+    def spread(self, pair, beta, lookback, start=0, stop=None):
+        """Rolling (mean, std) of the pair's spread for rows [start, stop)."""
+        key = (pair, float(beta), lookback, start, stop)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        out = self._pairs[pair].spread(beta, lookback, start, stop)
+        self._entries[key] = out
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return out
+
+    def forget(self, pair):
+        """Drop a pair's running sums and every moment cached from them."""
+        self._pairs.pop(pair, None)
+        for key in [k for k in self._entries if k[0] == pair]:
+            del self._entries[key]
@@ -0,0 +1,134 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from profiling import Profiler, get_profiler, set_profiler
+from sweep import DEFAULT_GRID, _moments_cache, walk_forward_windows, window_moments, evaluate_window, merge_windows
+from universe import Universe, load_universe
+
+
+def window_prices(universe, pair, w_start, w_end, min_vol=100000):
+    """Cleaned prices of `pair` for one window, read straight from the universe matrices."""
+    return universe.pair_frame(*pair, w_start, w_end, min_vol)
+
+
+# Full cleaned history per (shared block, pair), so windows can share rolling moments;
+# only the latest block's are kept
+_history = {}
+
+
+def _window_inputs(desc, pair, w_start, w_end, lookbacks):
+    """(prices, moments) of one window read from a shared block, None when it has no valid data."""
+    universe = Universe.attach(desc)
+    prices = window_prices(universe, pair, w_start, w_end)
+    if prices.empty or prices.isna().all().any():
+        return None
+    key = (desc['name'], pair)
+    if key not in _history:
+        # pool processes can outlive a run: histories of earlier blocks are dead weight
+        for stale in [k for k in _history if k[0] != desc['name']]:
+            _forget(stale)
+        _history[key] = window_prices(universe, pair, None, None)
+    return prices, window_moments(key, _history[key], prices, lookbacks)
+
+
+def _run_task(desc, pair, w_start, w_end, cfg):
+    inputs = _window_inputs(desc, pair, w_start, w_end, DEFAULT_GRID['lookback'])
+    if inputs is None:
+        return None
+    prices, moments = inputs
+    return evaluate_window(prices, w_start, w_end, cfg, moments=moments)
+
+
+def _call_profiled(fn, *args):
+    # each task reports to a fresh profiler; the parent merges the counters
+    profiler = set_profiler(Profiler())
+    return fn(*args), profiler.stats
+
+
+def resolve_workers(cfg, workers=None):
+    """`workers`, defaulting to `sweep.workers` in config.yml; 0 means one per CPU."""
+    if workers is None:
+        workers = cfg.get('sweep', {}).get('workers', 1)
+    return workers or os.cpu_count()
+
+
+def share_pairs(pairs, start, end, interval):
+    """
+    Load the bars of every pair's tickers into one `universe.Universe` and put it
+    in shared memory. Returns (legs, universe, desc), `legs` being the pairs with
+    their tickers sorted (fetch_prices orders columns alphabetically, so y is the
+    first ticker). Hand `universe` and `desc` to `release` when done.
+    """
+    legs = [tuple(sorted(pair)) for pair in pairs]
+    universe = load_universe(sorted({t for pair in legs for t in pair}), start, end, interval, complete=False)
+    return legs, universe, universe.share()
+
+
+def _forget(key):
+    del _history[key]
+    _moments_cache.forget(key)
+
+
+def release(universe, desc):
+    """Forget the histories cached for a shared block and free it."""
+    for key in [k for k in _history if k[0] == desc['name']]:
+        _forget(key)
+    universe.close()
+
+
+def stream_walk_forward(pairs, start, end, interval, cfg, workers=None, only=None):
+    """
+    Run every (pair, window) grid evaluation, yielding (pair_idx, window_idx, results)
+    in task order (pair by pair, windows in date order) whatever the number of
+    workers: all tasks are queued at once and each result is handed on as soon
+    as those before it are. The bars of every pair's tickers are loaded once into a
+    `universe.Universe` and reach worker processes through one shared memory block.
+    `workers` defaults to `sweep.workers` in config.yml; 1 runs in-process.
+    `only` restricts the run to a set of (pair_idx, window_idx) tasks.
+    """
+    workers = resolve_workers(cfg, workers)
+    windows = walk_forward_windows(start, end)
+    tasks = [(p, w) for p in range(len(pairs)) for w in range(len(windows))
+             if only is None or (p, w) in only]
+    used = sorted({p for p, _ in tasks})
+    legs, universe, desc = share_pairs([pairs[p] for p in used], start, end, interval)
+    legs = dict(zip(used, legs))
+    try:
+        if workers == 1:
+            for p, w in tasks:
+                yield p, w, _run_task(desc, legs[p], *windows[w], cfg)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_call_profiled, _run_task, desc, legs[p], *windows[w], cfg) for p, w in tasks]
+            for (p, w), fut in zip(tasks, futures):
+                results, stats = fut.result()
+                get_profiler().merge(stats)
+                yield p, w, results
+    finally:
+        release(universe, desc)
+
+
+def run_walk_forward(pairs, start, end, interval, cfg, workers=None, on_result=None):
+    """
+    Walk-forward grid sweep over several pairs in parallel.
+    `on_result(pair, results)` is called for each window in task order. The
+    merged frame is identical to running `test_timeframes` pair by pair.
+    """
+    done = {}
+    for p, w, results in stream_walk_forward(pairs, start, end, interval, cfg, workers):
+        done[p, w] = results
+        if on_result is not None and results is not None:
+            on_result(pairs[p], results)
+    n_windows = len(walk_forward_windows(start, end))
+    all_results = []
+    for p, (t1, t2) in enumerate(pairs):
+        results = merge_windows([done[p, w] for w in range(n_windows)])
+        if not results.empty:
+            results['pair'] = f"{t1},{t2}"
+            all_results.append(results)
+    if not all_results:
+        return pd.DataFrame()
+    all_results = pd.concat(all_results, ignore_index=True)
+    return all_results.sort_values('total_return', ascending=False, kind='stable')
@@ -0,0 +1,292 @@
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from performance import metrics_batch, periods_per_year
+from profiling import get_profiler, stage
+from scheduler import _call_profiled, _window_inputs, release, resolve_workers, share_pairs
+from strat import hedge_kwargs
+from sweep import GRID_COLUMNS, METRIC_COLUMNS, DEFAULT_GRID, _grid_batches, walk_forward_windows
+
+# Ranges sampled by the adaptive search: [low, high] or [low, high, step], integers
+# for lookback and max_holding. Anything not listed is held at its config.yml value.
+# Every distinct lookback is a separate batch per window, so it's sampled on a step.
+DEFAULT_SPACE = {
+    'lookback': [5, 60, 5],
+    'z_enter': [1.0, 3.0],
+    'z_exit': [0.0, 1.0],
+    'max_holding': [3, 40],
+}
+SEARCH_COLUMNS = GRID_COLUMNS + ['stop_loss', 'min_vol']
+_INTEGER = ('lookback', 'max_holding')
+
+
+def sample_space(space, n, cfg, seed=0):
+    """
+    `n` parameter sets drawn uniformly from `space` ({name: [low, high]} or
+    [low, high, step] for a grid of values, or a single value to fix it). `stop_loss` and `min_vol` default to
+    `backtest.stop_loss` and `strategy.min_vol`. Returns a DataFrame of SEARCH_COLUMNS.
+    """
+    rng = np.random.default_rng(seed)
+    fixed = {'stop_loss': cfg['backtest']['stop_loss'], 'min_vol': cfg['strategy']['min_vol']}
+    sets = {}
+    for name in SEARCH_COLUMNS:
+        bounds = space.get(name, fixed.get(name))
+        if bounds is None:
+            raise ValueError(f"search space has no range for '{name}'")
+        if np.ndim(bounds) == 0:
+            sets[name] = np.full(n, bounds)
+        elif len(bounds) == 3:
+            low, high, step = bounds
+            sets[name] = low + step * rng.integers(0, int(round((high - low) / step)) + 1, n)
+        elif name in _INTEGER:
+            sets[name] = rng.integers(int(bounds[0]), int(bounds[1]) + 1, n)
+        else:
+            sets[name] = rng.uniform(float(bounds[0]), float(bounds[1]), n)
+    sets['lookback'] = np.maximum(sets['lookback'].astype(int), 2)
+    sets['max_holding'] = sets['max_holding'].astype(int)
+    return pd.DataFrame(sets)
+
+
+def grid_sets(cfg, grid=DEFAULT_GRID):
+    """The exhaustive grid as search sets (same order as `evaluate_grid`)."""
+    rows = [(lb, ze, zx, mh) for lb in grid['lookback'] for ze in grid['z_enter']
+            for zx in grid['z_exit'] for mh in grid['max_holding']]
+    sets = pd.DataFrame(rows, columns=GRID_COLUMNS)
+    return sets.assign(stop_loss=cfg['backtest']['stop_loss'], min_vol=cfg['strategy']['min_vol'])
+
+
+def spread_order(n):
+    """
+    0..n-1 reordered so every prefix is spread evenly over the range
+    (van der Corput: 0, n/2, n/4, 3n/4, ...). Early rungs see windows from
+    the whole history instead of only the first year.
+    """
+    order, seen = [], set()
+    for k in range(2 * n):
+        v, denom, bits = 0.0, 1.0, k
+        while bits:
+            denom *= 2
+            v += (bits & 1) / denom
+            bits >>= 1
+        pos = int(v * n)
+        if pos not in seen:
+            seen.add(pos)
+            order.append(pos)
+    return order + [i for i in range(n) if i not in seen]
+
+
+def score_sets(prices, sets, cfg, moments=None):
+    """
+    Metrics of every row of `sets` on one window's prices, in row order.
+    Sets are batched per lookback through `sweep._grid_batches`, so each distinct
+    lookback costs one position build and one backtest whatever the number of sets.
+    """
+    lookback = sets['lookback'].to_numpy()
+    lookbacks = np.unique(lookback).tolist()
+    rows = {lb: np.flatnonzero(lookback == lb) for lb in lookbacks}
+    params = [sets[c].to_numpy() for c in ('z_enter', 'z_exit', 'max_holding', 'stop_loss', 'min_vol')]
+    combos = {lb: list(zip(*(p[r] for p in params))) for lb, r in rows.items()}
+    order, batches = [], []
+    for lb, *_, returns, _ in _grid_batches(prices, lookbacks, combos, cfg['strategy']['min_vol'],
+                                            cfg['backtest']['tc_per_trade'], cfg['backtest']['stop_loss'],
+                                            moments, hedge_kwargs(cfg)):
+        order.append(rows[lb])
+        batches.append(returns)
+    out = np.full((len(sets), len(METRIC_COLUMNS)), np.nan)
+    if batches:
+        returns = np.hstack(batches)
+        with stage('metrics', rows=returns.size):
+            metrics = metrics_batch(returns, freq=periods_per_year(cfg['data'].get('interval', '1d')))
+        out[np.concatenate(order)] = metrics[METRIC_COLUMNS].to_numpy()
+    return pd.DataFrame(out, columns=METRIC_COLUMNS, index=sets.index)
+
+
+def successive_halving(windows, sets, score, min_windows=2, eta=3, select='sharpe', pool=None):
+    """
+    Successive halving of parameter `sets` over walk-forward `windows`:
+      - rung 0 scores every set on `min_windows` windows spread over the range
+      - the best 1/`eta` by mean `select` score move on to `eta` times as many
+        windows (earlier scores are kept, only new windows are run)
+      - it stops when a rung covers every window or a single set is left
+    `score(window, sets)` returns the metrics of `sets` on one window (None to skip it).
+    With a `pool` (a process pool; `score` must pickle), a rung's windows are
+    scored concurrently; results are taken in window order, so rows are the same.
+    `min_windows=len(windows)` is a plain random/grid search over all windows.
+    Returns (rows, rungs):
+      - rows: one row per (set, window) evaluated, SEARCH_COLUMNS + window +
+        metrics, plus `mean_score` (the set's mean `select` score over the windows
+        it was scored on) and `rank` (0 for the last rung's best set); ordered by
+        rank, then by total return
+      - rungs: per rung the surviving sets, windows, cumulative set-windows and
+        seconds, and the best mean score with its parameters, i.e. the best
+        parameters found per unit of compute
+    """
+    order = spread_order(len(windows))
+    alive = np.arange(len(sets))
+    total = np.zeros(len(sets))
+    count = np.zeros(len(sets))
+    reached = np.zeros(len(sets), dtype=int)
+    rows, rungs = [], []
+    done, target, cost = 0, max(1, min_windows), 0
+    t0 = time.perf_counter()
+    while True:
+        target = min(target, len(windows))
+        todo = order[done:target]
+        if pool is None:
+            scored = (score(windows[w], sets.iloc[alive]) for w in todo)
+        else:
+            futures = [pool.submit(_call_profiled, score, windows[w], sets.iloc[alive]) for w in todo]
+            scored = (_merged(fut.result()) for fut in futures)
+        for w, metrics in zip(todo, scored):
+            if metrics is None:
+                continue
+            cost += len(alive)
+            values = metrics[select].to_numpy(dtype=float)
+            scored_sets = ~np.isnan(values)
+            total[alive[scored_sets]] += values[scored_sets]
+            count[alive[scored_sets]] += 1
+            rows.append(pd.concat([sets.iloc[alive].reset_index(drop=True).assign(window=w, set=alive),
+                                   metrics.reset_index(drop=True)], axis=1))
+        done = target
+        reached[alive] = len(rungs)
+        mean = np.where(count[alive] > 0, total[alive] / np.maximum(count[alive], 1), -np.inf)
+        ranked = alive[np.argsort(-mean, kind='stable')]
+        best = sets.iloc[ranked[0]]
+        rungs.append({'rung': len(rungs), 'sets': len(alive), 'windows': done, 'set_windows': cost,
+                      'seconds': time.perf_counter() - t0,
+                      f"mean_{select}": mean.max() if len(mean) else np.nan,
+                      **{c: best[c] for c in SEARCH_COLUMNS}})
+        if done >= len(windows) or len(alive) <= 1:
+            break
+        alive = np.sort(ranked[:max(1, math.ceil(len(alive) / eta))])
+        target = done * eta
+    if not rows:
+        return pd.DataFrame(columns=SEARCH_COLUMNS + ['window']), pd.DataFrame(rungs)
+    # sets that got further first, then by mean score: rank 0 is the last rung's best set
+    mean = np.where(count > 0, total / np.maximum(count, 1), -np.inf)
+    rank = np.empty(len(sets), dtype=int)
+    rank[np.lexsort((np.arange(len(sets)), -mean, -reached))] = np.arange(len(sets))
+    rows = pd.concat(rows, ignore_index=True)
+    set_ids = rows.pop('set').to_numpy()
+    rows['mean_score'], rows['rank'] = np.where(count > 0, mean, np.nan)[set_ids], rank[set_ids]
+    rows = rows.sort_values(['rank', 'total_return'], ascending=[True, False], kind='stable', ignore_index=True)
+    return rows, pd.DataFrame(rungs)
+
+
+def _merged(result):
+    # a pool task's metrics, with its profile counters folded into this process's
+    metrics, stats = result
+    get_profiler().merge(stats)
+    return metrics
+
+
+def _score_window(desc, pair, lookbacks, cfg, window, sets):
+    """`score_sets` on one window of `pair`, read from a shared block (see `scheduler.share_pairs`)."""
+    inputs = _window_inputs(desc, pair, *window, lookbacks)
+    if inputs is None:
+        return None
+    prices, moments = inputs
+    return score_sets(prices, sets, cfg, moments)
+
+
+def search_options(cfg):
+    """The `search` section of config.yml with defaults filled in."""
+    opts = {'method': 'grid', 'space': DEFAULT_SPACE, 'samples': 5400, 'min_windows': 1, 'eta': 3,
+            'select': 'sharpe', 'seed': 0}
+    opts.update(cfg.get('search', {}) or {})
+    return opts
+
+
+def search_pair(pair, start, end, interval, cfg, sets=None, method=None, shared=None, pool=None):
+    """
+    Adaptive search for one pair over the walk-forward windows from `start` to `end`.
+    `sets` defaults to `search.samples` draws from `search.space`. With `method`
+    (default `search.method`) 'random' every set is scored on every window; with
+    'halving' weak sets are dropped after `search.min_windows`, `eta`× more, ...
+    Bars come from `shared`, a (leg, desc) pair from `scheduler.share_pairs`
+    (the pair's own block by default); `pool` scores each rung's windows in
+    worker processes.
+    Returns (results, rungs): `evaluate_window`-style rows (plus stop_loss,
+    min_vol, mean_score and rank) for every set and window evaluated, the last
+    rung's best set first, and the rung log.
+    """
+    opts = search_options(cfg)
+    if sets is None:
+        sets = sample_space(opts['space'], opts['samples'], cfg, opts['seed'])
+    windows = walk_forward_windows(start, end)
+    own = None
+    if shared is None:
+        (leg,), universe, desc = share_pairs([pair], start, end, interval)
+        own, shared = (universe, desc), (leg, desc)
+    leg, desc = shared
+    score = partial(_score_window, desc, leg, sorted(set(sets['lookback'].tolist())), cfg)
+    method = method or opts['method']
+    min_windows = len(windows) if method == 'random' else opts['min_windows']
+    try:
+        rows, rungs = successive_halving(windows, sets, score, min_windows, opts['eta'], opts['select'], pool)
+    finally:
+        if own is not None:
+            release(*own)
+    if rows.empty:
+        return pd.DataFrame(), rungs
+    bounds = pd.DataFrame(windows, columns=['start', 'end'])
+    results = pd.concat([bounds.iloc[rows.pop('window')].reset_index(drop=True), rows], axis=1)
+    return results, rungs
+
+
+def run_search(pairs, start, end, interval, cfg, on_result=None, report=None, workers=None):
+    """
+    `search_pair` for every pair; the adaptive counterpart of `scheduler.run_walk_forward`.
+    Bars are shared with `workers` processes (default `sweep.workers`) as in the
+    grid sweep, and each rung's windows are scored across them.
+    `on_result(pair, results)` gets each pair's rows, `report` (a dict) each
+    pair's rung log. Returns all rows with every pair's winning set (rank 0)
+    first, pairs ordered by its mean score; `.iloc[0]` is the best pair's winner.
+    """
+    workers = resolve_workers(cfg, workers)
+    legs, universe, desc = share_pairs(pairs, start, end, interval)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    all_results = []
+    try:
+        for (t1, t2), leg in zip(pairs, legs):
+            results, rungs = search_pair((t1, t2), start, end, interval, cfg, shared=(leg, desc), pool=pool)
+            if report is not None:
+                report[f"{t1},{t2}"] = rungs
+            if results.empty:
+                continue
+            if on_result is not None:
+                on_result((t1, t2), results)
+            results['pair'] = f"{t1},{t2}"
+            all_results.append(results)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        release(universe, desc)
+    if not all_results:
+        return pd.DataFrame()
+    all_results = pd.concat(all_results, ignore_index=True)
+    return all_results.sort_values(['rank', 'mean_score', 'total_return'], ascending=[True, False, False],
+                                   kind='stable')
+
+
+if __name__ == '__main__':
+    import yaml
+    from price_store import PriceStore, set_default_store
+
+    cfg = yaml.safe_load(open('config.yml'))
+    set_default_store(PriceStore.from_config(cfg))
+    pair = tuple(sorted(cfg['tickers']['pair']))
+    start, end, interval = cfg['data']['start'], cfg['data']['end'], cfg['data']['interval']
+    method = search_options(cfg)['method']
+    method = method if method != 'grid' else 'halving'
+    # the exhaustive grid on every window, then the configured search
+    for name, sets, how in (('grid', grid_sets(cfg), 'random'), (method, None, method)):
+        t0 = time.perf_counter()
+        results, rungs = search_pair(pair, start, end, interval, cfg, sets, how)
+        print(f"\n{name}: {len(results)} set-windows in {time.perf_counter() - t0:.2f}s")
+        print(rungs.to_markdown(index=False))
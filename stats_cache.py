@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = '.stats_cache/stats.sqlite'
+# Bump when a cached statistic changes how it's computed
+# 2: coint p-values come from the batched Engle-Granger (engle_granger_pvalues)
+STATS_VERSION = 2
+
+
+def series_key(series):
+    """Content hash of a price Series: its dates and values, not its name."""
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(series.index.asi8).tobytes())
+    h.update(np.ascontiguousarray(series.to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+
+class StatsCache:
+    """
+    Persistent memo of per-pair screening statistics (coint p-value, ADF, half-life, ...).
+    Entries are keyed by a hash of the statistic's name and parameters plus the
+    content hashes of its input series, so a result is reused whenever the same
+    data comes back - whatever the tickers, thresholds or surrounding universe -
+    and never after the data changes.
+    Stored in SQLite; least recently used entries are evicted beyond
+    `max_entries` or `max_bytes`. `path=None` keeps everything in memory.
+    Hits only mark entries as used in memory; the timestamps are written in one
+    transaction by `flush` (called by `put_many`, `evict` and `close`).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=500_000, max_bytes=256 * 2 ** 20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if path is not None and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path if path is not None else ':memory:')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS stats '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS stats_used ON stats (used)')
+        self._used = {}
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Build a cache from the `pair_selection` section of config.yml (None if disabled)."""
+        ps = cfg.get('pair_selection', {})
+        path = ps.get('stats_cache', DEFAULT_CACHE_PATH)
+        if not path:
+            return None
+        return cls(path, max_entries=ps.get('stats_cache_entries', 500_000),
+                   max_bytes=ps.get('stats_cache_mb', 256) * 2 ** 20)
+
+    @staticmethod
+    def key(name, inputs, **params):
+        """Cache key for statistic `name` of the `inputs` content hashes with `params`."""
+        payload = json.dumps([STATS_VERSION, name, list(inputs), sorted(params.items())])
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get_many(self, keys):
+        """Values for `keys` (None where missing); hits count as a use for LRU."""
+        found = {}
+        keys = list(keys)
+        for k in range(0, len(keys), 500):
+            chunk = keys[k:k + 500]
+            rows = self._db.execute(
+                f"SELECT key, value FROM stats WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(rows)
+        self._used.update(dict.fromkeys(found, time.time()))
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return [json.loads(found[k]) if k in found else None for k in keys]
+
+    def put_many(self, items):
+        """Store (key, value) pairs; values must be JSON-serializable (NaN/inf allowed)."""
+        now = time.time()
+        rows = []
+        for key, value in items:
+            text = json.dumps(value)
+            rows.append((key, text, len(key) + len(text), now))
+        if not rows:
+            return
+        self._write_used()
+        self._db.executemany('INSERT OR REPLACE INTO stats VALUES (?, ?, ?, ?)', rows)
+        self._db.commit()
+        self.evict()
+
+    def _write_used(self):
+        # pending LRU timestamps, left for the caller to commit
+        if self._used:
+            self._db.executemany('UPDATE stats SET used = ? WHERE key = ?',
+                                 [(used, key) for key, used in self._used.items()])
+            self._used = {}
+
+    def flush(self):
+        """Write the LRU timestamps of the hits since the last flush."""
+        if self._used:
+            self._write_used()
+            self._db.commit()
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def evict(self):
+        """Drop least recently used entries until under both limits."""
+        self.flush()
+        count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM stats').fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        # walk from the oldest entry, removing until both limits hold
+        excess_count, excess_size, drop = count - self.max_entries, size - self.max_bytes, []
+        for key, entry_size in self._db.execute('SELECT key, size FROM stats ORDER BY used'):
+            if excess_count <= 0 and excess_size <= 0:
+                break
+            drop.append((key,))
+            excess_count -= 1
+            excess_size -= entry_size
+        self._db.executemany('DELETE FROM stats WHERE key = ?', drop)
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM stats').fetchone()[0]
+
+    def clear(self):
+        self._used = {}
+        self._db.execute('DELETE FROM stats')
+        self._db.commit()
+
+    def close(self):
+        self.flush()
+        self._db.close()
@@ -1,11 +1,12 @@
 # strategy.py
 
-import yaml
+import numpy as np
 import pandas as pd
-from statsmodels.regression.linear_model import OLS
+from profiling import profiled
 
 def load_cfg(path='config.yml'):
     """Read YAML config into a dict."""
+    import yaml
     return yaml.safe_load(open(path))
 
 def hedge_ratio(y, x):
@@ -13,13 +14,92 @@ def hedge_ratio(y, x):
     Compute the regression slope β of y ~ x
     to use as the hedge ratio.
     """
+    # statsmodels takes ~1s to import, so only stages that fit β pay for it
+    from statsmodels.regression.linear_model import OLS
     model = OLS(y, x).fit()
     return model.params.iloc[0]
 
-def generate_signals(prices, lookback, z_enter, z_exit):
+def _as_columns(y, x):
+    index = getattr(y, 'index', None)
+    y, x = np.asarray(y, dtype=float), np.asarray(x, dtype=float)
+    flat = y.ndim == 1
+    return index, flat, (y[:, None] if flat else y), (x[:, None] if flat else x)
+
+def _wrap(beta, index, flat):
+    beta = beta[:, 0] if flat else beta
+    if index is not None and flat:
+        return pd.Series(beta, index=index, name='beta')
+    return beta
+
+def rolling_hedge_ratio(y, x, window=60):
+    """
+    Rolling β of y ~ x (no intercept, like `hedge_ratio`) over the last `window` bars.
+    Windowed sums of xy and x² (pandas' compensated add/remove) make each bar O(1);
+    `y`, `x` can be Series or (bars, pairs) arrays to fit many pairs at once.
+    The first window - 1 bars are NaN, as is any window holding a NaN bar.
+    """
+    index, flat, y, x = _as_columns(y, x)
+    sxy = pd.DataFrame(x * y).rolling(window).sum().to_numpy()
+    sxx = pd.DataFrame(x * x).rolling(window).sum().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = sxy / sxx
+    return _wrap(beta, index, flat)
+
+def kalman_hedge_ratio(y, x, delta=1e-4, obs_var=1e-3):
+    """
+    Kalman-filter β of y ~ x, treating β as a random walk.
+      - `delta`: process noise; higher adapts faster
+      - `obs_var`: observation noise variance
+    One scalar update per bar (vectorized across pairs for (bars, pairs) arrays).
+    β at bar t only uses data up to t.
+    """
+    index, flat, y, x = _as_columns(y, x)
+    q = delta / (1 - delta)
+    out = np.empty_like(y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = y[0] / x[0]
+    beta = np.where(np.isfinite(beta), beta, 0.0)
+    P = np.ones(y.shape[1])
+    for t in range(y.shape[0]):
+        yt, xt = y[t], x[t]
+        ok = ~(np.isnan(yt) | np.isnan(xt))
+        R = P + q
+        K = np.where(ok, R * xt / (xt * xt * R + obs_var), 0.0)
+        beta = beta + K * np.where(ok, yt - xt * beta, 0.0)
+        P = np.where(ok, R - K * xt * R, R)
+        out[t] = beta
+    return _wrap(out, index, flat)
+
+def fit_hedge(prices, method='static', window=60, delta=1e-4, obs_var=1e-3):
+    """
+    Hedge ratio for a two-column price DataFrame:
+      - 'static': one OLS β over the sample (scalar)
+      - 'rolling': rolling-window β Series
+      - 'kalman': Kalman-filter β Series
+    """
+    y, x = prices.iloc[:, 0], prices.iloc[:, 1]
+    if method == 'static':
+        return hedge_ratio(y, x)
+    if method == 'rolling':
+        return rolling_hedge_ratio(y, x, window)
+    if method == 'kalman':
+        return kalman_hedge_ratio(y, x, delta, obs_var)
+    raise ValueError(f"Unknown hedge method: {method}")
+
+def hedge_kwargs(cfg):
+    """`fit_hedge` keyword arguments from the `strategy` section of config.yml."""
+    st = cfg['strategy']
+    return {
+        'method': st.get('hedge', 'static'),
+        'window': st.get('hedge_window', 60),
+        'delta': st.get('kalman_delta', 1e-4),
+    }
+
+@profiled('signal', rows=lambda out: len(out[0]))
+def generate_signals(prices, lookback, z_enter, z_exit, beta=None):
     """
     Given a two-column price DataFrame:
-      - Compute β
+      - Compute β (or use the given `beta`, a scalar or a per-bar Series)
       - Compute spread = y - β x
       - Compute rolling z-score of spread
       - Signal long/short when |z| > z_enter
@@ -27,7 +107,7 @@ def generate_signals(prices, lookback, z_enter, z_exit):
     Returns (signals_df, beta).
     """
     y, x = prices.iloc[:,0], prices.iloc[:,1]
-    β    = hedge_ratio(y, x)
+    β    = hedge_ratio(y, x) if beta is None else beta
     spread = y - β * x
 
     μ = spread.rolling(lookback).mean()
@@ -41,6 +121,64 @@ def generate_signals(prices, lookback, z_enter, z_exit):
 
     return sig, β
 
+def build_position(long, short, exit, max_holding=None):
+    """
+    Turn long/short/exit signals into a running position (1=long, -1=short, 0=flat).
+      - `long`, `short`, `exit`: 1-D Series/arrays, or 2-D arrays with one
+        column per parameter set
+      - `max_holding`: optional holding limit (scalar or one per column); forces
+        an exit `max_holding` bars after the last entry signal
+    Entries take priority over exits and the last signal is carried forward,
+    matching the old row-by-row loops exactly.
+    Returns a Series for Series input, otherwise an int array of the same shape.
+    """
+    index = getattr(long, 'index', None)
+    L = np.asarray(long).astype(bool)
+    S = np.asarray(short).astype(bool)
+    X = np.asarray(exit).astype(bool)
+    rows = np.arange(L.shape[0]).reshape((-1,) + (1,) * (L.ndim - 1))
+
+    if max_holding is not None:
+        # bars since the last long/short entry; exit once the limit is hit
+        last_entry = np.where(L | S, rows, -1)
+        np.maximum.accumulate(last_entry, axis=0, out=last_entry)
+        limit = np.maximum(np.asarray(max_holding), 1)
+        X = X | ((last_entry >= 0) & (rows - last_entry == limit))
+
+    # state on signal bars, then forward-fill the last one
+    state = np.where(L, 1, np.where(S, -1, 0))
+    last_signal = np.where(L | S | X, rows, -1)
+    np.maximum.accumulate(last_signal, axis=0, out=last_signal)
+    position = np.take_along_axis(state, np.maximum(last_signal, 0), axis=0)
+    position[last_signal < 0] = 0
+
+    if index is not None:
+        return pd.Series(position, index=index, name='position')
+    return position
+
+def pair_positions(prices, pairs, params, cfg):
+    """
+    Raw positions and hedge ratios for several pairs on one aligned price frame,
+    ready for `backtest.portfolio_backtest`.
+      - `pairs`: list of (y, x) tickers (columns of `prices`)
+      - `params`: one dict-like per pair with lookback, z_enter, z_exit, max_holding
+        (and optionally min_vol; a stop_loss there goes to `portfolio_backtest`)
+    Signals are muted while the pair's spread vol is below `min_vol` (default `strategy.min_vol`).
+    Returns (position, beta) as (bars, pairs) arrays.
+    """
+    positions, betas = [], []
+    for pair, p in zip(pairs, params):
+        sub = prices[list(pair)]
+        signals, beta = generate_signals(sub, int(p['lookback']), p['z_enter'], p['z_exit'],
+                                         beta=fit_hedge(sub, **hedge_kwargs(cfg)))
+        spread = sub.iloc[:, 0] - beta * sub.iloc[:, 1]
+        vol = spread.rolling(int(p['lookback'])).std().fillna(0.0001).replace(0, 0.0001)
+        signals.loc[vol < p.get('min_vol', cfg['strategy']['min_vol']), ['long', 'short', 'exit']] = 0
+        positions.append(build_position(signals['long'], signals['short'], signals['exit'],
+                                        int(p['max_holding'])).to_numpy())
+        betas.append(np.broadcast_to(np.asarray(beta, dtype=float), (len(sub),)))
+    return np.column_stack(positions), np.column_stack(betas)
+
 if __name__ == '__main__':
     # Load config and prices
     cfg    = load_cfg()
@@ -51,23 +189,14 @@ if __name__ == '__main__':
         prices,
         lookback=cfg['strategy']['lookback'],
         z_enter=cfg['strategy']['z_enter'],
-        z_exit=cfg['strategy']['z_exit']
+        z_exit=cfg['strategy']['z_exit'],
+        beta=fit_hedge(prices, **hedge_kwargs(cfg))
     )
     # optional: persist raw signals
     signals.to_csv('signals.csv')
 
     # Build a running position: 1=long, -1=short, 0=flat
-    position = []
-    current = 0
-    for _, row in signals.iterrows():
-        if row['long']:
-            current =  1
-        elif row['short']:
-            current = -1
-        elif row['exit']:
-            current =  0
-        position.append(current)
-    signals['position'] = position
+    signals['position'] = build_position(signals['long'], signals['short'], signals['exit'])
 
     # Filter to only entry/exit events (position changes)
     events = signals[signals['position'].diff().fillna(0) != 0]
@@ -75,4 +204,7 @@ if __name__ == '__main__':
     # Display the trade events and hedge ratio
     print("\nTrade events (entries & exits):")
     print(events[['long','short','exit','position']].to_markdown())
-    print(f"\nHedge ratio β = {beta:.4f}")
+    if np.ndim(beta):
+        print(f"\nLatest hedge ratio β = {beta.iloc[-1]:.4f} ({cfg['strategy'].get('hedge')})")
+    else:
+        print(f"\nHedge ratio β = {beta:.4f}")
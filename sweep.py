@@ -0,0 +1,304 @@
+import numpy as np
+import pandas as pd
+from itertools import product
+
+from strat import hedge_ratio, fit_hedge, hedge_kwargs, build_position
+from backtest import backtest_arrays
+from performance import metrics_batch, periods_per_year
+from rolling import MomentsCache
+from profiling import stage
+
+# Parameter grid swept in every walk-forward window
+DEFAULT_GRID = {
+    'lookback': [10, 20, 30],
+    'z_enter': [1.5, 2.0, 2.5],
+    'z_exit': [0.5, 1.0],
+    'max_holding': [5, 10, 20],
+}
+# Rolling spread moments shared by every window evaluated in this process
+_moments_cache = MomentsCache()
+
+GRID_COLUMNS = ['lookback', 'z_enter', 'z_exit', 'max_holding']
+METRIC_COLUMNS = ['total_return', 'sharpe', 'max_dd']
+
+
+def _grid_batches(prices, lookbacks, combos, min_vol=0.0, tc=0.001, stop_loss=-0.05,
+                  moments=None, hedge=None, beta=None, trade_from=0):
+    """
+    Core of `evaluate_grid`: yields (lookback, z_enter, z_exit, max_holding, returns,
+    position) per lookback, the parameters as arrays with one entry per column of
+    `returns`; `position` is after stop-loss exits.
+    `combos` maps each lookback to its (z_enter, z_exit, max_holding) tuples;
+    tuples extended with (stop_loss, min_vol) override those two per column.
+    `beta` fixes the hedge ratio (e.g. one fitted on a training window);
+    signals before row `trade_from` are muted, so trading starts flat there.
+    """
+    y, x = prices.iloc[:, 0], prices.iloc[:, 1]
+    if beta is None:
+        if hedge is None or hedge.get('method', 'static') == 'static':
+            beta = hedge_ratio(y, x)
+        else:
+            beta = fit_hedge(prices, **hedge).to_numpy()
+            moments = None  # cached moments assume a single β
+    elif np.ndim(beta):
+        beta = np.asarray(beta, dtype=float)
+        moments = None
+    spread = y - beta * x
+    y, x = y.to_numpy(dtype=float), x.to_numpy(dtype=float)
+
+    if moments is None:
+        def moments(beta, lb):
+            rolling = spread.rolling(lb)
+            return rolling.mean().to_numpy(), rolling.std().to_numpy()
+    sizing_vol = moments(beta, 20)[1]
+
+    for lb in lookbacks:
+        if not combos[lb]:
+            continue
+        ze = np.array([c[0] for c in combos[lb]], dtype=float)
+        zx = np.array([c[1] for c in combos[lb]], dtype=float)
+        mh = np.array([c[2] for c in combos[lb]])
+        extended = len(combos[lb][0]) > 3
+        sl = np.array([c[3] for c in combos[lb]], dtype=float) if extended else stop_loss
+        mv = np.array([c[4] for c in combos[lb]], dtype=float) if extended else min_vol
+        with stage('signal', rows=len(y) * len(ze)):
+            mu, sigma = moments(beta, lb)
+            z = ((spread.to_numpy() - mu) / sigma)[:, None]
+            # Mute signals while the spread is too quiet to trade
+            vol = np.where(np.isnan(sigma) | (sigma == 0), 0.0001, sigma)
+            active = vol[:, None] >= mv
+            if trade_from:
+                active = active.copy()
+                active[:trade_from] = False
+
+            long = (z < -ze) & active
+            short = (z > ze) & active
+            exit = (np.abs(z) < zx) & active
+            position = build_position(long, short, exit, mh)
+        with stage('backtest', rows=position.size):
+            returns, position = backtest_arrays(y, x, position, beta, tc=tc, stop_loss=sl, vol=sizing_vol)
+        yield lb, ze, zx, mh, returns, position
+
+
+def evaluate_grid(prices, lookbacks, z_enters, z_exits, max_holdings,
+                  min_vol=0.0, tc=0.001, stop_loss=-0.05, moments=None, hedge=None, freq=252, keep=None):
+    """
+    Backtest every (lookback, z_enter, z_exit, max_holding) combination on one
+    two-column price window:
+      - β is fitted once for the window
+      - rolling mean/std of the spread are computed once per lookback
+      - thresholds and holding limits are broadcast as columns, so each
+        lookback is one batched position build and one batched backtest
+    `moments(beta, lookback)` can supply precomputed rolling (mean, std) of the
+    spread, e.g. from `window_moments`; otherwise they're computed here.
+    `hedge` holds `strat.fit_hedge` options for a rolling/Kalman β instead of
+    one static β per window. `freq` (bars per year) annualizes the Sharpe ratio.
+    `keep` is an optional boolean mask over the combinations (in output order);
+    only those are run and returned.
+    Returns a DataFrame with one row per combination (in `product` order) and
+    `total_return`, `sharpe`, `max_dd` columns.
+    """
+    combos = list(product(z_enters, z_exits, max_holdings))
+    if prices.empty or not combos:
+        return pd.DataFrame(columns=GRID_COLUMNS + METRIC_COLUMNS)
+    keep = np.ones(len(lookbacks) * len(combos), dtype=bool) if keep is None else np.asarray(keep)
+    per_lookback = {lb: [c for c, k in zip(combos, keep[i * len(combos):(i + 1) * len(combos)]) if k]
+                    for i, lb in enumerate(lookbacks)}
+
+    frames = []
+    for lb, ze, zx, mh, returns, _ in _grid_batches(prices, lookbacks, per_lookback, min_vol, tc, stop_loss,
+                                                 moments, hedge):
+        with stage('metrics', rows=returns.size):
+            metrics = metrics_batch(returns, freq=freq)
+            frames.append(pd.DataFrame({
+                'lookback': lb,
+                'z_enter': ze,
+                'z_exit': zx,
+                'max_holding': mh,
+                **{c: metrics[c].to_numpy() for c in METRIC_COLUMNS},
+            }))
+    if not frames:
+        return pd.DataFrame(columns=GRID_COLUMNS + METRIC_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def walk_forward_windows(start, end, window_days=365, step_days=30):
+    """List of (start, end) Timestamps for the rolling walk-forward windows."""
+    start, end = pd.to_datetime(start), pd.to_datetime(end)
+    window, step = pd.Timedelta(days=window_days), pd.Timedelta(days=step_days)
+    windows = []
+    while start + window <= end:
+        windows.append((start, start + window))
+        start += step
+    return windows
+
+
+def window_moments(pair, history, prices, lookbacks):
+    """
+    Rolling spread moments for a window, sliced from the pair's full `history`.
+    Returns a `moments(beta, lookback)` callable for `evaluate_grid`, or None when
+    the window isn't a contiguous run of `history` rows (then it computes its own).
+    """
+    rows = history.index.get_indexer(prices.index)
+    if not len(rows) or rows[0] < 0 or not (np.diff(rows) == 1).all():
+        return None
+    start, stop = rows[0], rows[-1] + 1
+    if not np.array_equal(history.to_numpy()[start:stop], prices.to_numpy()):
+        return None
+    _moments_cache.register(pair, history.to_numpy(), list(lookbacks) + [20])
+    return lambda beta, lb: _moments_cache.spread(pair, beta, lb, start, stop)
+
+
+def evaluate_window(prices, w_start, w_end, cfg, grid=DEFAULT_GRID, moments=None):
+    """Run the parameter grid on one window's prices, tagged with the window dates."""
+    results = evaluate_grid(
+        prices, grid['lookback'], grid['z_enter'], grid['z_exit'], grid['max_holding'],
+        min_vol=cfg['strategy']['min_vol'],
+        tc=cfg['backtest']['tc_per_trade'],
+        stop_loss=cfg['backtest']['stop_loss'],
+        moments=moments,
+        hedge=hedge_kwargs(cfg),
+        freq=periods_per_year(cfg['data'].get('interval', '1d'))
+    )
+    results.insert(0, 'start', w_start)
+    results.insert(1, 'end', w_end)
+    return results
+
+
+def merge_windows(frames):
+    """Concatenate window results in window order and rank by total return."""
+    frames = [f for f in frames if f is not None]
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not results.empty:
+        results = results.sort_values('total_return', ascending=False, kind='stable')
+    return results
+
+
+def oos_windows(start, end, train_days=365, test_days=30):
+    """
+    (train_start, train_end, test_end) for each walk-forward step: parameters are
+    picked on [train_start, train_end) and traded on [train_end, test_end).
+    Training windows step by `test_days`, so the test segments tile the range.
+    """
+    end = pd.to_datetime(end)
+    return [(s, e, min(e + pd.Timedelta(days=test_days), end))
+            for s, e in walk_forward_windows(start, end, train_days, test_days) if e < end]
+
+
+def _pick(scores, select):
+    """
+    Row of `scores` with the highest `select` metric (for max_dd, the shallowest
+    drawdown), or None. Ties go to the smallest parameters, so the pick is the
+    same whether the rows come in grid order or the sweep's ranking.
+    """
+    values = scores[select].to_numpy(dtype=float)
+    if not len(values) or np.isnan(values).all():
+        return None
+    tied = scores[values == np.nanmax(values)]
+    columns = [c for c in GRID_COLUMNS + ['stop_loss', 'min_vol'] if c in tied]
+    return tied.sort_values(columns, kind='stable').iloc[0]
+
+
+def walk_forward_oos(prices, cfg, grid=DEFAULT_GRID, train_days=365, test_days=30, select='sharpe',
+                     train_results=None, prune_after=0, prune_quantile=0.5, start=None, end=None):
+    """
+    Walk-forward optimization on one pair's two-column price history:
+      - on each training window, pick the parameter set with the best `select` metric
+      - trade it (training β, signals muted until the segment starts) on the
+        following `test_days`
+      - stitch the out-of-sample segments into one return series
+    Windows run from `start` to `end` (default: the first and last bar).
+    Training scores come from `train_results` (the sweep's rows for this pair,
+    matched on start/end) when it has the window, so the sweep isn't run twice.
+    Otherwise the grid runs here on rolling moments shared by every window.
+    Parameter sets scoring in the bottom `prune_quantile` of `prune_after` training
+    windows in a row are dropped from later ones (0 keeps them all). Windows with
+    no finite score don't count, and the latest pick is never dropped, so there
+    is always a set left to evaluate.
+    Returns (oos, selections):
+      - oos: DataFrame of `returns` and `position` over the test segments
+      - selections: one row per window with the picked parameters, their training
+        score and the segment's out-of-sample metrics
+    """
+    st, bt = cfg['strategy'], cfg['backtest']
+    hedge = hedge_kwargs(cfg)
+    freq = periods_per_year(cfg['data'].get('interval', '1d'))
+    combos = list(product(grid['z_enter'], grid['z_exit'], grid['max_holding']))
+    n_sets = len(grid['lookback']) * len(combos)
+    keep, strikes = np.ones(n_sets, dtype=bool), np.zeros(n_sets, dtype=int)
+    last_best = None  # set index of the latest pick on a pruned run
+    pair = tuple(prices.columns[:2])
+    index = prices.index
+    warmup = max(max(grid['lookback']), 20)
+
+    returns, positions, rows = [], [], []
+    start = index[0] if start is None else start
+    end = index[-1] + pd.Timedelta(days=1) if end is None else end
+    for train_start, train_end, test_end in oos_windows(start, end, train_days, test_days):
+        train = prices[(index >= train_start) & (index < train_end)]
+        if len(train) and train.index[0] != index[0]:
+            # the sweep's windows come from fetch_prices, whose pct_change drops the
+            # window's first bar: score the same bars so both paths pick alike
+            train = train.iloc[1:]
+        test_rows = np.flatnonzero((index >= train_end) & (index < test_end))
+        if len(train) < warmup or not len(test_rows):
+            continue
+        scores = None
+        if train_results is not None:
+            scores = train_results[(train_results['start'] == train_start) & (train_results['end'] == train_end)]
+            scores = scores if len(scores) else None
+        if scores is None:
+            moments = window_moments(pair, prices, train, grid['lookback'])
+            scores = evaluate_grid(train, grid['lookback'], grid['z_enter'], grid['z_exit'], grid['max_holding'],
+                                   min_vol=st['min_vol'], tc=bt['tc_per_trade'], stop_loss=bt['stop_loss'],
+                                   moments=moments, hedge=hedge, freq=freq, keep=keep)
+            values = scores[select].to_numpy(dtype=float)
+            if prune_after and not np.isnan(values).all():
+                # strikes for sets in the bottom quantile of this window, reset otherwise
+                evaluated = np.flatnonzero(keep)
+                low = np.isnan(values) | (values < np.nanquantile(values, prune_quantile))
+                strikes[evaluated] = np.where(low, strikes[evaluated] + 1, 0)
+                last_best = evaluated[scores.index.get_loc(_pick(scores, select).name)]
+                keep &= strikes < prune_after
+            if last_best is not None:
+                keep[last_best] = True
+        best = _pick(scores, select)
+
+        # out-of-sample segment, with enough earlier bars to warm up the rolling windows
+        lo = max(test_rows[0] - warmup, 0)
+        segment = prices.iloc[lo:test_rows[-1] + 1]
+        if best is None:
+            seg_returns, seg_position = np.zeros(len(test_rows)), np.zeros(len(test_rows), dtype=int)
+        else:
+            lb = int(best['lookback'])
+            if hedge.get('method', 'static') == 'static':
+                beta = hedge_ratio(train.iloc[:, 0], train.iloc[:, 1])
+            else:
+                # a dynamic β only uses past bars, so fit it through the segment
+                fitted = fit_hedge(prices.iloc[:test_rows[-1] + 1], **hedge).to_numpy()
+                beta = fitted[lo:]
+            params = (best['z_enter'], best['z_exit'], int(best['max_holding']))
+            if 'stop_loss' in best:
+                # rows from `search.run_search` carry their own stop-loss and vol floor
+                params += (best['stop_loss'], best['min_vol'])
+            *_, seg_returns, seg_position = next(_grid_batches(
+                segment, [lb], {lb: [params]}, st['min_vol'], bt['tc_per_trade'], bt['stop_loss'],
+                beta=beta, trade_from=test_rows[0] - lo))
+            seg_returns = seg_returns[test_rows[0] - lo:, 0]
+            seg_position = seg_position[test_rows[0] - lo:, 0]
+        returns.append(seg_returns)
+        positions.append(seg_position)
+        oos = metrics_batch(seg_returns, freq=freq).iloc[0]
+        rows.append({
+            'train_start': train_start, 'train_end': train_end, 'test_end': test_end,
+            **({c: best[c] for c in GRID_COLUMNS} if best is not None else {c: np.nan for c in GRID_COLUMNS}),
+            f"train_{select}": best[select] if best is not None else np.nan,
+            'oos_total_return': oos['total_return'], 'oos_sharpe': oos['sharpe'],
+            'evaluated': len(scores),
+        })
+    if not rows:
+        return pd.DataFrame(columns=['returns', 'position']), pd.DataFrame()
+    all_rows = np.concatenate([np.flatnonzero((index >= r['train_end']) & (index < r['test_end'])) for r in rows])
+    oos = pd.DataFrame({'returns': np.concatenate(returns), 'position': np.concatenate(positions)},
+                       index=index[all_rows])
+    return oos, pd.DataFrame(rows)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import SyntheticBackend, synthetic_prices
+
+
+@pytest.fixture(scope='session')
+def csv_prices():
+    """The bundled XOM/CVX closes (columns ordered like `fetch_prices`)."""
+    prices = pd.read_csv('prices.csv', index_col=0, parse_dates=True)
+    return prices[sorted(prices.columns)]
+
+
+@pytest.fixture(scope='session')
+def synthetic_pair():
+    """Two cointegrated synthetic legs, 1,500 daily bars."""
+    bars = synthetic_prices(2, 1500, 'B', seed=3)
+    return pd.DataFrame({t: df['Adj Close'] for t, df in bars.items()})
+
+
+def random_signals(rng, n, cols=None, p=0.08):
+    """Sparse random long/short/exit flags, (n,) or (n, cols)."""
+    shape = (n,) if cols is None else (n, cols)
+    return tuple((rng.random(shape) < p).astype(int) for _ in range(3))
+
+
+def ragged_backend(freq, tz=None, seed=1):
+    """Synthetic bars with missing rows, missing closes and a ticker without volume."""
+    rng = np.random.default_rng(seed)
+    backend = SyntheticBackend(6, 1200, freq, 3)
+    for t in list(backend.bars)[::2]:
+        df = backend.bars[t]
+        df = df[rng.random(len(df)) >= 0.05].copy()
+        df.loc[rng.random(len(df)) < 0.02, 'Adj Close'] = np.nan
+        if t == 'SYN002':
+            df['Volume'] = np.nan
+        backend.bars[t] = df
+    if tz is not None:
+        download = backend.download
+        backend.download = lambda *args: {t: d.tz_localize(tz) for t, d in download(*args).items()}
+    return backend
@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import _stop_loss_scan, backtest_arrays, portfolio_backtest, run_backtest
+from bench import synthetic_prices
+from strat import build_position, generate_signals, hedge_ratio
+
+
+def loop_backtest(prices, position, beta, tc=0.001, stop_loss=-0.05):
+    """The original pandas backtest with its bar-by-bar stop-loss loop."""
+    position = position.copy()
+    spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
+    inv_vol = 1 / spread.rolling(20).std()
+
+    def pnl():
+        pos_y = position * inv_vol
+        pos_x = -beta * pos_y
+        gross = pos_y.shift(1) * prices.iloc[:, 0].pct_change() + pos_x.shift(1) * prices.iloc[:, 1].pct_change()
+        cost = (pos_y.diff().abs() * prices.iloc[:, 0] + pos_x.diff().abs() * prices.iloc[:, 1]) * tc
+        return (gross - cost).fillna(0)
+
+    returns = pnl()
+    cum_trade = 0
+    for i, r in returns.items():
+        if position[i] != 0:
+            cum_trade += r
+            if cum_trade < stop_loss:
+                position[i] = 0
+                cum_trade = 0
+        else:
+            cum_trade = 0
+    return pnl(), position
+
+
+def loop_scan(returns, in_trade, stop_loss):
+    """The bar-by-bar stop-loss scan, one column at a time."""
+    stops = np.zeros(returns.shape, dtype=bool)
+    for k in range(returns.shape[1]):
+        run = 0.0
+        for t in range(returns.shape[0]):
+            if not in_trade[t, k]:
+                run = 0.0
+                continue
+            run += returns[t, k]
+            if run < stop_loss[k]:
+                stops[t, k] = True
+                run = 0.0
+    return stops
+
+
+def positions(prices, lookback=20, z_enter=1.5, z_exit=0.5, max_holding=20):
+    signals, beta = generate_signals(prices, lookback, z_enter, z_exit)
+    return build_position(signals['long'], signals['short'], signals['exit'], max_holding), beta
+
+
+@pytest.mark.parametrize('stop_loss', [-0.5, -0.05, -0.01, -0.002])
+@pytest.mark.parametrize('data', ['csv_prices', 'synthetic_pair'])
+def test_run_backtest_matches_loop(request, data, stop_loss):
+    prices = request.getfixturevalue(data)
+    position, beta = positions(prices)
+    returns, cum_returns, pos = run_backtest(prices, position, beta, tc=0.001, stop_loss=stop_loss)
+    ref_returns, ref_pos = loop_backtest(prices, position, beta, tc=0.001, stop_loss=stop_loss)
+    np.testing.assert_array_equal(pos.to_numpy(), ref_pos.to_numpy())
+    np.testing.assert_allclose(returns.to_numpy(), ref_returns.to_numpy(), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(cum_returns.to_numpy(), ref_returns.cumsum().to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_backtest_arrays_leaves_inputs_alone(csv_prices):
+    position, beta = positions(csv_prices)
+    before = position.to_numpy().copy()
+    backtest_arrays(csv_prices.iloc[:, 0].to_numpy(), csv_prices.iloc[:, 1].to_numpy(), position.to_numpy(), beta,
+                    stop_loss=-0.002)
+    np.testing.assert_array_equal(position.to_numpy(), before)
+
+
+def test_backtest_arrays_batch_matches_columns(synthetic_pair):
+    y, x = synthetic_pair.iloc[:, 0].to_numpy(), synthetic_pair.iloc[:, 1].to_numpy()
+    beta = hedge_ratio(synthetic_pair.iloc[:, 0], synthetic_pair.iloc[:, 1])
+    cols = [positions(synthetic_pair, lb, ze, 0.5, mh)[0].to_numpy()
+            for lb in (10, 30) for ze in (1.0, 2.0) for mh in (5, 40)]
+    batch = np.column_stack(cols)
+    stop_loss = np.linspace(-0.05, -0.001, batch.shape[1])
+    returns, pos = backtest_arrays(y, x, batch, beta, stop_loss=stop_loss)
+    for k in range(batch.shape[1]):
+        r, p = backtest_arrays(y, x, batch[:, k], beta, stop_loss=stop_loss[k])
+        np.testing.assert_array_equal(pos[:, k], p)
+        np.testing.assert_allclose(returns[:, k], r, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_stop_loss_scan_matches_loop(seed):
+    rng = np.random.default_rng(seed)
+    n, k = rng.integers(50, 800), rng.integers(1, 12)
+    returns = rng.normal(0, 0.01, (n, k))
+    # long trades, a few bars of flat in between
+    in_trade = rng.random((n, k)) < rng.uniform(0.5, 0.99)
+    stop_loss = rng.uniform(-0.08, -0.002, k)
+    np.testing.assert_array_equal(_stop_loss_scan(returns, in_trade, stop_loss),
+                                  loop_scan(returns, in_trade, stop_loss))
+    np.testing.assert_array_equal(_stop_loss_scan(returns, in_trade, -0.02),
+                                  loop_scan(returns, in_trade, np.full(k, -0.02)))
+
+
+@pytest.fixture(scope='module')
+def universe():
+    bars = synthetic_prices(6, 1200, 'B', seed=11)
+    return pd.DataFrame({t: df['Adj Close'] for t, df in bars.items()})
+
+
+def pair_inputs(prices, pairs, seed=0):
+    rng = np.random.default_rng(seed)
+    cols, betas = [], []
+    for y, x in pairs:
+        position, beta = positions(prices[[y, x]], int(rng.integers(10, 40)), float(rng.uniform(1.0, 2.0)))
+        cols.append(position.to_numpy())
+        betas.append(beta)
+    return np.column_stack(cols), np.array(betas)
+
+
+@pytest.mark.parametrize('stop_loss', [-0.01, [-0.5, -0.01, -0.002]])
+def test_portfolio_disjoint_pairs_match_run_backtest(universe, stop_loss):
+    t = list(universe.columns)
+    pairs = [(t[0], t[1]), (t[2], t[3]), (t[4], t[5])]
+    position, beta = pair_inputs(universe, pairs)
+    pair_returns, portfolio, pos = portfolio_backtest(universe, pairs, position, beta, stop_loss=stop_loss)
+    for k, (y, x) in enumerate(pairs):
+        returns, _, p = run_backtest(universe[[y, x]], pd.Series(position[:, k], index=universe.index), beta[k],
+                                     stop_loss=np.broadcast_to(stop_loss, (len(pairs),))[k])
+        np.testing.assert_array_equal(pos.iloc[:, k].to_numpy(), p.to_numpy())
+        np.testing.assert_allclose(pair_returns.iloc[:, k].to_numpy(), returns.to_numpy(), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(portfolio.to_numpy(), pair_returns.sum(axis=1).to_numpy(), rtol=1e-12, atol=1e-15)
+
+
+def test_portfolio_nets_shared_legs(universe):
+    t = list(universe.columns)
+    pairs = [(t[0], t[1]), (t[0], t[2]), (t[3], t[1]), (t[4], t[5])]
+    position, beta = pair_inputs(universe, pairs, seed=1)
+    pair_returns, portfolio, pos = portfolio_backtest(universe, pairs, position, beta, tc=0.001, stop_loss=-0.5)
+    free, _, _ = portfolio_backtest(universe, pairs, position, beta, tc=0.0, stop_loss=-0.5)
+    alone = np.column_stack([
+        run_backtest(universe[[y, x]], pd.Series(position[:, k], index=universe.index), beta[k], tc=0.001,
+                     stop_loss=-0.5)[0].to_numpy()
+        for k, (y, x) in enumerate(pairs)])
+    # gross P&L is untouched; netting only ever saves costs
+    assert (pair_returns.to_numpy() >= alone - 1e-12).all()
+    assert (pair_returns.to_numpy() <= free.to_numpy() + 1e-12).all()
+    assert pair_returns.iloc[:, :3].sum().sum() > alone[:, :3].sum()
+    # the pair that shares no ticker pays its standalone costs
+    np.testing.assert_allclose(pair_returns.iloc[:, 3].to_numpy(), alone[:, 3], rtol=1e-9, atol=1e-12)
+
+
+def test_backtest_arrays_beta_per_column(synthetic_pair):
+    y, x = synthetic_pair.iloc[:, 0].to_numpy(), synthetic_pair.iloc[:, 1].to_numpy()
+    position, _ = positions(synthetic_pair)
+    base = hedge_ratio(synthetic_pair.iloc[:, 0], synthetic_pair.iloc[:, 1])
+    betas = base * np.array([1.0, 0.9, 1.1, 0.5])
+    batch = np.column_stack([position.to_numpy()] * len(betas))
+    # one β per column, and a per-bar β per column
+    drift = np.linspace(0.95, 1.05, len(y))[:, None]
+    for beta in (betas[None, :], betas * drift):
+        returns, pos = backtest_arrays(y, x, batch, beta, stop_loss=-0.01)
+        for k in range(len(betas)):
+            r, _, p = run_backtest(synthetic_pair, position, pd.Series(beta[:, k], index=synthetic_pair.index)
+                                   if beta.shape[0] > 1 else beta[0, k], stop_loss=-0.01)
+            np.testing.assert_array_equal(pos[:, k], p.to_numpy())
+            np.testing.assert_allclose(returns[:, k], r.to_numpy(), rtol=1e-9, atol=1e-12)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from bench import ar1, synthetic_prices, SyntheticBackend
+
+
+def test_ar1_matches_recursion():
+    rng = np.random.default_rng(0)
+    shocks = rng.normal(0, 0.01, (700, 3))
+    ref = np.empty_like(shocks)
+    prev = np.zeros(3)
+    for t in range(len(shocks)):
+        prev = ref[t] = 0.9 * prev + shocks[t]
+    np.testing.assert_allclose(ar1(shocks, 0.9, block=64), ref, rtol=1e-12, atol=1e-15)
+
+
+def test_synthetic_prices_are_seeded():
+    a, b = synthetic_prices(4, 300, seed=1), synthetic_prices(4, 300, seed=1)
+    assert list(a) == ['SYN000', 'SYN001', 'SYN002', 'SYN003']
+    for t in a:
+        assert a[t].equals(b[t])
+        assert (a[t]['Adj Close'] > 0).all()
+
+
+def test_synthetic_backend_serves_ranges():
+    backend = SyntheticBackend(2, 100, seed=0)
+    start, end = backend.span()
+    data = backend.store().load(backend.tickers, start, end)
+    assert data['Adj Close'].shape == (100, 2)
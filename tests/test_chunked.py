@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import run_backtest
+from chunked import ChunkedPairBacktest, iter_blocks, rolling_moments, streaming_hedge_ratio
+from conftest import ragged_backend
+from data_fetch import fetch_prices
+from performance import max_drawdown, sharpe
+from strat import build_position, generate_signals, hedge_ratio
+
+
+def batch_run(prices, beta, lb, ze, zx, mh, min_vol, tc, stop_loss):
+    """The in-memory generate_signals -> build_position -> run_backtest path."""
+    signals, _ = generate_signals(prices, lb, ze, zx, beta=beta)
+    spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
+    vol = spread.rolling(lb).std().fillna(0.0001).replace(0, 0.0001)
+    signals.loc[vol < min_vol, ['long', 'short', 'exit']] = 0
+    position = build_position(signals['long'], signals['short'], signals['exit'], mh)
+    returns, cum_returns, position = run_backtest(prices, position, beta, tc=tc, stop_loss=stop_loss)
+    return returns, cum_returns, position
+
+
+@pytest.fixture(scope='module')
+def ragged():
+    """A store of ragged bars (missing rows and closes, one ticker without volume) and its span."""
+    backend = ragged_backend('B')
+    return backend, backend.store(), *backend.span()
+
+
+@pytest.fixture(scope='module')
+def ragged_pair(ragged):
+    """`fetch_prices` of a ragged pair where both legs have gaps."""
+    _, store, start, end = ragged
+    with pytest.warns(FutureWarning):  # pct_change pads the missing closes
+        return fetch_prices(['SYN000', 'SYN004'], start, end, store=store)
+
+
+def random_blocks(rng, n):
+    cuts = np.sort(rng.choice(np.arange(1, n), size=int(rng.integers(1, 12)), replace=False))
+    return np.split(np.arange(n), cuts)
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('data', ['csv_prices', 'synthetic_pair', 'ragged_pair'])
+def test_chunked_matches_batch(request, data, seed):
+    prices = request.getfixturevalue(data)
+    rng = np.random.default_rng(seed)
+    lb, mh = int(rng.integers(5, 40)), int(rng.integers(3, 30))
+    ze, zx = float(rng.uniform(1.0, 2.0)), float(rng.uniform(0.1, 0.7))
+    stop_loss, min_vol = float(rng.choice([-0.5, -0.02, -0.005])), float(rng.choice([0.0, 0.5]))
+    beta = hedge_ratio(prices.iloc[:, 0], prices.iloc[:, 1])
+    returns, cum_returns, position = batch_run(prices, beta, lb, ze, zx, mh, min_vol, 0.001, stop_loss)
+
+    y, x = prices.iloc[:, 0].to_numpy(), prices.iloc[:, 1].to_numpy()
+    engine = ChunkedPairBacktest(beta, lb, ze, zx, mh, tc=0.001, stop_loss=stop_loss, min_vol=min_vol)
+    parts = [engine.update(y[rows], x[rows]) for rows in random_blocks(rng, len(y))]
+    got_returns = np.concatenate([r for r, _ in parts])
+    got_position = np.concatenate([p for _, p in parts])
+    np.testing.assert_array_equal(got_position, position.to_numpy())
+    np.testing.assert_allclose(got_returns, returns.to_numpy(), rtol=1e-6, atol=1e-7)  # float32 output
+    summary = engine.summary()
+    assert summary['bars'] == len(prices)
+    np.testing.assert_allclose(summary['total_return'], cum_returns.iloc[-1], rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(summary['sharpe'], sharpe(returns), rtol=1e-7)
+    np.testing.assert_allclose(summary['max_dd'], max_drawdown(cum_returns), rtol=1e-7, atol=1e-12)
+
+
+@pytest.mark.filterwarnings('ignore:The default fill_method:FutureWarning')  # fetch_prices' pct_change
+@pytest.mark.parametrize('rows', [1, 7, 100, 10 ** 6])
+@pytest.mark.parametrize('min_vol', [100000, 2e6])
+def test_iter_blocks_match_fetch_prices(ragged, rows, min_vol):
+    backend, store, start, end = ragged
+    for k, y in enumerate(backend.tickers):
+        for x in backend.tickers[k + 1:]:
+            ref = fetch_prices([y, x], start, end, min_vol=min_vol, store=store)
+            parts = list(iter_blocks((x, y), start, end, rows=rows, min_vol=min_vol, store=store))
+            assert all(len(index) for index, _, _ in parts)
+            index = pd.DatetimeIndex(np.concatenate([i.asi8 for i, _, _ in parts]) if parts else [])
+            assert index.equals(pd.DatetimeIndex(ref.index.asi8))
+            got = np.column_stack([np.concatenate([p[c] for p in parts]) if parts else [] for c in (1, 2)])
+            np.testing.assert_array_equal(got.reshape(ref.shape), ref.to_numpy())
+
+
+def test_block_size_does_not_change_results(synthetic_pair):
+    y, x = synthetic_pair.iloc[:, 0].to_numpy(), synthetic_pair.iloc[:, 1].to_numpy()
+    beta = streaming_hedge_ratio([(None, y[:700], x[:700]), (None, y[700:], x[700:])])
+    np.testing.assert_allclose(beta, hedge_ratio(synthetic_pair.iloc[:, 0], synthetic_pair.iloc[:, 1]), rtol=1e-12)
+    runs = []
+    for rows in (len(y), 1, 7, 250):
+        engine = ChunkedPairBacktest(beta, 20, 1.5, 0.5, 10, stop_loss=-0.01)
+        parts = [engine.update(y[k:k + rows], x[k:k + rows]) for k in range(0, len(y), rows)]
+        runs.append((np.concatenate([r for r, _ in parts]), np.concatenate([p for _, p in parts])))
+    for returns, position in runs[1:]:
+        np.testing.assert_array_equal(position, runs[0][1])
+        np.testing.assert_array_equal(returns, runs[0][0])
+
+
+def test_rolling_moments_continue_from_tail():
+    values = np.random.default_rng(5).normal(size=200)
+    mean, std = rolling_moments(values, 15)
+    tail_mean, tail_std = rolling_moments(values[120:], 15, tail=values[:120])
+    np.testing.assert_array_equal(tail_mean, mean[120:])
+    np.testing.assert_array_equal(tail_std, std[120:])
+    assert np.isnan(mean[:14]).all() and not np.isnan(mean[14:]).any()
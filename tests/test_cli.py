@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+
+import pytest
+import yaml
+
+import cli
+import price_store
+from bench import SyntheticBackend
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """config.yml on the bundled CSV, with the results store and caches under tmp_path."""
+    monkeypatch.setattr(price_store, '_default_store', None)  # cli points it at the CSV source
+    with open('config.yml') as f:
+        cfg = yaml.safe_load(f)
+    cfg['data'].update(source='csv', offline_path=os.path.abspath('prices.csv'), start='2020-01-01', end='2022-06-01')
+    cfg['tickers'].update(universe=['XOM', 'CVX'], pair=['XOM', 'CVX'])
+    cfg['pair_selection']['stats_cache'] = ''
+    cfg['sweep']['workers'] = 1
+    cfg['results']['path'] = str(tmp_path / 'results')
+    cfg['report']['plot'] = False
+    path = tmp_path / 'config.yml'
+    path.write_text(yaml.safe_dump(cfg))
+    return str(path)
+
+
+def run(config, *argv):
+    return cli.main(['--config', config, *argv])
+
+
+def test_parse_arguments():
+    parser = cli.build_parser()
+    args = parser.parse_args(['fetch', '--tickers', 'XOM', 'CVX'])
+    assert (args.run, args.tickers, args.config) == (cli.cmd_fetch, ['XOM', 'CVX'], 'config.yml')
+    assert parser.parse_args(['screen']).run is cli.cmd_screen
+    args = parser.parse_args(['signals', '--pair', 'XOM', 'CVX', '--lookback', '30', '--z-enter', '1.5', '--rows', '5'])
+    assert (args.pair, args.lookback, args.z_enter, args.z_exit, args.rows) == (['XOM', 'CVX'], 30, 1.5, None, 5)
+    assert not hasattr(args, 'plot')  # backtest only
+    assert parser.parse_args(['backtest']).plot is None
+    assert parser.parse_args(['backtest', '--no-plot']).plot is False
+    assert parser.parse_args(['backtest', '--plot', 'on']).plot is True
+    assert parser.parse_args(['backtest', '--plot', 'curve.png']).plot == 'curve.png'
+    args = parser.parse_args(['--config', 'other.yml', 'sweep', 'XOM,CVX', 'BP,SHEL', '--workers', '2',
+                              '--method', 'halving', '--append'])
+    assert (args.config, args.pairs, args.workers, args.method, args.append) == \
+        ('other.yml', ['XOM,CVX', 'BP,SHEL'], 2, 'halving', True)
+    args = parser.parse_args(['report', '--by', 'sharpe', '--aggregate', '--pair', 'CVX', 'XOM'])
+    assert (args.by, args.aggregate, args.pair, args.rows) == ('sharpe', True, ['CVX', 'XOM'], 20)
+    for bad in ([], ['sweep', '--method', 'bayes'], ['report', '--by', 'calmar'], ['signals', '--pair', 'XOM']):
+        with pytest.raises(SystemExit):
+            parser.parse_args(bad)
+
+
+def test_fetch(config, capsys):
+    assert run(config, 'fetch') is None
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines] == ['CVX', 'XOM']
+    assert all(line.split()[2:] == ['bars', '2020-01-03', 'to', '2022-05-31'] for line in lines)
+
+
+def test_screen(config, capsys, monkeypatch):
+    # the bundled CSV has no volume, so nothing passes the liquidity stage
+    assert run(config, 'screen') is None
+    assert capsys.readouterr().out == 'No cointegrated pairs found.\n'
+    backend = SyntheticBackend(4, 800, 'B', seed=3)
+    monkeypatch.setattr(price_store.PriceStore, 'from_config', classmethod(lambda cls, cfg: backend.store()))
+    with open(config) as f:
+        cfg = yaml.safe_load(f)
+    cfg['tickers']['universe'] = backend.tickers
+    cfg['data'].update(zip(('start', 'end'), (d.strftime('%Y-%m-%d') for d in backend.span())))
+    with open(config, 'w') as f:
+        yaml.safe_dump(cfg, f)
+    assert run(config, 'screen') is None
+    table = capsys.readouterr().out.splitlines()
+    assert 'p_value' in table[0] and 'SYN000,SYN001' in table[2]
+
+
+def test_signals_and_backtest(config, capsys):
+    assert run(config, 'signals', '--rows', '3', '--lookback', '30') is None
+    out = capsys.readouterr().out
+    assert 'position' in out and len(out.splitlines()) == 2 + 3
+    assert run(config, 'backtest', '--no-plot') is None
+    assert 'Sharpe' in capsys.readouterr().out
+
+
+def test_sweep_then_report(config, capsys):
+    assert run(config, 'sweep', 'XOM,CVX', '--rows', '3') is None
+    out = capsys.readouterr().out
+    assert 'result rows saved' in out and 'total_return' in out
+    assert run(config, 'report', '--rows', '4') is None
+    table = capsys.readouterr().out.splitlines()
+    assert 'total_return' in table[0] and len(table) == 2 + 4
+    assert run(config, 'report', '--aggregate', '--by', 'sharpe', '--pair', 'XOM', 'CVX') is None
+    assert 'sharpe' in capsys.readouterr().out
+
+
+def test_report_without_results(config, capsys):
+    assert run(config, 'report') is None
+    assert capsys.readouterr().out.startswith('No results in')
+
+
+def test_import_is_light():
+    code = "import sys, cli; print(sorted(m for m in ('pandas', 'statsmodels', 'matplotlib') if m in sys.modules))"
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.abspath(cli.__file__))).stdout
+    assert out.strip() == '[]'
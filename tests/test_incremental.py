@@ -0,0 +1,72 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import price_store
+from bench import SyntheticBackend
+from incremental import PipelineState
+from scheduler import run_walk_forward
+from strat import fit_hedge
+from sweep import walk_forward_windows
+
+
+@pytest.fixture
+def cfg():
+    with open('config.yml') as f:
+        return yaml.safe_load(f)
+
+
+def best_row(**extra):
+    return pd.Series({'lookback': 20, 'z_enter': 1.5, 'z_exit': 0.5, 'max_holding': 10,
+                      'start': pd.Timestamp('2020-01-01'), 'total_return': 0.3, **extra})
+
+
+def test_advance_position_resumes(csv_prices, cfg, tmp_path):
+    pair = tuple(csv_prices.columns)
+    state = PipelineState(str(tmp_path))
+    state.advance_position(pair, csv_prices.iloc[:700], best_row(), cfg)
+    # metrics and window dates in the row don't rebuild the engine (nor refit its β)
+    resumed, new = state.advance_position(pair, csv_prices, best_row(total_return=0.9), cfg)
+    assert len(new) == len(csv_prices) - 700
+    assert resumed.beta == fit_hedge(csv_prices.iloc[:700])
+    _, again = state.advance_position(pair, csv_prices, best_row(z_enter=2.0), cfg)
+    assert len(again) == len(csv_prices)
+
+
+def test_advance_position_uses_fitted_hedge(csv_prices, cfg, tmp_path):
+    cfg = copy.deepcopy(cfg)
+    cfg['strategy'].update(hedge='rolling', hedge_window=60, min_vol=0.0)
+    pair = tuple(csv_prices.columns)
+    engine, ticks = PipelineState(str(tmp_path)).advance_position(pair, csv_prices, best_row(), cfg)
+    beta = fit_hedge(csv_prices, method='rolling', window=60)
+    assert engine.beta == beta.iloc[-1]
+    # bars before the first β are skipped, the rest trade
+    assert len(ticks) == beta.notna().sum()
+    assert np.isfinite(engine.cum_pnl) and any(t.position for t in ticks)
+
+
+def test_walk_forward_reruns_only_new_windows(cfg, tmp_path, monkeypatch):
+    backend = SyntheticBackend(2, 900, 'B', seed=4)
+    monkeypatch.setattr(price_store, '_default_store', backend.store())
+    pairs = [tuple(backend.tickers)]
+    start, end = backend.span()
+    first_end = end - pd.Timedelta(days=120)
+    state = PipelineState(str(tmp_path / 'state'))
+    state.walk_forward(pairs, start, first_end, '1d', cfg, workers=1)
+    before = len(walk_forward_windows(start, first_end))
+    assert state.last_run == {'windows': before, 'computed': before}
+
+    seen = []
+    warm = state.walk_forward(pairs, start, end, '1d', cfg, workers=1,
+                              on_result=lambda pair, rows: seen.append(rows['start'].iloc[0]))
+    after = len(walk_forward_windows(start, end))
+    assert after > before and state.last_run == {'windows': after, 'computed': after - before}
+    assert seen == [w for w, _ in walk_forward_windows(start, end)]
+    cold = run_walk_forward(pairs, start, end, '1d', cfg, workers=1)
+    pd.testing.assert_frame_equal(warm.reset_index(drop=True), cold.reset_index(drop=True))
+    # nothing new: every window comes from the store
+    state.walk_forward(pairs, start, end, '1d', cfg, workers=1)
+    assert state.last_run['computed'] == 0
@@ -0,0 +1,47 @@
+import asyncio
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from live import RollingWindow, LiveSignalEngine, CSVReplaySource, run_live, replay_matches_batch
+
+# RollingWindow repeats pandas' compensated rolling mean/var updates, so these
+# checks are exact; they are the first to fail if a pandas release (pinned to
+# 2.x in pyproject.toml) changes that arithmetic.
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 20])
+def test_rolling_window_bit_identical_to_pandas(size):
+    rng = np.random.default_rng(size)
+    values = np.concatenate([rng.normal(0, 1, 300), np.full(30, 2.5), -np.abs(rng.normal(0, 1e-3, 100)),
+                             1e4 + rng.normal(0, 0.1, 200)])
+    window = RollingWindow(size)
+    got = np.array([window.push(v) for v in values])
+    rolling = pd.Series(values).rolling(size)
+    np.testing.assert_array_equal(got[:, 0], rolling.mean().to_numpy())
+    np.testing.assert_array_equal(got[:, 1], rolling.std().to_numpy())
+
+
+GRID = list(product([5, 20, 60], [1.0, 2.0], [0.0, 0.5], [None, 5, 20], [-0.05, -0.005]))
+
+
+@pytest.mark.parametrize('data', ['csv_prices', 'synthetic_pair'])
+def test_replay_matches_batch(request, data):
+    prices = request.getfixturevalue(data)
+    for lookback, z_enter, z_exit, max_holding, stop_loss in GRID:
+        same_pos, same_pnl = replay_matches_batch(prices, lookback, z_enter, z_exit, max_holding,
+                                                  tc=0.001, stop_loss=stop_loss)
+        assert same_pos and same_pnl, (lookback, z_enter, z_exit, max_holding, stop_loss)
+
+
+def test_run_live_from_csv(csv_prices, tmp_path):
+    path = tmp_path / 'prices.csv'
+    csv_prices.to_csv(path)
+    pair = tuple(csv_prices.columns)
+    engine = LiveSignalEngine(1.5, 20, 2.0, 0.5, 10, pair=pair)
+    ticks = asyncio.run(run_live(CSVReplaySource(str(path)), {pair: engine}))
+    assert ticks and all(t.events for t in ticks)
+    assert [t.time for t in ticks] == sorted(t.time for t in ticks)
+    assert {'enter_long', 'enter_short'} <= {e for t in ticks for e in t.events}
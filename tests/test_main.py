@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import main
+import price_store
+from backtest import portfolio_backtest
+from bench import SyntheticBackend
+from data_fetch import fetch_prices
+from strat import pair_positions
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+    backend = SyntheticBackend(4, 800, 'B', seed=2)
+    monkeypatch.setattr(price_store, '_default_store', backend.store())
+    with open('config.yml') as f:
+        cfg = yaml.safe_load(f)
+    start, end = (d.strftime('%Y-%m-%d') for d in backend.span())
+    cfg['data'].update(start=start, end=end)
+    cfg['report']['plot'] = False
+    cfg['tickers']['universe'] = backend.tickers
+    return cfg
+
+
+def row(pair, **extra):
+    return {'pair': pair, 'lookback': 20, 'z_enter': 1.0, 'z_exit': 0.3, 'max_holding': 30,
+            'start': pd.Timestamp('2020-01-01'), 'end': pd.Timestamp('2021-01-01'), **extra}
+
+
+def portfolio_alone(prices, pair, params, cfg, stop_loss):
+    position, beta = pair_positions(prices, [pair], [params], cfg)
+    returns, _, _ = portfolio_backtest(prices, [pair], position, beta, tc=cfg['backtest']['tc_per_trade'],
+                                       stop_loss=stop_loss)
+    return returns.iloc[:, 0].to_numpy()
+
+
+@pytest.mark.parametrize('searched', [True, False])
+def test_portfolio_uses_each_rows_stop_loss(cfg, searched):
+    t = cfg['tickers']['universe']
+    pairs = [(t[0], t[1]), (t[2], t[3])]
+    if searched:
+        # rows from the parameter search carry their own stop-loss
+        rows = [row('SYN000,SYN001', stop_loss=-0.002, min_vol=0.0), row('SYN002,SYN003', stop_loss=-0.5, min_vol=0.0)]
+        stops = [-0.002, -0.5]
+    else:
+        rows, stops = [row('SYN000,SYN001'), row('SYN002,SYN003')], [cfg['backtest']['stop_loss']] * 2
+    results = pd.DataFrame(rows)
+    pair_returns, _ = main.run_portfolio(pairs, results, cfg)
+    prices = fetch_prices(t, cfg['data']['start'], cfg['data']['end'], cfg['data']['interval'])
+    for k, pair in enumerate(pairs):
+        alone = portfolio_alone(prices, pair, results.iloc[k], cfg, stops[k])
+        np.testing.assert_allclose(pair_returns.iloc[:, k].to_numpy(), alone, atol=1e-12)
+    if searched:
+        # the tight stop binds: the config's would have traded differently
+        loose = portfolio_alone(prices, pairs[0], results.iloc[0], cfg, cfg['backtest']['stop_loss'])
+        assert not np.allclose(pair_returns.iloc[:, 0].to_numpy(), loose)
+
+
+@pytest.mark.parametrize('extra, expected', [({}, -0.05), ({'stop_loss': -0.01, 'min_vol': 0.0}, -0.01)])
+def test_best_window_uses_the_rows_stop_loss(cfg, monkeypatch, extra, expected):
+    seen = {}
+    run_backtest = main.run_backtest
+
+    def spy(*args, **kwargs):
+        seen.update(kwargs)
+        return run_backtest(*args, **kwargs)
+    monkeypatch.setattr(main, 'run_backtest', spy)
+    cfg['backtest']['stop_loss'] = -0.05
+    main.report_best_window(pd.Series(row('SYN000,SYN001', **extra)), 'SYN000', 'SYN001', cfg)
+    assert seen['stop_loss'] == expected
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import synthetic_prices
+from pair_selection import engle_granger_pvalues, find_pairs
+from stats_cache import StatsCache
+
+
+@pytest.fixture(scope='module')
+def universe_prices():
+    bars = synthetic_prices(12, 800, 'B', seed=4)
+    return pd.DataFrame({t: df['Adj Close'] for t, df in bars.items()})
+
+
+def test_engle_granger_matches_coint(universe_prices):
+    from statsmodels.tsa.stattools import coint
+    values = universe_prices.to_numpy()
+    ii, jj = np.triu_indices(values.shape[1], k=1)
+    got = engle_granger_pvalues(values[:, ii], values[:, jj])
+    ref = [coint(values[:, i], values[:, j])[1] for i, j in zip(ii, jj)]
+    np.testing.assert_allclose(got, ref, rtol=1e-9, atol=1e-12)
+
+
+def test_find_pairs_cache_and_workers(universe_prices, tmp_path):
+    volume = pd.DataFrame(2e6, index=universe_prices.index, columns=universe_prices.columns)
+    from universe import Universe
+    uni = Universe.from_frame(universe_prices, volume)
+    report = {}
+    pairs, scores = find_pairs(uni, 0.05, 0.3, 1e5, report=report)
+    assert pairs and report['selected'] == len(pairs)
+    cache = StatsCache(str(tmp_path / 'stats.sqlite'))
+    assert find_pairs(uni, 0.05, 0.3, 1e5, cache=cache) == (pairs, scores)
+    assert find_pairs(uni, 0.05, 0.3, 1e5, cache=cache) == (pairs, scores)
+    assert find_pairs(uni, 0.05, 0.3, 1e5, workers=2) == (pairs, scores)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from performance import (max_drawdown, max_drawdown_batch, metrics_batch, rolling_drawdown, rolling_sharpe, sharpe,
+                         sharpe_batch, trade_segments, trade_stats, trade_stats_batch)
+
+
+def groupby_trade_stats(returns, position):
+    """The original pandas trade statistics (one trade id per run of non-zero bars)."""
+    df = pd.DataFrame({'returns': returns, 'position': position})
+    df['in_trade'] = df['position'] != 0
+    shifted = df['in_trade'].shift(1)
+    shifted = (~shifted.isna() & shifted).astype(bool)
+    df['trade_id'] = (df['in_trade'] & ~shifted).cumsum()
+    trade_returns = df[df['in_trade']].groupby('trade_id')['returns'].sum()
+    num_trades = trade_returns.shape[0]
+    win_rate = (trade_returns > 0).mean() if num_trades > 0 else np.nan
+    avg_pnl = trade_returns.mean() if num_trades > 0 else np.nan
+    return num_trades, win_rate, avg_pnl
+
+
+def random_book(rng, n, cols):
+    """Random returns and positions with long runs, flips and flat columns."""
+    position = np.zeros((n, cols))
+    for k in range(cols - 1):
+        side = 0
+        for t in range(n):
+            if rng.random() < 0.1:
+                side = rng.choice([-1, 0, 1])
+            position[t, k] = side
+    returns = np.where(position != 0, rng.normal(0, 0.01, (n, cols)), 0.0)
+    return returns, position
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_trade_stats_batch_matches_groupby(seed):
+    rng = np.random.default_rng(seed)
+    returns, position = random_book(rng, int(rng.integers(1, 600)), 6)
+    num_trades, win_rate, avg_pnl = trade_stats_batch(returns, position)
+    for k in range(returns.shape[1]):
+        ref = groupby_trade_stats(returns[:, k], position[:, k])
+        assert num_trades[k] == ref[0]
+        np.testing.assert_allclose([win_rate[k], avg_pnl[k]], ref[1:], rtol=1e-12, atol=1e-15)
+
+
+def test_trade_stats_uses_position_column():
+    rng = np.random.default_rng(7)
+    returns, position = random_book(rng, 300, 2)
+    index = pd.date_range('2020-01-01', periods=300, freq='B')
+    signals = pd.DataFrame({'position': position[:, 0]}, index=index)
+    got = trade_stats(pd.Series(returns[:, 0], index=index), signals)
+    ref = groupby_trade_stats(returns[:, 0], position[:, 0])
+    assert got[0] == ref[0]
+    np.testing.assert_allclose(got[1:], ref[1:], rtol=1e-12)
+
+
+def test_trade_segments_stay_in_their_column():
+    position = np.array([[1, 1], [1, 0], [-1, 1], [0, 1]])
+    start, end, column = trade_segments(position)
+    np.testing.assert_array_equal(start, [0, 0, 2])
+    np.testing.assert_array_equal(end, [3, 1, 4])
+    np.testing.assert_array_equal(column, [0, 1, 1])
+
+
+def test_metrics_batch_matches_series_metrics():
+    rng = np.random.default_rng(1)
+    returns, position = random_book(rng, 500, 5)
+    returns[:, -1] = 0.0  # a flat column: no Sharpe, no drawdown
+    out = metrics_batch(returns, position)
+    for k in range(returns.shape[1]):
+        r = pd.Series(returns[:, k])
+        np.testing.assert_allclose(out['total_return'][k], r.cumsum().iloc[-1], rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(out['sharpe'][k], sharpe(r), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(out['max_dd'][k], max_drawdown(r.cumsum()), rtol=1e-9)
+    np.testing.assert_allclose(sharpe_batch(returns[:, :1]), [sharpe(pd.Series(returns[:, 0]))], rtol=1e-9)
+    np.testing.assert_allclose(max_drawdown_batch(np.cumsum(returns, axis=0)), out['max_dd'], rtol=1e-12)
+
+
+def test_rolling_metrics_match_pandas():
+    rng = np.random.default_rng(2)
+    returns = rng.normal(0.001, 0.01, (400, 3))
+    frame = pd.DataFrame(returns)
+    ref = np.sqrt(252) * frame.rolling(30).mean() / frame.rolling(30).std()
+    np.testing.assert_allclose(rolling_sharpe(returns, 30), ref.to_numpy(), rtol=1e-7, equal_nan=True)
+    cum = frame.cumsum() + 1
+    peak = cum.rolling(50, min_periods=1).max()
+    np.testing.assert_allclose(rolling_drawdown(cum.to_numpy(), 50), ((cum - peak) / peak).to_numpy(), rtol=1e-12)
@@ -0,0 +1,166 @@
+import sys
+import time
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench import SyntheticBackend
+from price_store import FIELDS, CSVBackend, MockBackend, PriceStore, YFinanceBackend, _missing_ranges
+
+
+@pytest.fixture(scope='module')
+def synthetic():
+    return SyntheticBackend(n_tickers=8, n_bars=300, seed=4)
+
+
+def store_over(backend, **kwargs):
+    return PriceStore(root=None, backend=backend, backoff=0.001, **kwargs)
+
+
+def test_retries_then_succeeds(synthetic):
+    mock = MockBackend(synthetic, fail_first=2)
+    store = store_over(mock, retries=3)
+    start, end = synthetic.span()
+    data = store.load(synthetic.tickers[:2], start, end)
+    assert len(mock.calls) == 3
+    assert len(data) == 300
+
+
+def test_failed_range_stays_uncovered(synthetic, capsys):
+    mock = MockBackend(synthetic, failure_rate=1.0)
+    store = store_over(mock, retries=1)
+    start, end = synthetic.span()
+    tickers = synthetic.tickers[:2]
+    assert store.load(tickers, start, end).empty
+    assert 'failed' in capsys.readouterr().out
+    assert len(mock.calls) == 2  # first try and one retry
+    # the next call asks for the same range again and, once the backend is back, serves it
+    mock.failure_rate = 0.0
+    data = store.load(tickers, start, end)
+    assert len(mock.calls) == 3 and mock.calls[-1][1:3] == (start, end)
+    assert len(data) == 300
+    store.load(tickers, start, end)
+    assert len(mock.calls) == 3
+
+
+def test_batches_hold_at_most_batch_size(synthetic):
+    mock = MockBackend(synthetic)
+    store = store_over(mock, batch_size=3)
+    start, end = synthetic.span()
+    store.prefetch(synthetic.tickers, start, end)
+    sizes = sorted(len(tickers) for tickers, *_ in mock.calls)
+    assert sizes == [2, 3, 3]
+    assert sorted(t for tickers, *_ in mock.calls for t in tickers) == sorted(synthetic.tickers)
+
+
+def test_concurrent_requests_beat_serial(synthetic):
+    start, end = synthetic.span()
+    elapsed = {}
+    for workers in (1, 8):
+        store = store_over(MockBackend(synthetic, latency=0.1), batch_size=1, workers=workers)
+        t0 = time.perf_counter()
+        store.prefetch(synthetic.tickers, start, end)
+        elapsed[workers] = time.perf_counter() - t0
+    assert elapsed[1] >= 0.8
+    assert elapsed[8] < elapsed[1] / 3
+
+
+def test_merge_invalidates_kept_frames(synthetic):
+    start, end = synthetic.span()
+    a, b = synthetic.tickers[:2]
+    mid = synthetic.bars[a].index[150]
+    # one request per ticker, in order; a's fails and isn't retried
+    mock = MockBackend(synthetic, fail_first=1)
+    store = store_over(mock, batch_size=1, workers=1, retries=0)
+    partial = store.load([a, b], start, mid)
+    assert partial['Adj Close'][a].isna().all()
+    # the next call retries a and merges it, so the kept frame without it is dropped
+    full = store.load([a, b], start, mid)
+    assert full is not partial
+    np.testing.assert_array_equal(full['Adj Close'][a].to_numpy(), synthetic.bars[a]['Adj Close'].iloc[:150])
+    assert store.load([a, b], start, mid) is full
+    # extending a's range merges again and drops every kept frame holding a
+    store.load([a], start, end)
+    fresh = store.load([a, b], start, mid)
+    assert fresh is not full
+    pd.testing.assert_frame_equal(fresh, full)
+
+
+def test_store_persists_and_fills_gaps_across_restarts(synthetic, tmp_path):
+    index = synthetic.bars[synthetic.tickers[0]].index
+    start, end = synthetic.span()
+    a, b = index[100], index[200]
+    tickers = synthetic.tickers[:3]
+    first = MockBackend(synthetic)
+    PriceStore(str(tmp_path), backend=first).load(tickers, a, b)
+    assert [call[1:3] for call in first.calls] == [(a, b)]
+
+    # a new store over the same directory maps the cached arrays instead of downloading
+    again = MockBackend(synthetic)
+    store = PriceStore(str(tmp_path), backend=again)
+    cached = store.load(tickers, a, b)
+    assert not again.calls
+    assert isinstance(store._read(tickers[0], '1d')['values'], np.memmap)
+    # widening the range only downloads the two missing ends, once for all tickers
+    full = store.load(tickers, start, end)
+    assert sorted(call[1:3] for call in again.calls) == [(start, a), (b, end)]
+    assert all(len(call[0]) == 3 for call in again.calls)
+    for t in tickers:
+        np.testing.assert_array_equal(full['Adj Close'][t].to_numpy(), synthetic.bars[t]['Adj Close'].to_numpy())
+    pd.testing.assert_frame_equal(full.loc[a:b].iloc[:-1], cached)
+    assert not PriceStore(str(tmp_path), backend=MockBackend(synthetic)).load(tickers, start, end).empty
+
+
+def test_missing_ranges():
+    d = pd.Timestamp
+    covered = [(d('2020-02-01'), d('2020-03-01')), (d('2020-04-01'), d('2020-05-01'))]
+    assert _missing_ranges(covered, d('2020-01-01'), d('2020-06-01')) == [
+        (d('2020-01-01'), d('2020-02-01')), (d('2020-03-01'), d('2020-04-01')), (d('2020-05-01'), d('2020-06-01'))]
+    assert _missing_ranges(covered, d('2020-02-10'), d('2020-02-20')) == []
+    assert _missing_ranges([], d('2020-01-01'), d('2020-01-02')) == [(d('2020-01-01'), d('2020-01-02'))]
+
+
+def test_csv_backend_wide_file_and_directory(tmp_path):
+    wide = CSVBackend('prices.csv')
+    prices = pd.read_csv('prices.csv', index_col=0, parse_dates=True)
+    ticker = prices.columns[0]
+    got = wide.download([ticker, 'NOPE'], pd.Timestamp('2021-01-01'), pd.Timestamp('2021-07-01'), '1d')
+    assert list(got) == [ticker]
+    expected = prices[ticker].loc['2021-01-01':'2021-06-30']
+    np.testing.assert_array_equal(got[ticker]['Adj Close'].to_numpy(), expected.to_numpy())
+    assert got[ticker]['Volume'].isna().all()
+
+    bars = SyntheticBackend(2, 50, seed=1).bars
+    for t, df in bars.items():
+        df.drop(columns='Adj Close').to_csv(tmp_path / f"{t}.csv")
+    folder = CSVBackend(str(tmp_path))
+    t = next(iter(bars))
+    got = folder.download([t], *SyntheticBackend(2, 50, seed=1).span(), '1d')[t]
+    assert list(got.columns) == FIELDS
+    # through CSV text, so to the last digit
+    np.testing.assert_allclose(got['Adj Close'].to_numpy(), bars[t]['Close'].to_numpy(), rtol=1e-15)
+    np.testing.assert_allclose(got['Volume'].to_numpy(), bars[t]['Volume'].to_numpy(), rtol=1e-15)
+
+
+def test_yfinance_failures_raise_and_stay_uncovered(synthetic, monkeypatch):
+    """yfinance logs failed tickers instead of raising; the backend turns them into errors."""
+    errors = {}
+
+    def download(tickers, start, end, **kwargs):
+        errors.clear()
+        frames = synthetic.download([t for t in tickers if t != 'BAD'], start, end, '1d')
+        errors.update({t: 'No data found' for t in tickers if t == 'BAD'})
+        return pd.concat(frames, axis=1).swaplevel(0, 1, axis=1)
+
+    monkeypatch.setitem(sys.modules, 'yfinance',
+                        types.SimpleNamespace(download=download, shared=types.SimpleNamespace(_ERRORS=errors)))
+    start, end = synthetic.span()
+    good = synthetic.tickers[:2]
+    assert sorted(YFinanceBackend().download(good, start, end, '1d')) == good
+    with pytest.raises(ConnectionError, match='BAD'):
+        YFinanceBackend().download(good + ['BAD'], start, end, '1d')
+    store = store_over(YFinanceBackend(), retries=1)
+    store.prefetch(['BAD'], start, end)
+    assert store._read('BAD', '1d') is None
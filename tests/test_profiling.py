@@ -0,0 +1,91 @@
+import json
+import time
+
+import numpy as np
+
+from profiling import Profiler
+
+
+def test_nested_stages_and_reentry():
+    prof = Profiler()
+    with prof.stage('backtest', rows=10):
+        with prof.stage('signal', rows=5):
+            time.sleep(0.01)
+        with prof.stage('backtest', rows=3):  # re-entered: rows count, the call doesn't
+            time.sleep(0.01)
+    with prof.stage('backtest'):
+        pass
+    prof.add_rows('backtest', 2)
+    bt, sig = prof.stats['backtest'], prof.stats['signal']
+    assert (bt['calls'], bt['rows']) == (2, 15)
+    assert (sig['calls'], sig['rows']) == (1, 5)
+    # the outer stage's time includes the inner ones
+    assert bt['seconds'] >= sig['seconds'] + 0.01
+
+
+def test_traced_peaks_are_per_stage():
+    prof = Profiler(trace_memory=True).start()
+    try:
+        with prof.stage('screen'):
+            with prof.stage('signal'):
+                big = np.ones(2 ** 21)  # 16 MB
+                del big
+            small = np.ones(2 ** 17)  # 1 MB
+            del small
+        with prof.stage('metrics'):
+            small = np.ones(2 ** 17)
+            del small
+    finally:
+        prof.stop()
+    stats = prof.stats
+    assert stats['signal']['peak_traced_mb'] >= 16
+    # the outer stage sees its inner stage's peak, a later stage doesn't
+    assert stats['screen']['peak_traced_mb'] >= stats['signal']['peak_traced_mb']
+    assert 1 <= stats['metrics']['peak_traced_mb'] < 8
+    # RSS is the process high-water mark, so it only ever grows
+    assert stats['metrics']['process_peak_rss_mb'] >= stats['screen']['process_peak_rss_mb'] > 0
+
+
+def test_merge_adds_counts_and_keeps_peaks():
+    prof, worker = Profiler(), Profiler()
+    with prof.stage('backtest', rows=4):
+        pass
+    with worker.stage('backtest', rows=6):
+        pass
+    worker.stats['backtest']['process_peak_rss_mb'] = 1e6
+    prof.merge(worker.stats)
+    bt = prof.stats['backtest']
+    assert (bt['calls'], bt['rows'], bt['process_peak_rss_mb']) == (2, 10, 1e6)
+
+
+def test_summary_format_and_write(tmp_path):
+    prof = Profiler().start()
+    with prof.stage('report', rows=1):
+        pass
+    with prof.stage('fetch', rows=1000):
+        time.sleep(0.01)
+    prof.stop()
+    summary = prof.summary()
+    assert list(summary['stages']) == ['fetch', 'report']  # pipeline order
+    fetch = summary['stages']['fetch']
+    assert fetch['rows_per_sec'] == fetch['rows'] / fetch['seconds']
+    assert summary['wall_seconds'] >= fetch['seconds'] and summary['hotspots'] == []
+    lines = prof.format().splitlines()
+    assert lines[0].split() == ['stage', 'calls', 'seconds', 'rows', 'rows/s', 'proc', 'MB']
+    assert lines[1].split()[:2] == ['fetch', '1'] and lines[1].split()[3] == '1,000'
+    assert lines[-1].startswith('wall time:')
+    path = tmp_path / 'profile.json'
+    prof.write(str(path))
+    written = json.loads(path.read_text())
+    assert written['stages']['fetch']['rows'] == 1000
+    assert set(written) == {'wall_seconds', 'stages', 'hotspots'}
+
+
+def test_cprofile_hotspots():
+    prof = Profiler(cprofile=True).start()
+    sum(i * i for i in range(100000))
+    prof.stop()
+    hot = prof.hotspots(limit=5)
+    assert 0 < len(hot) <= 5
+    assert hot == sorted(hot, key=lambda r: r['tottime'], reverse=True)
+    assert prof.format().splitlines()[-len(hot)].endswith(hot[0]['function'])
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from results_store import SCHEMA, ResultsStore
+
+
+def window_rows(rng, n, start='2021-01-04', searched=False):
+    rows = pd.DataFrame({
+        'start': pd.Timestamp(start),
+        'end': pd.Timestamp(start) + pd.Timedelta(days=365),
+        'lookback': rng.integers(5, 60, n),
+        'z_enter': rng.choice([1.0, 1.5, 2.0], n),
+        'z_exit': rng.choice([0.25, 0.5], n),
+        'max_holding': rng.integers(5, 40, n),
+        'total_return': rng.normal(0, 1, n),
+        'sharpe': rng.normal(0, 1, n),
+        'max_dd': -rng.random(n),
+    })
+    if searched:
+        rows['stop_loss'], rows['min_vol'] = rng.uniform(-0.1, -0.01, n), rng.uniform(0, 0.05, n)
+    return rows
+
+
+def assert_rows_equal(got, expected):
+    for name in expected:
+        if name == 'pair':
+            assert got[name].astype(str).tolist() == list(expected[name])
+        elif name in ('start', 'end'):
+            np.testing.assert_array_equal(got[name].to_numpy(), expected[name].to_numpy())
+        else:
+            np.testing.assert_array_equal(got[name].to_numpy(), expected[name].to_numpy().astype(SCHEMA[name]))
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    a, b = window_rows(rng, 50), window_rows(rng, 30, '2022-01-03', searched=True)
+    with ResultsStore(str(tmp_path), chunk_rows=40) as store:
+        store.append(('XOM', 'CVX'), a)
+        store.append('BP,SHEL', b)
+    reopened = ResultsStore(str(tmp_path))
+    assert len(reopened) == 80
+    expected = pd.concat([a.assign(pair='XOM,CVX'), b.assign(pair='BP,SHEL')], ignore_index=True)
+    frame = reopened.frame()
+    assert_rows_equal(frame, expected)
+    assert np.isnan(frame['stop_loss'][:50]).all()
+    assert_rows_equal(reopened.select('BP,SHEL'), b)
+    top = reopened.top(5, pair='XOM,CVX')
+    np.testing.assert_array_equal(top['total_return'],
+                                  np.sort(a['total_return'].to_numpy().astype('float32'))[::-1][:5])
+
+
+def test_torn_write_is_dropped(tmp_path):
+    rng = np.random.default_rng(1)
+    first = window_rows(rng, 20)
+    store = ResultsStore(str(tmp_path))
+    store.append('XOM,CVX', first)
+    store.flush()
+    # a run that dies after writing column data but before committing meta.json
+    for name, dtype in SCHEMA.items():
+        with open(os.path.join(str(tmp_path), f"{name}.bin"), 'ab') as f:
+            f.write(np.ones(7, dtype=dtype).tobytes())
+    reopened = ResultsStore(str(tmp_path))
+    assert len(reopened) == 20
+    assert_rows_equal(reopened.frame(), first)
+    second = window_rows(rng, 10, '2022-01-03')
+    reopened.append('XOM,CVX', second)
+    reopened.flush()
+    assert_rows_equal(ResultsStore(str(tmp_path)).frame(), pd.concat([first, second], ignore_index=True))
+    assert os.path.getsize(os.path.join(str(tmp_path), 'lookback.bin')) == 30 * np.dtype(SCHEMA['lookback']).itemsize
+
+
+def test_clear_only_removes_store_files(tmp_path):
+    (tmp_path / 'notes.txt').write_text('keep me')
+    store = ResultsStore(str(tmp_path))
+    store.append('XOM,CVX', window_rows(np.random.default_rng(2), 5))
+    store.flush()
+    store.clear()
+    assert len(store) == 0 and len(ResultsStore(str(tmp_path))) == 0
+    assert sorted(os.listdir(tmp_path)) == ['notes.txt']
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from rolling import RollingMoments, MomentsCache
+
+LOOKBACKS = [2, 5, 20, 63]
+
+
+def exact_std(values, lookback):
+    """Two-pass sample std of every full window."""
+    out = np.full(len(values), np.nan)
+    out[lookback - 1:] = sliding_window_view(values, lookback).std(axis=1, ddof=1)
+    return out
+
+
+def assert_std_close(got, ref, values):
+    """
+    Compare as variances: running sums (here and in pandas) are exact to about
+    1e-12 of the squared price level, which the square root inflates for
+    windows of (nearly) equal prices.
+    """
+    np.testing.assert_allclose(got ** 2, ref ** 2, rtol=1e-7, atol=1e-12 * np.abs(values).max() ** 2, equal_nan=True)
+
+
+@pytest.mark.parametrize('data', ['csv_prices', 'synthetic_pair'])
+def test_rolling_moments_match_pandas(request, data):
+    prices = request.getfixturevalue(data)
+    rm = RollingMoments(prices.to_numpy(), LOOKBACKS)
+    for lb in LOOKBACKS:
+        for col in range(2):
+            rolling = prices.iloc[:, col].rolling(lb)
+            np.testing.assert_allclose(rm.mean(lb, col), rolling.mean().to_numpy(), rtol=1e-10, equal_nan=True)
+            values = prices.iloc[:, col].to_numpy()
+            assert_std_close(rm.std(lb, col), rolling.std().to_numpy(), values)
+            assert_std_close(rm.std(lb, col), exact_std(values, lb), values)
+
+
+def test_rolling_moments_large_offset():
+    # small moves on a large level: running sums must not cancel
+    rng = np.random.default_rng(0)
+    values = 1e6 + np.cumsum(rng.normal(0, 0.01, 5000))
+    rm = RollingMoments(values, [30])
+    assert_std_close(rm.std(30), pd.Series(values).rolling(30).std().to_numpy(), values)
+    np.testing.assert_allclose(rm.std(30), exact_std(values, 30), rtol=1e-7, equal_nan=True)
+
+
+def test_spread_and_window_slices(csv_prices):
+    rm = RollingMoments(csv_prices.to_numpy(), LOOKBACKS)
+    beta = 1.7
+    start, stop = 250, 700
+    spread = (csv_prices.iloc[:, 0] - beta * csv_prices.iloc[:, 1]).iloc[start:stop]
+    for lb in LOOKBACKS:
+        mu, sigma = rm.spread(beta, lb, start, stop)
+        # a window's moments are as if computed from its own rows only
+        np.testing.assert_allclose(mu, spread.rolling(lb).mean().to_numpy(), rtol=1e-10, equal_nan=True)
+        assert_std_close(sigma, spread.rolling(lb).std().to_numpy(), csv_prices.to_numpy())
+        assert_std_close(sigma, exact_std(spread.to_numpy(), lb), csv_prices.to_numpy())
+
+
+def test_moments_cache_invalidates_on_new_history(csv_prices):
+    cache = MomentsCache(max_entries=4)
+    values = csv_prices.to_numpy()
+    cache.register('pair', values, [20])
+    first = cache.spread('pair', 1.5, 20, 0, 100)
+    changed = values.copy()
+    changed[50:] *= 1.01
+    cache.register('pair', changed, [20])
+    second = cache.spread('pair', 1.5, 20, 0, 100)
+    assert not np.allclose(first[0][60:], second[0][60:])
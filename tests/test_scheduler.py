@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+import yaml
+
+import price_store
+from bench import SyntheticBackend
+from main import test_timeframes as serial_timeframes
+from scheduler import run_walk_forward
+from sweep import walk_forward_windows
+
+
+@pytest.fixture(scope='module')
+def setup():
+    backend = SyntheticBackend(4, 800, 'B', seed=5)
+    with open('config.yml') as f:
+        cfg = yaml.safe_load(f)
+    start, end = (d.strftime('%Y-%m-%d') for d in backend.span())
+    t = backend.tickers
+    return backend, cfg, start, end, [(t[1], t[0]), (t[2], t[3])]
+
+
+@pytest.fixture(autouse=True)
+def store(setup, monkeypatch):
+    monkeypatch.setattr(price_store, '_default_store', setup[0].store())
+
+
+def run(setup, workers):
+    _, cfg, start, end, pairs = setup
+    seen = []
+    results = run_walk_forward(pairs, start, end, '1d', cfg, workers=workers,
+                               on_result=lambda pair, rows: seen.append((pair, rows['start'].iloc[0])))
+    return results, seen
+
+
+def test_pool_matches_serial_timeframes(setup):
+    _, cfg, start, end, pairs = setup
+    one, seen_one = run(setup, 1)
+    two, seen_two = run(setup, 2)
+    pd.testing.assert_frame_equal(one, two)
+    assert seen_one == seen_two
+    for t1, t2 in pairs:
+        # test_timeframes is the original per-pair loop (columns in fetch_prices order)
+        ref = serial_timeframes(sorted([t1, t2]), start, end, '1d', cfg)
+        got = one[one['pair'] == f"{t1},{t2}"].drop(columns='pair')
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), ref.reset_index(drop=True))
+
+
+def test_on_result_in_task_order(setup):
+    _, _, start, end, pairs = setup
+    _, seen = run(setup, 2)
+    starts = [w_start for w_start, _ in walk_forward_windows(start, end)]
+    expected = [(pair, w) for pair in pairs for w in starts]
+    assert [(pair, pd.Timestamp(w)) for pair, w in seen] == expected
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import price_store
+from bench import SyntheticBackend
+from search import SEARCH_COLUMNS, run_search
+
+
+@pytest.fixture
+def synthetic(monkeypatch):
+    backend = SyntheticBackend(4, 1500, 'B', seed=3)
+    monkeypatch.setattr(price_store, '_default_store', backend.store())
+    return backend
+
+
+@pytest.fixture
+def cfg():
+    with open('config.yml') as f:
+        cfg = yaml.safe_load(f)
+    cfg['search'].update(method='halving', samples=60)
+    return cfg
+
+
+def search(backend, cfg, workers):
+    start, end = (d.strftime('%Y-%m-%d') for d in backend.span())
+    t = backend.tickers
+    rungs = {}
+    results = run_search([(t[0], t[1]), (t[2], t[3])], start, end, '1d', cfg, report=rungs, workers=workers)
+    return results, rungs
+
+
+def test_winner_comes_first(synthetic, cfg):
+    results, rungs = search(synthetic, cfg, workers=1)
+    select = cfg['search']['select']
+    for label, log in rungs.items():
+        rows = results[results['pair'] == label]
+        winner, last = rows.iloc[0], log.iloc[-1]
+        assert winner['rank'] == 0
+        assert all(winner[c] == last[c] for c in SEARCH_COLUMNS)
+        np.testing.assert_allclose(winner['mean_score'], last[f"mean_{select}"], rtol=1e-12)
+        # mean_score is the set's mean over the windows it was scored on
+        same = (rows[SEARCH_COLUMNS] == winner[SEARCH_COLUMNS]).all(axis=1)
+        np.testing.assert_allclose(rows.loc[same, select].mean(), winner['mean_score'], rtol=1e-12)
+        assert rows['rank'].is_monotonic_increasing
+    assert results.iloc[0]['mean_score'] == results[results['rank'] == 0]['mean_score'].max()
+
+
+def test_pool_gives_the_same_rows(synthetic, cfg):
+    serial, serial_rungs = search(synthetic, cfg, workers=1)
+    pooled, pooled_rungs = search(synthetic, cfg, workers=2)
+    pd.testing.assert_frame_equal(serial, pooled)
+    for label in serial_rungs:
+        pd.testing.assert_frame_equal(serial_rungs[label].drop(columns='seconds'),
+                                      pooled_rungs[label].drop(columns='seconds'))
@@ -0,0 +1,44 @@
+import time
+
+from stats_cache import StatsCache
+
+
+def used(cache, key):
+    return cache._db.execute('SELECT used FROM stats WHERE key = ?', (key,)).fetchone()[0]
+
+
+def test_hits_are_written_once_on_flush(tmp_path):
+    cache = StatsCache(str(tmp_path / 'stats.sqlite'))
+    cache.put_many([('a', 1.0), ('b', [2.0, float('nan')])])
+    before = used(cache, 'a')
+    time.sleep(0.01)
+    assert cache.get_many(['a', 'c']) == [1.0, None]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert used(cache, 'a') == before  # nothing written per hit
+    cache.flush()
+    assert used(cache, 'a') > before
+    cache.close()
+    reopened = StatsCache(str(tmp_path / 'stats.sqlite'))
+    assert reopened.get('b')[0] == 2.0 and len(reopened) == 2
+
+
+def test_eviction_sees_pending_hits():
+    cache = StatsCache(None, max_entries=2)
+    cache.put('old', 1)
+    time.sleep(0.01)
+    cache.put('new', 2)
+    time.sleep(0.01)
+    cache.get('old')  # unflushed hit: 'new' is now the least recently used
+    cache.put('newest', 3)
+    assert cache.get_many(['old', 'new', 'newest']) == [1, None, 3]
+
+
+def test_entries_from_an_older_stats_version_are_not_served(monkeypatch):
+    import stats_cache
+    cache = StatsCache(None)
+    monkeypatch.setattr(stats_cache, 'STATS_VERSION', stats_cache.STATS_VERSION - 1)
+    stale = StatsCache.key('coint', ('a', 'b'))
+    cache.put(stale, 0.5)
+    monkeypatch.undo()
+    assert StatsCache.key('coint', ('a', 'b')) != stale
+    assert cache.get(StatsCache.key('coint', ('a', 'b'))) is None
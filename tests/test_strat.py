@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_signals
+from strat import build_position, generate_signals, rolling_hedge_ratio
+
+
+def loop_position(long, short, exit, max_holding=None):
+    """The row-by-row holding and position loops `build_position` replaced."""
+    exit = list(exit)
+    if max_holding is not None:
+        hold_days = 0
+        for i in range(len(long)):
+            if long[i] == 1 or short[i] == 1:
+                hold_days = 1
+            elif hold_days > 0:
+                hold_days += 1
+                if hold_days > max_holding:
+                    exit[i] = 1
+                    hold_days = 0
+            else:
+                hold_days = 0
+    pos, current = [], 0
+    for i in range(len(long)):
+        if long[i]:
+            current = 1
+        elif short[i]:
+            current = -1
+        elif exit[i]:
+            current = 0
+        pos.append(current)
+    return np.array(pos)
+
+
+@pytest.mark.parametrize('max_holding', [None, 0, 1, 5, 20])
+def test_build_position_matches_loop(max_holding):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        long, short, exit = random_signals(rng, 300)
+        got = build_position(long, short, exit, max_holding)
+        np.testing.assert_array_equal(got, loop_position(long, short, exit, max_holding))
+
+
+def test_build_position_batch_columns():
+    rng = np.random.default_rng(1)
+    long, short, exit = random_signals(rng, 400, cols=6)
+    max_holding = np.array([1, 3, 5, 10, 20, 50])
+    got = build_position(long, short, exit, max_holding)
+    for k in range(6):
+        np.testing.assert_array_equal(got[:, k], loop_position(long[:, k], short[:, k], exit[:, k], max_holding[k]))
+
+
+def test_build_position_on_signals(csv_prices):
+    signals, _ = generate_signals(csv_prices, lookback=20, z_enter=2.0, z_exit=0.5)
+    got = build_position(signals['long'], signals['short'], signals['exit'], 10)
+    assert isinstance(got, pd.Series) and got.index.equals(signals.index)
+    np.testing.assert_array_equal(got.to_numpy(), loop_position(signals['long'].to_numpy(), signals['short'].to_numpy(),
+                                                               signals['exit'].to_numpy(), 10))
+
+
+def lstsq_beta(y, x, window):
+    """β of y ~ x (no intercept) fitted separately on every window."""
+    out = np.full(len(y), np.nan)
+    for t in range(window - 1, len(y)):
+        ys, xs = y[t - window + 1:t + 1], x[t - window + 1:t + 1]
+        if not (np.isnan(ys).any() or np.isnan(xs).any()):
+            out[t] = np.linalg.lstsq(xs[:, None], ys, rcond=None)[0][0]
+    return out
+
+
+@pytest.mark.parametrize('window', [2, 20, 60])
+def test_rolling_hedge_ratio_matches_lstsq(synthetic_pair, window):
+    y, x = synthetic_pair.iloc[:, 0].to_numpy(), synthetic_pair.iloc[:, 1].to_numpy()
+    beta = rolling_hedge_ratio(synthetic_pair.iloc[:, 0], synthetic_pair.iloc[:, 1], window)
+    assert beta.index.equals(synthetic_pair.index)
+    np.testing.assert_allclose(beta.to_numpy(), lstsq_beta(y, x, window), rtol=1e-10, equal_nan=True)
+
+
+def test_rolling_hedge_ratio_recovers_after_nan(csv_prices):
+    y, x = csv_prices.iloc[:, 0].to_numpy().copy(), csv_prices.iloc[:, 1].to_numpy().copy()
+    y[100] = np.nan
+    x[700] = np.nan
+    beta = rolling_hedge_ratio(np.column_stack([y, y]), np.column_stack([x, x]), 30)
+    ref = lstsq_beta(y, x, 30)
+    assert np.isnan(ref[100:130]).all() and not np.isnan(ref[130:700]).any()
+    for k in range(2):
+        np.testing.assert_allclose(beta[:, k], ref, rtol=1e-10, equal_nan=True)
+
+
+def test_rolling_hedge_ratio_long_history():
+    # minute-bar length history: no drift from long running sums
+    rng = np.random.default_rng(2)
+    n = 300_000
+    x = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    y = 1.3 * x + rng.normal(0, 0.05, n)
+    beta = rolling_hedge_ratio(y, x, 60)
+    for t in (59, n // 2, n - 1):
+        ref = np.linalg.lstsq(x[t - 59:t + 1, None], y[t - 59:t + 1], rcond=None)[0][0]
+        assert beta[t] == pytest.approx(ref, rel=1e-10)
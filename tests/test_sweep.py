@@ -0,0 +1,135 @@
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import price_store
+import sweep
+from backtest import run_backtest
+from bench import SyntheticBackend
+from data_fetch import fetch_prices
+from performance import sharpe, max_drawdown
+from strat import generate_signals, build_position
+from sweep import DEFAULT_GRID, GRID_COLUMNS, METRIC_COLUMNS, evaluate_grid, walk_forward_oos, window_moments
+
+
+def single_run(prices, lb, ze, zx, mh, min_vol, tc, stop_loss):
+    """One parameter set the way the per-combination sweep loop ran it."""
+    signals, beta = generate_signals(prices, lookback=lb, z_enter=ze, z_exit=zx)
+    spread = prices.iloc[:, 0] - beta * prices.iloc[:, 1]
+    vol = spread.rolling(lb).std().fillna(0.0001).replace(0, 0.0001)
+    signals.loc[vol < min_vol, ['long', 'short', 'exit']] = 0
+    position = build_position(signals['long'], signals['short'], signals['exit'], mh)
+    returns, cum_returns, _ = run_backtest(prices, position, beta, tc=tc, stop_loss=stop_loss)
+    return {'lookback': lb, 'z_enter': ze, 'z_exit': zx, 'max_holding': mh, 'total_return': cum_returns.iloc[-1],
+            'sharpe': sharpe(returns), 'max_dd': max_drawdown(cum_returns)}
+
+
+def reference(prices, grid, min_vol, tc, stop_loss):
+    rows = [single_run(prices, *combo, min_vol, tc, stop_loss)
+            for combo in product(grid['lookback'], grid['z_enter'], grid['z_exit'], grid['max_holding'])]
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize('min_vol', [0.0, 0.8])
+@pytest.mark.parametrize('data', ['csv_prices', 'synthetic_pair'])
+def test_evaluate_grid_matches_single_runs(request, data, min_vol):
+    prices = request.getfixturevalue(data).iloc[:400]
+    g = DEFAULT_GRID
+    got = evaluate_grid(prices, g['lookback'], g['z_enter'], g['z_exit'], g['max_holding'],
+                        min_vol=min_vol, tc=0.001, stop_loss=-0.05)
+    ref = reference(prices, g, min_vol, 0.001, -0.05)
+    pd.testing.assert_frame_equal(got[GRID_COLUMNS], ref[GRID_COLUMNS], check_dtype=False)
+    np.testing.assert_allclose(got[METRIC_COLUMNS].to_numpy(dtype=float), ref[METRIC_COLUMNS].to_numpy(dtype=float),
+                               rtol=1e-7, atol=1e-9)
+
+
+def test_evaluate_grid_with_window_moments(csv_prices):
+    # moments sliced from the full history give the same rows as a fresh pass over the window
+    g = DEFAULT_GRID
+    window = csv_prices.iloc[300:560]
+    moments = window_moments(('TEST', 'PAIR'), csv_prices, window, g['lookback'])
+    assert moments is not None
+    args = (window, g['lookback'], g['z_enter'], g['z_exit'], g['max_holding'])
+    got = evaluate_grid(*args, min_vol=0.3, moments=moments)
+    ref = evaluate_grid(*args, min_vol=0.3)
+    np.testing.assert_allclose(got[METRIC_COLUMNS].to_numpy(dtype=float), ref[METRIC_COLUMNS].to_numpy(dtype=float),
+                               rtol=1e-7, atol=1e-9)
+
+
+def test_evaluate_grid_keep_mask(synthetic_pair):
+    g = DEFAULT_GRID
+    args = (synthetic_pair.iloc[:300], g['lookback'], g['z_enter'], g['z_exit'], g['max_holding'])
+    full = evaluate_grid(*args)
+    keep = np.random.default_rng(0).random(len(full)) < 0.3
+    part = evaluate_grid(*args, keep=keep)
+    pd.testing.assert_frame_equal(part, full[keep].reset_index(drop=True))
+
+
+@pytest.fixture
+def cfg():
+    with open('config.yml') as f:
+        return yaml.safe_load(f)
+
+
+def test_oos_segments_tile_without_look_ahead(synthetic_pair, cfg):
+    prices = synthetic_pair.iloc[:800]
+    oos, picks = walk_forward_oos(prices, cfg, test_days=45)
+    # each segment starts where the previous one ended and holds only its own bars
+    assert (picks['train_end'].iloc[1:].to_numpy() == picks['test_end'].iloc[:-1].to_numpy()).all()
+    assert oos.index.is_monotonic_increasing and oos.index.is_unique
+    first = oos.index >= picks['train_end'].iloc[0]
+    assert first.all() and (oos.index < picks['test_end'].iloc[-1]).all()
+    expected = prices.index[(prices.index >= picks['train_end'].iloc[0]) & (prices.index < picks['test_end'].iloc[-1])]
+    assert oos.index.equals(expected)
+    # rewriting the future changes nothing that was decided before it
+    cut = picks['test_end'].iloc[len(picks) // 2]
+    noise = np.random.default_rng(0).uniform(0.8, 1.2, size=prices.shape)
+    changed = prices * np.where((prices.index >= cut)[:, None], noise, 1.0)
+    oos2, picks2 = walk_forward_oos(changed, cfg, test_days=45)
+    before = picks['test_end'] <= cut
+    pd.testing.assert_frame_equal(picks2[before], picks[before])
+    pd.testing.assert_frame_equal(oos2[oos2.index < cut], oos[oos.index < cut])
+
+
+@pytest.mark.filterwarnings('ignore:The default fill_method:FutureWarning')
+def test_sweep_rows_pick_like_the_standalone_grid(cfg, monkeypatch):
+    from main import test_timeframes as sweep_rows
+    backend = SyntheticBackend(2, 900, 'B', seed=4)
+    monkeypatch.setattr(price_store, '_default_store', backend.store())
+    start, end = (d.strftime('%Y-%m-%d') for d in backend.span())
+    tickers = sorted(backend.tickers)
+    prices = fetch_prices(tickers, start, end)
+    rows = sweep_rows(tickers, start, end, '1d', cfg)
+    for select in ('sharpe', 'total_return'):
+        standalone = walk_forward_oos(prices, cfg, select=select, start=start, end=end)
+        reused = walk_forward_oos(prices, cfg, select=select, train_results=rows, start=start, end=end)
+        # row order doesn't matter: ties go to the same set either way
+        shuffled = walk_forward_oos(prices, cfg, select=select, train_results=rows.sample(frac=1, random_state=0),
+                                    start=start, end=end)
+        for oos, picks in (reused, shuffled):
+            cols = GRID_COLUMNS + [f"train_{select}", 'oos_total_return']
+            pd.testing.assert_frame_equal(picks[cols], standalone[1][cols], check_dtype=False)
+            pd.testing.assert_frame_equal(oos, standalone[0])
+
+
+def test_pruning_never_empties_the_grid(synthetic_pair, cfg, monkeypatch):
+    evaluate, calls = sweep.evaluate_grid, []
+
+    def unscored_third_window(*args, keep=None, **kwargs):
+        calls.append(keep.sum())
+        scores = evaluate(*args, keep=keep, **kwargs)
+        if len(calls) == 3:
+            scores['sharpe'] = np.nan
+        return scores
+    monkeypatch.setattr(sweep, 'evaluate_grid', unscored_third_window)
+    _, picks = walk_forward_oos(synthetic_pair.iloc[:900], cfg, prune_after=1, prune_quantile=1.0)
+    n_sets = len(DEFAULT_GRID['lookback']) * len(DEFAULT_GRID['z_enter']) * len(DEFAULT_GRID['z_exit']) \
+        * len(DEFAULT_GRID['max_holding'])
+    assert calls[0] == n_sets and min(calls) >= 1
+    # a window without scores hands on the sets it was given
+    assert calls[3] == calls[2]
+    assert picks['evaluated'].min() >= 1
+
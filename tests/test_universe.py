@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import scheduler
+from conftest import ragged_backend
+from data_fetch import fetch_prices
+from sweep import _moments_cache
+from universe import Universe
+
+
+@pytest.mark.filterwarnings('ignore:The default fill_method:FutureWarning')  # fetch_prices' pct_change
+@pytest.mark.parametrize('freq, interval, tz', [('B', '1d', None), ('1min', '1m', 'Asia/Tokyo')])
+def test_pair_frame_matches_fetch_prices(freq, interval, tz):
+    backend = ragged_backend(freq, tz)
+    store = backend.store()
+    start, end = backend.span()
+    uni = Universe.from_store(backend.tickers, start, end, interval, store=store, complete=False)
+    middle = (start + (end - start) / 3, start + (end - start) / 2)
+    for k, y in enumerate(backend.tickers):
+        for x in backend.tickers[k + 1:]:
+            for min_vol in (100000, 2e6):
+                for s, e in ((start, end), middle):
+                    ref = fetch_prices([y, x], s, e, interval, min_vol=min_vol, store=store)
+                    got = uni.pair_frame(y, x, s, e, min_vol)
+                    assert got.index.equals(ref.index)
+                    np.testing.assert_array_equal(got.to_numpy(), ref.to_numpy())
+
+
+def test_share_attach_and_files(tmp_path):
+    backend = ragged_backend('B')
+    start, end = backend.span()
+    uni = Universe.from_store(backend.tickers, start, end, store=backend.store(), complete=False)
+    desc = uni.share()
+    try:
+        other = Universe.attach(desc)
+        np.testing.assert_array_equal(other.prices, uni.prices)
+        np.testing.assert_array_equal(other.volume, uni.volume)
+        assert other.dates.equals(uni.dates) and other.prices.flags.f_contiguous
+    finally:
+        uni.close()
+    uni.save(str(tmp_path))
+    mapped = Universe.open(str(tmp_path))
+    np.testing.assert_array_equal(mapped.prices, uni.prices)
+    assert mapped.tickers == uni.tickers
+    pd.testing.assert_frame_equal(mapped.pair_frame('SYN000', 'SYN001'), uni.pair_frame('SYN000', 'SYN001'))
+    # pairs and windows are views, not copies
+    _, y, _ = uni.pair('SYN000', 'SYN001', start + pd.Timedelta(days=30))
+    assert np.shares_memory(y, uni.prices)
+
+
+def test_worker_history_keeps_only_the_latest_block():
+    backend = ragged_backend('B')
+    start, end = backend.span()
+    uni = Universe.from_store(backend.tickers, start, end, store=backend.store(), complete=False)
+    pair = ('SYN000', 'SYN001')
+    window = (start + pd.Timedelta(days=200), start + pd.Timedelta(days=565))
+    first = uni.share()
+    try:
+        assert scheduler._window_inputs(first, pair, *window, [20]) is not None
+        assert (first['name'], pair) in scheduler._history
+        # a worker picking up a task from a later run drops the earlier block's state
+        second = Universe.from_store(backend.tickers, start, end, store=backend.store(), complete=False)
+        desc = second.share()
+        scheduler._window_inputs(desc, pair, *window, [20])
+        assert [k[0] for k in scheduler._history] == [desc['name']]
+        assert (first['name'], pair) not in _moments_cache._pairs
+        scheduler.release(second, desc)
+        assert not scheduler._history
+    finally:
+        uni.close()
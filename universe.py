@@ -0,0 +1,230 @@
+import json
+import os
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from price_store import default_store
+from profiling import profiled
+
+
+class Universe:
+    """
+    A universe of tickers as two aligned (dates, tickers) matrices, Adj Close and
+    Volume, stored column-major so each ticker's history is one contiguous run:
+      - `index`: int64 nanosecond timestamps (UTC for tz-aware data); `tz` the zone
+      - `tickers`, and `columns` mapping ticker -> column
+    Tickers, pairs and date ranges are views of the same buffers, never copies.
+    The matrices live in memory, in a shared memory block (`share` / `attach`,
+    for worker processes) or in memory-mapped .npy files (`save` / `open`).
+    """
+
+    def __init__(self, index, prices, volume=None, tickers=(), tz=None):
+        self.index = index
+        self.prices = prices
+        self.volume = volume
+        self.tickers = list(tickers)
+        self.columns = {t: k for k, t in enumerate(self.tickers)}
+        self.tz = tz
+        self._shm = None
+
+    @classmethod
+    def from_frame(cls, prices, volume=None, dtype='float64'):
+        """Universe over a close-price DataFrame (and optional matching volume frame)."""
+        index = prices.index
+        tz = str(index.tz) if getattr(index, 'tz', None) is not None else None
+        if tz:
+            index = index.tz_convert('UTC').tz_localize(None)
+        values = np.asfortranarray(prices.to_numpy(dtype=dtype))
+        if volume is not None:
+            volume = np.asfortranarray(volume.reindex(columns=prices.columns).to_numpy(dtype=dtype))
+        return cls(np.asarray(index.asi8), values, volume, prices.columns, tz)
+
+    @classmethod
+    def from_store(cls, tickers, start, end, interval='1d', store=None, complete=True, dtype='float64'):
+        """
+        Bars for `tickers` in [start, end) from the price store, in one load.
+        With `complete`, tickers with any missing close are dropped (like `fetch_universe`).
+        """
+        store = store if store is not None else default_store()
+        data = store.load(tickers, start, end, interval)
+        close = data['Adj Close'].dropna(axis=1) if complete else data['Adj Close']
+        return cls.from_frame(close, data['Volume'], dtype)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def empty(self):
+        """True without dates or tickers, like `DataFrame.empty`."""
+        return not (len(self.index) and self.tickers)
+
+    @property
+    def dates(self):
+        """`index` as a DatetimeIndex in the universe's timezone."""
+        idx = pd.DatetimeIndex(self.index, name='Date')
+        return idx.tz_localize('UTC').tz_convert(self.tz) if self.tz else idx
+
+    def rows(self, start=None, end=None):
+        """Row slice covering [start, end)."""
+        bounds = []
+        for t, default in ((start, 0), (end, len(self.index))):
+            if t is None:
+                bounds.append(default)
+                continue
+            t = pd.Timestamp(t)
+            if self.tz:
+                t = (t.tz_localize(self.tz) if t.tz is None else t).tz_convert('UTC').tz_localize(None)
+            bounds.append(int(np.searchsorted(self.index, t.value, side='left')))
+        return slice(*bounds)
+
+    def window(self, start=None, end=None):
+        """The universe over [start, end), as views of the same matrices."""
+        r = self.rows(start, end)
+        volume = self.volume[r] if self.volume is not None else None
+        return Universe(self.index[r], self.prices[r], volume, self.tickers, self.tz)
+
+    def series(self, ticker, start=None, end=None):
+        """Closes of one ticker over [start, end): a contiguous view."""
+        return self.prices[self.rows(start, end), self.columns[ticker]]
+
+    def pair(self, y, x, start=None, end=None):
+        """(index, y closes, x closes) over [start, end), all views."""
+        r = self.rows(start, end)
+        return self.index[r], self.prices[r, self.columns[y]], self.prices[r, self.columns[x]]
+
+    def pair_prices(self, y, x, start=None, end=None, min_vol=100000):
+        """
+        Cleaned (index, y, x) arrays for a pair over [start, end): the same bars
+        `fetch_prices([y, x], start, end)` returns, low-volume days and >50% moves
+        dropped, computed on the matrix rows instead of a per-pair download.
+        """
+        r = self.rows(start, end)
+        cols = [self.columns[y], self.columns[x]]
+        prices = self.prices[r][:, cols]
+        vol = self.volume[r][:, cols] if self.volume is not None else np.full(prices.shape, np.nan)
+        index = self.index[r]
+        # rows where neither leg has a bar only exist because of other tickers
+        present = ~(np.isnan(prices).all(axis=1) & np.isnan(vol).all(axis=1))
+        prices, vol, index = prices[present], vol[present], index[present]
+        if not np.isnan(vol).all():
+            keep = (vol >= min_vol).all(axis=1)
+            prices, index = prices[keep], index[keep]
+        # pct_change pads gaps with the last close before taking returns
+        last = np.where(np.isnan(prices), 0, np.arange(len(prices))[:, None])
+        filled = np.take_along_axis(prices, np.maximum.accumulate(last, axis=0), axis=0)
+        returns = np.full(prices.shape, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = filled[1:] / filled[:-1] - 1
+        keep = (np.abs(returns) < 0.5).all(axis=1) & ~np.isnan(prices).any(axis=1)
+        return index[keep], prices[keep, 0], prices[keep, 1]
+
+    def pair_frame(self, y, x, start=None, end=None, min_vol=100000):
+        """`pair_prices` as the two-column DataFrame `fetch_prices` would return."""
+        index, py, px = self.pair_prices(y, x, start, end, min_vol)
+        idx = pd.DatetimeIndex(index, name='Date')
+        if self.tz:
+            idx = idx.tz_localize('UTC').tz_convert(self.tz)
+        return pd.DataFrame({y: py, x: px}, index=idx)
+
+    def frame(self, volume=False):
+        """Closes (or volumes) as a DataFrame over the matrix, without copying it."""
+        values = self.volume if volume else self.prices
+        return pd.DataFrame(values, index=self.dates, columns=self.tickers, copy=False)
+
+    # -- sharing -----------------------------------------------------------
+
+    def share(self):
+        """
+        Copy the matrices into one shared memory block (int64 index, then the
+        price and volume matrices, column-major) and return its descriptor;
+        `Universe.attach(descriptor)` maps it in another process. Call `close()` when done.
+        """
+        n, k = self.prices.shape
+        dtype = self.prices.dtype
+        size = n * 8 + n * k * dtype.itemsize * (2 if self.volume is not None else 1)
+        self._shm = shm = SharedMemory(create=True, size=max(size, 1))
+        desc = {'name': shm.name, 'rows': n, 'tickers': self.tickers, 'tz': self.tz,
+                'dtype': dtype.str, 'volume': self.volume is not None}
+        index, prices, volume = _layout(shm, desc)
+        index[:] = self.index
+        prices[:] = self.prices
+        if volume is not None:
+            volume[:] = self.volume
+        return desc
+
+    @classmethod
+    def attach(cls, desc):
+        """Universe over a block made by `share`, mapped once per process."""
+        shm = _attached.get(desc['name'])
+        if shm is None:
+            shm = _attached[desc['name']] = SharedMemory(name=desc['name'])
+        return cls(*_layout(shm, desc), desc['tickers'], desc['tz'])
+
+    def close(self):
+        """Release the shared memory block made by `share`."""
+        if self._shm is not None:
+            attached = _attached.pop(self._shm.name, None)
+            if attached is not None:
+                attached.close()
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    # -- files -------------------------------------------------------------
+
+    def save(self, path):
+        """Write the matrices as .npy files under `path` (see `open`)."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'index.npy'), self.index)
+        np.save(os.path.join(path, 'prices.npy'), self.prices)
+        if self.volume is not None:
+            np.save(os.path.join(path, 'volume.npy'), self.volume)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'tickers': self.tickers, 'tz': self.tz}, f)
+
+    @classmethod
+    def open(cls, path):
+        """Universe memory-mapped read-only from a directory written by `save`."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        volume = os.path.join(path, 'volume.npy')
+        return cls(np.load(os.path.join(path, 'index.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, 'prices.npy'), mmap_mode='r'),
+                   np.load(volume, mmap_mode='r') if os.path.exists(volume) else None,
+                   meta['tickers'], meta['tz'])
+
+
+# Shared memory blocks already attached by this process
+_attached = {}
+
+
+def _layout(shm, desc):
+    n, k = desc['rows'], len(desc['tickers'])
+    dtype = np.dtype(desc['dtype'])
+    index = np.ndarray((n,), dtype='int64', buffer=shm.buf)
+    prices = np.ndarray((n, k), dtype=dtype, buffer=shm.buf, offset=n * 8, order='F')
+    volume = None
+    if desc['volume']:
+        volume = np.ndarray((n, k), dtype=dtype, buffer=shm.buf, offset=n * 8 + n * k * dtype.itemsize, order='F')
+    return index, prices, volume
+
+
+@profiled('fetch', rows=len)
+def load_universe(tickers, start, end, interval='1d', store=None, complete=True):
+    """`Universe.from_store`, profiled as a fetch."""
+    return Universe.from_store(tickers, start, end, interval, store, complete)
+
+
+if __name__ == '__main__':
+    import yaml
+    from price_store import PriceStore, set_default_store
+
+    cfg = yaml.safe_load(open('config.yml'))
+    set_default_store(PriceStore.from_config(cfg))
+    uni = load_universe(cfg['tickers']['universe'], cfg['data']['start'], cfg['data']['end'])
+    print(f"{len(uni)} dates x {len(uni.tickers)} tickers, {uni.prices.nbytes / 2 ** 20:.2f} MB of closes")
+    y, x = sorted(cfg['tickers']['pair'])
+    if y in uni.columns and x in uni.columns:
+        print(uni.pair_frame(y, x).tail())